@@ -1,4 +1,15 @@
 #!/bin/bash
 script_dir=$(dirname "$(readlink -f "$0")")
 export PYTHONPATH=$script_dir/../lib:$PATH:$PYTHONPATH
+# hand the job to the job runner if one is listening (see
+# scripts/start_job_runner.sh); run it here only if the runner did not start
+# it (exit code 75)
+runner_socket=${JOB_RUNNER_SOCKET:-$script_dir/../work/job-runner.sock}
+if [ -S "$runner_socket" ]; then
+    python -u $script_dir/../lib/landContigFilter/jobrunner.py "$runner_socket" $1 $2 $3
+    exit_code=$?
+    if [ $exit_code -ne 75 ]; then
+        exit $exit_code
+    fi
+fi
 python -u $script_dir/../lib/landContigFilter/landContigFilterServer.py $1 $2 $3
@@ -45,18 +45,52 @@ module landContigFilter {
     } FilterContigsMaxParams;
 
 
+    /*
+        assembly_input_refs - a list of Assembly or AssemblySet references
+            to report on together with assembly_input_ref. All of them are
+            fetched with a single batched get_objects call.
+
+        @optional assembly_input_ref assembly_input_refs
+    */
     typedef structure {
         assembly_ref assembly_input_ref;
+        list<assembly_ref> assembly_input_refs;
         string workspace_name;
         boolean showContigs;
     } AssemblyMetadataReportParams;
 
+    /*
+        The wall time of one step of a method call, in seconds.
+    */
+    typedef structure {
+        string stage;
+        float seconds;
+    } StageTime;
+
+    /*
+        Where the time of a method call went.
+        stages - the steps of the call in the order they ran: validate,
+            download, filter, write, save and report. A call that reused the
+            new Assembly of an identical call in progress has a wait stage in
+            place of download to save.
+        total_seconds - the wall time of the whole call.
+        peak_rss_kb - the peak resident set size of the service process, in
+            kilobytes.
+    */
+    typedef structure {
+        list<StageTime> stages;
+        float total_seconds;
+        int peak_rss_kb;
+    } Timings;
+
     /*
         Here is the definition of the output of the function.  The output
         can be used by other SDK modules which call your code, or the output
         visualizations in the Narrative.  'report_name' and 'report_ref' are
         special output fields- if defined, the Narrative can automatically
         render your Report.
+
+        @optional timings
     */
     typedef structure {
         string report_name;
@@ -65,13 +99,17 @@ module landContigFilter {
         int n_initial_contigs;
         int n_contigs_removed;
         int n_contigs_remaining;
+        Timings timings;
     } FilterContigsResults;
     
+    /*
+        @optional timings
+    */
     typedef structure {
         string report_name;
         string report_ref;
         string report_content;
-
+        Timings timings;
     } AssemblyMetadataResults;
     
     /*
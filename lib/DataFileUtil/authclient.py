@@ -9,56 +9,148 @@ import time as _time
 import requests as _requests
 import threading as _threading
 import hashlib
+from collections import OrderedDict as _OrderedDict
 
 
 class TokenCache(object):
-    ''' A basic cache for tokens. '''
+    '''
+    A least recently used cache for tokens. Entries expire max_time_sec
+    (by default _MAX_TIME_SEC) after they are added; expired entries are
+    dropped when they are next looked up or reach the end of the LRU order.
+    '''
 
     _MAX_TIME_SEC = 5 * 60  # 5 min
 
     _lock = _threading.RLock()
 
-    def __init__(self, maxsize=2000):
-        self._cache = {}
+    def __init__(self, maxsize=2000, max_time_sec=None):
+        self._cache = _OrderedDict()  # token hash -> (user, time added)
         self._maxsize = maxsize
-        self._halfmax = maxsize / 2  # int division to round down
+        if max_time_sec is not None:
+            self._MAX_TIME_SEC = max_time_sec
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
 
     def get_user(self, token):
+        return self._get(token)
+
+    def _get(self, token):
         token = hashlib.sha256(token).hexdigest()
         with self._lock:
-            usertime = self._cache.get(token)
-        if not usertime:
-            return None
-
-        user, intime = usertime
-        if _time.time() - intime > self._MAX_TIME_SEC:
-            return None
-        return user
+            usertime = self._cache.pop(token, None)
+            if not usertime:
+                self.misses += 1
+                return None
+            user, intime = usertime
+            if _time.time() - intime > self._MAX_TIME_SEC:
+                self.expirations += 1
+                self.misses += 1
+                return None
+            # reinsert to mark as most recently used
+            self._cache[token] = usertime
+            self.hits += 1
+            return user
 
     def add_valid_token(self, token, user):
         if not token:
             raise ValueError('Must supply token')
         if not user:
             raise ValueError('Must supply user')
+        self._add(token, user)
+
+    def _add(self, token, value):
         token = hashlib.sha256(token).hexdigest()
         with self._lock:
-            self._cache[token] = [user, _time.time()]
-            if len(self._cache) > self._maxsize:
-                for i, (t, _) in enumerate(sorted(self._cache.items(),
-                                                  key=lambda (_, v): v[1])):
-                    if i <= self._halfmax:
-                        del self._cache[t]
-                    else:
-                        break
+            self._cache.pop(token, None)
+            self._cache[token] = (value, _time.time())
+            while len(self._cache) > self._maxsize:
+                _, (_, intime) = self._cache.popitem(last=False)
+                if _time.time() - intime > self._MAX_TIME_SEC:
+                    self.expirations += 1
+                else:
+                    self.evictions += 1
+
+    def stats(self):
+        '''
+        Returns a dict of the cache size and hit, miss, eviction and
+        expiration counts.
+        '''
+        with self._lock:
+            return {'size': len(self._cache),
+                    'maxsize': self._maxsize,
+                    'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'expirations': self.expirations}
+
+
+class RejectedTokenCache(TokenCache):
+    '''
+    A TokenCache of the tokens the auth service declared invalid, mapped to
+    the error message it gave.
+    '''
+
+    def get_rejection(self, token):
+        '''
+        Returns the error message for a rejected token, or None.
+        '''
+        return self._get(token)
+
+    def add_rejected_token(self, token, message):
+        if not token:
+            raise ValueError('Must supply token')
+        if not message:
+            raise ValueError('Must supply message')
+        self._add(token, message)
+
+
+# the auth service's error code for an invalid token
+_INVALID_TOKEN = 10020
+
+
+def _is_invalid_token(status, err):
+    # only answers saying the token itself is invalid are cached; others,
+    # e.g. 408 or 429, say nothing about the token
+    if status == 401:
+        return True
+    if not isinstance(err, dict):
+        return False
+    error = err.get('error')
+    if isinstance(error, dict) and error.get('appcode') == _INVALID_TOKEN:
+        return True
+    return str(err.get('error_msg', '')).startswith(str(_INVALID_TOKEN))
+
+
+class _Validation(object):
+    ''' A token validation shared by the threads waiting on it. '''
+
+    def __init__(self):
+        self.done = _threading.Event()
+        self.user = None
+        self.error = None
+
+    def wait(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.user
 
 
 class KBaseAuth(object):
     '''
     A very basic KBase auth client for the Python server.
+
+    Concurrent lookups of the same uncached token share one call to the auth
+    service, and tokens the auth service declares invalid are remembered for
+    _REJECTED_TIME_SEC.
     '''
 
     _LOGIN_URL = 'https://kbase.us/services/authorization/Sessions/Login'
 
+    _REJECTED_TIME_SEC = 30
+
     def __init__(self, auth_url=None):
         '''
         Constructor
@@ -67,6 +159,11 @@ class KBaseAuth(object):
         if not self._authurl:
             self._authurl = self._LOGIN_URL
         self._cache = TokenCache()
+        # token -> error message for tokens the auth service rejected
+        self._rejected = RejectedTokenCache(
+            maxsize=1000, max_time_sec=self._REJECTED_TIME_SEC)
+        self._validations = {}  # token hash -> _Validation
+        self._validations_lock = _threading.Lock()
 
     def get_user(self, token):
         if not token:
@@ -74,7 +171,30 @@ class KBaseAuth(object):
         user = self._cache.get_user(token)
         if user:
             return user
-
+        rejected = self._rejected.get_rejection(token)
+        if rejected:
+            raise ValueError(rejected)
+
+        key = hashlib.sha256(token).hexdigest()
+        with self._validations_lock:
+            validation = self._validations.get(key)
+            leader = validation is None
+            if leader:
+                validation = self._validations[key] = _Validation()
+        if not leader:
+            return validation.wait()
+        try:
+            validation.user = self._validate(token)
+        except Exception as e:
+            validation.error = e
+            raise
+        finally:
+            with self._validations_lock:
+                del self._validations[key]
+            validation.done.set()
+        return validation.user
+
+    def _validate(self, token):
         d = {'token': token, 'fields': 'user_id'}
         ret = _requests.post(self._authurl, data=d)
         if not ret.ok:
@@ -82,9 +202,13 @@ class KBaseAuth(object):
                 err = ret.json()
             except:
                 ret.raise_for_status()
-            raise ValueError('Error connecting to auth service: {} {}\n{}'
-                             .format(ret.status_code, ret.reason,
-                                     err['error_msg']))
+            detail = (err.get('error_msg', err.get('error'))
+                      if isinstance(err, dict) else err)
+            message = ('Error connecting to auth service: {} {}\n{}'
+                       .format(ret.status_code, ret.reason, detail))
+            if _is_invalid_token(ret.status_code, err):
+                self._rejected.add_rejected_token(token, message)
+            raise ValueError(message)
 
         user = ret.json()['user_id']
         self._cache.add_valid_token(token, user)
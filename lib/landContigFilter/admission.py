@@ -0,0 +1,174 @@
+'''
+Admission control for RPC methods.
+
+Expensive methods get a concurrency limit each, and can also share a limit
+for all of them together. A call over a limit waits in a bounded queue that
+is served fairly between users (see FairQueue); if the queue is full, or the
+call is still waiting after the timeout, it is rejected so the caller can
+retry later instead of tying up a server thread.
+Methods in the cheap lane are never limited or queued. A waiting call holds
+a server thread too, so the limited calls held at once, running or waiting,
+can be capped below the threads of a process; the calls over the cap are
+rejected at once, and the cheap calls always find a free thread.
+'''
+import threading
+import time
+
+from landContigFilter.fairqueue import FairQueue
+
+
+class AdmissionRejected(Exception):
+    pass
+
+
+class _Ticket(object):
+
+    def __init__(self):
+        self.granted = threading.Event()
+
+
+class _Gate(object):
+    # Waiting calls are queued per user and let in by a FairQueue as calls
+    # finish; a finishing call hands its slot straight to the next waiter.
+
+    def __init__(self, name, limit, max_waiting, weights=None):
+        self.name = name
+        self.limit = limit
+        self.max_waiting = max_waiting
+        self.active = 0
+        self.queue = FairQueue(weights)
+        self._lock = threading.Lock()
+
+    def acquire(self, user, deadline):
+        with self._lock:
+            if self.active < self.limit and not len(self.queue):
+                self.active += 1
+                return
+            if len(self.queue) >= self.max_waiting:
+                raise AdmissionRejected(
+                    '{} is at its limit of {} concurrent calls and {} '
+                    'waiting calls'.format(self.name, self.limit,
+                                           self.max_waiting))
+            ticket = _Ticket()
+            self.queue.put(user, ticket)
+        if ticket.granted.wait(max(0, deadline - time.time())):
+            return
+        with self._lock:
+            if not self.queue.remove(user, ticket):
+                # granted while timing out
+                return
+        raise AdmissionRejected(
+            'Timed out waiting for one of the {} concurrent calls of {} to '
+            'finish'.format(self.limit, self.name))
+
+    def release(self):
+        with self._lock:
+            if len(self.queue):
+                _, ticket = self.queue.get()
+                ticket.granted.set()
+            else:
+                self.active -= 1
+
+
+class AdmissionController(object):
+    '''
+    limits - a dict of method name -> the maximum concurrent calls.
+    total_limit - the maximum concurrent calls of all methods that are not
+        cheap, or None for no shared limit.
+    max_waiting - the maximum calls waiting per limit.
+    timeout - the seconds a call may wait before it is rejected.
+    cheap_methods - methods that are never limited or queued.
+    user_weights - a dict of user -> weight for the fair queuing of waiting
+        calls; users not listed have weight 1.
+    max_calls - the maximum calls of limited methods, running or waiting,
+        or None for no cap; further calls are rejected at once.
+    '''
+
+    _TOTAL = 'all limited methods'
+
+    def __init__(self, limits=None, total_limit=None, max_waiting=20,
+                 timeout=30, cheap_methods=(), user_weights=None,
+                 max_calls=None):
+        self.timeout = timeout
+        self.max_calls = max_calls
+        self._held = 0  # calls of limited methods, running or waiting
+        self._lock = threading.Lock()
+        self.cheap_methods = frozenset(cheap_methods)
+        self._gates = dict((method, _Gate(method, limit, max_waiting,
+                                          user_weights))
+                           for method, limit in (limits or {}).items())
+        self._total = (_Gate(self._TOTAL, total_limit, max_waiting,
+                             user_weights)
+                       if total_limit else None)
+
+    def _gates_for(self, method):
+        if method in self.cheap_methods:
+            return []
+        gates = []
+        if method in self._gates:
+            gates.append(self._gates[method])
+        if self._total is not None:
+            gates.append(self._total)
+        return gates
+
+    def admit(self, method, user=None):
+        '''
+        Waits until a call of method by user may run. Returns a token to
+        pass to release() when the call is done; raises AdmissionRejected if
+        the call may not run.
+        '''
+        gates = self._gates_for(method)
+        if not gates:
+            return []
+        with self._lock:
+            if self.max_calls is not None and self._held >= self.max_calls:
+                raise AdmissionRejected(
+                    '{} calls of limited methods are running or waiting, '
+                    'the most a server process takes'.format(self._held))
+            self._held += 1
+        deadline = time.time() + self.timeout
+        acquired = []
+        try:
+            for gate in gates:
+                gate.acquire(user, deadline)
+                acquired.append(gate)
+        except AdmissionRejected:
+            for gate in acquired:
+                gate.release()
+            with self._lock:
+                self._held -= 1
+            raise
+        return acquired
+
+    def release(self, token):
+        for gate in reversed(token):
+            gate.release()
+        if token:
+            with self._lock:
+                self._held -= 1
+
+    def stats(self):
+        '''
+        Returns a dict of limit name -> (active calls, FairQueue stats of
+        the waiting calls).
+        '''
+        gates = list(self._gates.values())
+        if self._total is not None:
+            gates.append(self._total)
+        stats = {}
+        for gate in gates:
+            with gate._lock:
+                stats[gate.name] = (gate.active, gate.queue.stats())
+        return stats
+
+
+def parse_limits(text):
+    '''
+    Parses 'method:limit, method:limit' into a dict.
+    '''
+    limits = {}
+    for item in (text or '').split(','):
+        if item.strip():
+            method, _, limit = item.rpartition(':')
+            limits[method.strip()] = int(limit)
+    return limits
@@ -0,0 +1,85 @@
+'''
+Non-blocking variants of the AssemblyUtil, DataFileUtil and KBaseReport
+clients.
+
+The methods of AsyncAssemblyUtil, AsyncDataFileUtil and AsyncKBaseReport
+have the same names and arguments as the generated clients, but start the
+job and return an RPCFuture for its result at once, so a coordinator can
+keep many calls in flight from one thread:
+
+    dfu = AsyncDataFileUtil(callback_url, token=token)
+    futures = [dfu.get_objects({'object_refs': [r]}) for r in refs]
+    results = [f.result() for f in futures]
+
+The jobs are started with BaseClient.start_job, so they share its pooled
+HTTP sessions, gzip support, response cache and call statistics, and the
+jobs of a client are checked by a single polling thread. Use
+RPCFuture.add_done_callback to act on a result as soon as it arrives.
+'''
+from landContigFilter.baseclient import (
+    BaseClient as _BaseClient, RPCFuture, ServerError)  # noqa: F401
+
+
+def _sdk_method(service, name):
+    def method(self, *args, **kwargs):
+        context = kwargs.pop('context', None)
+        if kwargs:
+            raise TypeError('Unexpected keyword arguments: ' +
+                            ', '.join(sorted(kwargs)))
+        return self._client.start_job(service + '.' + name, list(args),
+                                      self._service_ver, context)
+    method.__name__ = name
+    method.__doc__ = ('Starts {}.{} and returns an RPCFuture for its '
+                      'result.'.format(service, name))
+    return method
+
+
+class _AsyncSDKClient(object):
+    '''
+    Takes the same arguments as the generated clients; the keyword
+    arguments are passed on to BaseClient.
+    '''
+
+    def __init__(self, url=None, service_ver='release', **kwargs):
+        if url is None:
+            raise ValueError('A url is required')
+        self._service_ver = service_ver
+        self._client = _BaseClient(url, **kwargs)
+
+
+class AsyncAssemblyUtil(_AsyncSDKClient):
+    get_assembly_as_fasta = _sdk_method('AssemblyUtil',
+                                        'get_assembly_as_fasta')
+    export_assembly_as_fasta = _sdk_method('AssemblyUtil',
+                                           'export_assembly_as_fasta')
+    save_assembly_from_fasta = _sdk_method('AssemblyUtil',
+                                           'save_assembly_from_fasta')
+    status = _sdk_method('AssemblyUtil', 'status')
+
+
+class AsyncDataFileUtil(_AsyncSDKClient):
+    shock_to_file = _sdk_method('DataFileUtil', 'shock_to_file')
+    shock_to_file_mass = _sdk_method('DataFileUtil', 'shock_to_file_mass')
+    file_to_shock = _sdk_method('DataFileUtil', 'file_to_shock')
+    unpack_file = _sdk_method('DataFileUtil', 'unpack_file')
+    pack_file = _sdk_method('DataFileUtil', 'pack_file')
+    package_for_download = _sdk_method('DataFileUtil',
+                                       'package_for_download')
+    file_to_shock_mass = _sdk_method('DataFileUtil', 'file_to_shock_mass')
+    copy_shock_node = _sdk_method('DataFileUtil', 'copy_shock_node')
+    own_shock_node = _sdk_method('DataFileUtil', 'own_shock_node')
+    ws_name_to_id = _sdk_method('DataFileUtil', 'ws_name_to_id')
+    save_objects = _sdk_method('DataFileUtil', 'save_objects')
+    get_objects = _sdk_method('DataFileUtil', 'get_objects')
+    versions = _sdk_method('DataFileUtil', 'versions')
+    download_staging_file = _sdk_method('DataFileUtil',
+                                        'download_staging_file')
+    download_web_file = _sdk_method('DataFileUtil', 'download_web_file')
+    status = _sdk_method('DataFileUtil', 'status')
+
+
+class AsyncKBaseReport(_AsyncSDKClient):
+    create = _sdk_method('KBaseReport', 'create')
+    create_extended_report = _sdk_method('KBaseReport',
+                                         'create_extended_report')
+    status = _sdk_method('KBaseReport', 'status')
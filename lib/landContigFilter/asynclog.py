@@ -0,0 +1,150 @@
+'''
+Logging off the request path.
+
+AsyncLogWriter queues log calls and makes them from a background thread, so
+a slow log file or syslog never holds up a request. Messages are truncated
+to a maximum size, and messages above the priority level are rate limited;
+messages that are dropped, because of the rate limit or a full queue, are
+counted and reported in the log.
+'''
+import atexit
+import os
+import threading
+import time
+from pprint import pformat
+
+try:
+    import queue as _queue  # py3
+except ImportError:
+    import Queue as _queue  # py2
+
+
+def truncate(text, limit):
+    '''
+    Returns text cut to at most limit characters plus a note of how much was
+    cut. A limit of 0 or None means no limit.
+    '''
+    if not limit or len(text) <= limit:
+        return text
+    return '{}... [{} more characters]'.format(text[:limit], len(text) - limit)
+
+
+def brief(obj, limit=2000):
+    '''
+    A pretty printed, truncated representation of obj for log messages.
+    '''
+    return truncate(pformat(obj), limit)
+
+
+class _Flush(object):
+    ''' Queued by flush(); set when the messages before it are written. '''
+
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class AsyncLogWriter(object):
+    '''
+    max_queue - the number of messages that may wait to be written.
+    rate_limit - the maximum number of messages per second, with bursts of
+        up to as many; 0 disables rate limiting.
+    max_message_size - messages are truncated to this many characters.
+    priority_level - messages with a level at or below this (e.g. errors,
+        with syslog style levels) are never rate limited or dropped.
+    '''
+
+    def __init__(self, max_queue=10000, rate_limit=0, max_message_size=4096,
+                 priority_level=3):
+        self.max_queue = max_queue
+        self.rate_limit = rate_limit
+        self.max_message_size = max_message_size
+        self.priority_level = priority_level
+        self.dropped = 0
+        self._tokens = float(rate_limit)
+        self._last_refill = time.time()
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        atexit.register(self.flush)
+
+    def _start(self):
+        # called with the lock held. The writer thread does not survive a
+        # fork, so each process (e.g. uwsgi worker) starts its own.
+        self._pid = os.getpid()
+        self._queue = _queue.Queue(self.max_queue)
+        thread = threading.Thread(target=self._run, args=(self._queue,),
+                                  name='async-log-writer')
+        thread.daemon = True
+        thread.start()
+
+    def _allow(self, level):
+        # called with the lock held
+        if not self.rate_limit or level <= self.priority_level:
+            return True
+        now = time.time()
+        self._tokens = min(float(self.rate_limit), self._tokens +
+                           (now - self._last_refill) * self.rate_limit)
+        self._last_refill = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def log(self, log_message, level, message, *args):
+        '''
+        Queues log_message(level, message, *args). message may be a string
+        or a list of strings.
+        '''
+        if isinstance(message, list):
+            message = [truncate(m, self.max_message_size) for m in message]
+        else:
+            message = truncate(message, self.max_message_size)
+        with self._lock:
+            if self._pid != os.getpid():
+                self._start()
+            if not self._allow(level):
+                self.dropped += 1
+                return
+            q = self._queue
+        record = (log_message, level, message, args)
+        if level <= self.priority_level:
+            q.put(record)
+            return
+        try:
+            q.put_nowait(record)
+        except _queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def _run(self, q):
+        reported = 0
+        while True:
+            record = q.get()
+            try:
+                if isinstance(record, _Flush):
+                    record.done.set()
+                    continue
+                log_message, level, message, args = record
+                dropped = self.dropped
+                if dropped != reported:
+                    log_message(level, '{} log messages dropped'.format(
+                        dropped - reported), *args)
+                    reported = dropped
+                log_message(level, message, *args)
+            except Exception:
+                # a failing log call must not stop the writer
+                pass
+            finally:
+                q.task_done()
+
+    def flush(self, timeout=5):
+        '''
+        Waits up to timeout seconds for the queued messages to be written.
+        '''
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            q = self._queue
+        marker = _Flush()
+        q.put(marker)
+        marker.done.wait(timeout)
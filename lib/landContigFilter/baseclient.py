@@ -7,10 +7,16 @@
 
 from __future__ import print_function
 
+import hashlib as _hashlib
 import json as _json
 import requests as _requests
 import random as _random
 import os as _os
+import threading as _threading
+import traceback as _traceback
+import zlib as _zlib
+from collections import OrderedDict as _OrderedDict
+from requests.adapters import HTTPAdapter as _HTTPAdapter
 
 try:
     from configparser import ConfigParser as _ConfigParser  # py 3
@@ -26,6 +32,250 @@ import time
 _CT = 'content-type'
 _AJ = 'application/json'
 _URL_SCHEME = frozenset(['http', 'https'])
+_NOT_A_BATCH = 'Expected a batch response, got '
+
+# pooled sessions shared by every client in the process, keyed by
+# (scheme, host:port, keep_alive)
+_SESSIONS = {}
+_SESSIONS_LOCK = _threading.Lock()
+
+
+def _get_session(url, pool_maxsize=10, keep_alive=True):
+    # The pool size of the first client to contact a host wins.
+    scheme, netloc, _, _, _, _ = _urlparse(url)
+    key = (scheme, netloc, keep_alive)
+    with _SESSIONS_LOCK:
+        session = _SESSIONS.get(key)
+        if session is None:
+            session = _requests.Session()
+            session.mount(scheme + '://', _HTTPAdapter(
+                pool_connections=1, pool_maxsize=pool_maxsize))
+            if not keep_alive:
+                session.headers['Connection'] = 'close'
+            _SESSIONS[key] = session
+    return session
+
+
+# hosts whose responses advertised Accept-Encoding: gzip (RFC 7694), keyed
+# by (scheme, host:port). Request bodies are only compressed for these.
+_GZIP_HOSTS = set()
+
+
+def _accepts_gzip(accept_encoding):
+    # an explicit gzip entry wins over *; a missing q means q=1 and an
+    # invalid one is taken as q=0
+    qualities = {}
+    for coding in (accept_encoding or '').split(','):
+        params = coding.split(';')
+        q = 1.0
+        for param in params[1:]:
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        qualities[params[0].strip().lower()] = q
+    for coding in ('gzip', 'x-gzip', '*'):
+        if coding in qualities:
+            return qualities[coding] > 0
+    return False
+
+
+def _gzip(data):
+    if not isinstance(data, bytes):
+        data = data.encode('utf-8')
+    compressor = _zlib.compressobj(6, _zlib.DEFLATED, 16 + _zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+# ServiceWizard lookups shared by every client in the process, keyed by
+# (service wizard url, module, version)
+_SERVICE_URLS = {}  # key -> (url, expiry time)
+_SERVICE_URL_LOOKUPS = {}  # key -> Event set when an in-flight lookup ends
+_SERVICE_URLS_LOCK = _threading.Lock()
+
+# upper bounds of the histogram buckets for timings, in seconds
+_TIME_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60,
+                 300, 1800)
+# upper bounds of the histogram buckets for payload sizes, in bytes
+_SIZE_BUCKETS = (1024, 16 * 1024, 256 * 1024, 1024 * 1024, 16 * 1024 * 1024,
+                 256 * 1024 * 1024)
+
+
+class _Histogram(object):
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last is +Inf
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+
+    def observe(self, value):
+        i = 0
+        while i < len(self.buckets) and value > self.buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def snapshot(self):
+        return {'count': self.count, 'sum': self.sum, 'max': self.max,
+                'buckets': [[le, c] for le, c in
+                            zip(list(self.buckets) + ['+Inf'], self.counts)]}
+
+
+class CallStats(object):
+    '''
+    Per-method statistics of the calls made by clients in this process:
+    calls, errors and retries, the wall time and request/response sizes of
+    each HTTP call, and for asynchronous jobs the time from submission
+    until the job was seen to finish and the number of state checks
+    (polls).
+    '''
+
+    _HISTOGRAMS = {'wall_time': _TIME_BUCKETS,
+                   'request_bytes': _SIZE_BUCKETS,
+                   'response_bytes': _SIZE_BUCKETS,
+                   'job_time': _TIME_BUCKETS,
+                   'job_polls': (1, 2, 5, 10, 20, 50, 100, 500)}
+
+    def __init__(self):
+        self._methods = {}
+        self._lock = _threading.Lock()
+
+    def _method(self, method):
+        stats = self._methods.get(method)
+        if stats is None:
+            stats = self._methods[method] = {'calls': 0, 'errors': 0,
+                                             'retries': 0}
+        return stats
+
+    def record_retry(self, method):
+        '''
+        Count a call of method that is sent again after it failed.
+        '''
+        with self._lock:
+            self._method(method)['retries'] += 1
+
+    def record_call(self, method, wall_time, request_bytes,
+                    response_bytes=None, error=False):
+        with self._lock:
+            stats = self._method(method)
+            stats['calls'] += 1
+            if error:
+                stats['errors'] += 1
+            self._observe(stats, 'wall_time', wall_time)
+            self._observe(stats, 'request_bytes', request_bytes)
+            if response_bytes is not None:
+                self._observe(stats, 'response_bytes', response_bytes)
+
+    def record_job(self, method, job_time, polls, error=False):
+        with self._lock:
+            stats = self._method(method)
+            stats['calls'] += 1
+            if error:
+                stats['errors'] += 1
+            self._observe(stats, 'job_time', job_time)
+            self._observe(stats, 'job_polls', polls)
+
+    def _observe(self, stats, name, value):
+        hist = stats.get(name)
+        if hist is None:
+            hist = stats[name] = _Histogram(self._HISTOGRAMS[name])
+        hist.observe(value)
+
+    def snapshot(self):
+        '''
+        Returns the statistics as a dict of method -> plain JSON-able dict.
+        '''
+        with self._lock:
+            return dict((method, dict((k, v.snapshot() if
+                                       isinstance(v, _Histogram) else v)
+                                      for k, v in stats.items()))
+                        for method, stats in self._methods.items())
+
+    def reset(self):
+        with self._lock:
+            self._methods = {}
+
+
+def merge_call_stats(snapshots):
+    '''
+    Merge CallStats snapshots, e.g. from the copies of this module shipped
+    with each generated client package.
+    '''
+    merged = {}
+    for snapshot in snapshots:
+        for method, stats in snapshot.items():
+            into = merged.setdefault(method, {'calls': 0, 'errors': 0})
+            for name, value in stats.items():
+                if not isinstance(value, dict):
+                    into[name] = into.get(name, 0) + value
+                elif name not in into:
+                    into[name] = _json.loads(_json.dumps(value))
+                else:
+                    hist = into[name]
+                    hist['count'] += value['count']
+                    hist['sum'] += value['sum']
+                    hist['max'] = max(hist['max'], value['max'])
+                    for bucket, (_, count) in zip(hist['buckets'],
+                                                  value['buckets']):
+                        bucket[1] += count
+    return merged
+
+
+def format_call_stats(snapshot):
+    '''
+    Format a CallStats snapshot as a table for logs.
+    '''
+    lines = ['{:55} {:>6} {:>6} {:>7} {:>10} {:>10} {:>12} {:>12}'.format(
+        'method', 'calls', 'errors', 'retries', 'total s', 'max s', 'sent B',
+        'received B')]
+    for method in sorted(snapshot):
+        stats = snapshot[method]
+        timing = stats.get('job_time') or stats.get('wall_time') or {}
+        lines.append('{:55} {:>6} {:>6} {:>7} {:>10.3f} {:>10.3f} {:>12} '
+                     '{:>12}'
+                     .format(method, stats['calls'], stats['errors'],
+                             stats.get('retries', 0),
+                             timing.get('sum', 0), timing.get('max', 0),
+                             stats.get('request_bytes', {}).get('sum', 0),
+                             stats.get('response_bytes', {}).get('sum', 0)))
+    return '\n'.join(lines)
+
+
+# the statistics of every client in the process that uses this module
+call_stats = CallStats()
+
+
+# auth lookups made once per process and credential source
+_AUTH_CACHE = {}  # key -> (value, expiry time or None)
+_AUTH_CACHE_LOCK = _threading.Lock()
+
+# the number of seconds a token from a user id and password login is reused
+# before logging in again
+_LOGIN_TOKEN_TTL_SEC = 3600
+
+
+def _memoize_auth(key, ttl, fn, *args):
+    # ttl is the number of seconds the value is reused, or None for ever
+    with _AUTH_CACHE_LOCK:
+        cached = _AUTH_CACHE.get(key)
+        if cached is not None and (cached[1] is None or
+                                   cached[1] > time.time()):
+            return cached[0]
+    value = fn(*args)
+    with _AUTH_CACHE_LOCK:
+        _AUTH_CACHE[key] = (value, None if ttl is None else time.time() + ttl)
+    return value
+
+
+def _forget_auth(key):
+    with _AUTH_CACHE_LOCK:
+        _AUTH_CACHE.pop(key, None)
 
 
 def _get_token(user_id, password, auth_svc):
@@ -48,10 +298,31 @@ def _get_token(user_id, password, auth_svc):
     return tok['token']
 
 
-def _read_inifile(file=_os.environ.get(  # @ReservedAssignment
-                  'KB_DEPLOYMENT_CONFIG', _os.environ['HOME'] +
-                  '/.kbase_config')):
+def _login_key(user_id, password, auth_svc):
+    return ('token', user_id, auth_svc,
+            _hashlib.sha256(password.encode('utf-8')).hexdigest())
+
+
+def _get_token_cached(user_id, password, auth_svc):
+    return _memoize_auth(_login_key(user_id, password, auth_svc),
+                         _LOGIN_TOKEN_TTL_SEC, _get_token, user_id, password,
+                         auth_svc)
+
+
+def _read_inifile(file=None):  # @ReservedAssignment
     # Another bandaid to read in the ~/.kbase_config file if one is present
+    if file is None:
+        file = _os.environ.get('KB_DEPLOYMENT_CONFIG', _os.path.join(
+            _os.path.expanduser('~'), '.kbase_config'))
+    try:
+        mtime = _os.path.getmtime(file)
+    except OSError:
+        return None
+    return _memoize_auth(('inifile', file, mtime), None, _parse_inifile,
+                         file)
+
+
+def _parse_inifile(file):  # @ReservedAssignment
     authdata = None
     if _os.path.exists(file):
         try:
@@ -93,6 +364,368 @@ class _JSONObjectEncoder(_json.JSONEncoder):
         return _json.JSONEncoder.default(self, obj)
 
 
+def _all_refs_versioned(params):
+    # the last ref of each ref path must be of the form X/Y/Z
+    try:
+        refs = params[0]['object_refs']
+    except (IndexError, KeyError, TypeError):
+        return False
+    for ref in refs:
+        parts = ref.split(';')[-1].strip().split('/')
+        if len(parts) != 3 or not parts[2].isdigit():
+            return False
+    return True
+
+
+# methods whose results only depend on their parameters, mapped to an
+# optional check on the parameters of a particular call. Unless a client is
+# given its own idempotent_methods, any <service>.status call is treated as
+# idempotent too.
+IDEMPOTENT_METHODS = {
+    'DataFileUtil.get_objects': _all_refs_versioned,
+    'DataFileUtil.ws_name_to_id': None,
+}
+
+
+class ResponseCache(object):
+    '''
+    An LRU cache of RPC results for BaseClient's response_cache argument.
+    maxsize - the maximum number of cached results.
+    ttl - the number of seconds a result is reused.
+    max_bytes - the maximum total size of the cached results, measured as
+        serialized JSON.
+    A cache may be shared by several clients: BaseClient keys the results
+    by service url and by a hash of the client's token, so clients only
+    see results fetched with the same credentials.
+    '''
+
+    def __init__(self, maxsize=1000, ttl=300, max_bytes=64 * 1024 * 1024):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries = _OrderedDict()  # key -> (json, expiry time)
+        self._bytes = 0
+        self._lock = _threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def key(*parts):
+        return _json.dumps(parts, sort_keys=True, separators=(',', ':'),
+                           cls=_JSONObjectEncoder)
+
+    def get(self, key):
+        '''
+        Returns (True, result) on a hit and (False, None) on a miss. The
+        result is a fresh copy the caller may modify.
+        '''
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None and entry[1] <= time.time():
+                self._bytes -= len(entry[0])
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return False, None
+            self._entries[key] = entry
+            self.hits += 1
+        return True, _json.loads(entry[0])
+
+    def put(self, key, result):
+        data = _json.dumps(result, cls=_JSONObjectEncoder)
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old[0])
+            self._entries[key] = (data, time.time() + self.ttl)
+            self._bytes += len(data)
+            while (len(self._entries) > self.maxsize or
+                   self._bytes > self.max_bytes):
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'expirations': self.expirations,
+                    'entries': len(self._entries),
+                    'bytes': self._bytes}
+
+
+def _rpc_request(method, params, context=None):
+    arg_hash = {'method': method,
+                'params': params,
+                'version': '1.1',
+                'id': str(_random.random())[2:]
+                }
+    if context:
+        if type(context) is not dict:
+            raise ValueError('context is not type dict as required.')
+        arg_hash['context'] = context
+    return arg_hash
+
+
+def _rpc_body(method, params, context=None):
+    return _json.dumps(_rpc_request(method, params, context),
+                       cls=_JSONObjectEncoder)
+
+
+def _rpc_error(content_type, text):
+    # the error to raise for an HTTP 500 response
+    if content_type == _AJ:
+        err = _json.loads(text)
+        if 'error' in err:
+            return ServerError(**err['error'])
+    return ServerError('Unknown', 0, text)
+
+
+def _rpc_result(resp):
+    if 'result' not in resp:
+        raise ServerError('Unknown', 0, 'An unknown server error occurred')
+    if not resp['result']:
+        return
+    if len(resp['result']) == 1:
+        return resp['result'][0]
+    return resp['result']
+
+
+def _job_error(error):
+    try:
+        return ServerError(**error)
+    except TypeError:
+        return ServerError('Unknown', 0, str(error))
+
+
+def _unpack_job_result(job_state):
+    if not job_state['result']:
+        return
+    if len(job_state['result']) == 1:
+        return job_state['result'][0]
+    return job_state['result']
+
+
+class RPCFuture(object):
+    '''
+    The eventual result of a remote call, e.g. an asynchronous job started
+    with BaseClient.start_job.
+    '''
+
+    def __init__(self, job_id=None):
+        self.job_id = job_id
+        self._done = _threading.Event()
+        self._result = None
+        self._exception = None
+        self._callbacks = []
+        self._lock = _threading.Lock()
+
+    def done(self):
+        return self._done.is_set()
+
+    def add_done_callback(self, fn):
+        '''
+        Call fn(future) once the call has finished, from the thread that
+        completes it, or at once if it already has.
+        '''
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(fn)
+                return
+        fn(self)
+
+    def result(self, timeout=None):
+        '''
+        Wait up to timeout seconds (forever if None) for the call to finish
+        and return its result, or raise the error it failed with.
+        '''
+        if not self._done.wait(timeout):
+            raise RuntimeError('Timed out waiting for the remote call')
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+    def exception(self, timeout=None):
+        if not self._done.wait(timeout):
+            raise RuntimeError('Timed out waiting for the remote call')
+        return self._exception
+
+    def _set_result(self, result):
+        self._result = result
+        self._finish()
+
+    def _set_exception(self, exception):
+        self._exception = exception
+        self._finish()
+
+    def _finish(self):
+        with self._lock:
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for fn in callbacks:
+            try:
+                fn(self)
+            except Exception:
+                _traceback.print_exc()
+
+
+def _is_transient(error):
+    # errors worth trying again: the service could not be reached, timed out
+    # or was briefly unavailable
+    if isinstance(error, (_requests.exceptions.ConnectionError,
+                          _requests.exceptions.Timeout)):
+        return True
+    if isinstance(error, _requests.exceptions.HTTPError):
+        response = error.response
+        return response is not None and response.status_code in (
+            429, 502, 503, 504)
+    return False
+
+
+def _batch_refused(error):
+    # errors that mean the service does not take batch requests at all, as
+    # opposed to failing this one (e.g. with an expired token)
+    return isinstance(error, ServerError) and (
+        error.code in (-32600, -32601) or
+        error.message.startswith(_NOT_A_BATCH))
+
+
+class _JobPoller(object):
+    '''
+    Checks the state of many asynchronous jobs from a single thread.
+    Each pass checks at most max_batch jobs, rotating through the rest on
+    later passes, with one batch request per service. Passes are at least
+    min_interval apart. The interval resets to min_interval when a job is
+    added or finishes and otherwise grows by scale_percent up to
+    max_interval. A check that fails with a transient error (see
+    _is_transient) is retried on later passes, with the interval doubled
+    each time, until it has failed max_retries times in a row. If a pass
+    fails unexpectedly, the futures of its jobs fail with the error.
+    '''
+
+    def __init__(self, client, min_interval, max_interval, scale_percent,
+                 max_batch, max_retries):
+        self._client = client
+        self._min_interval = min_interval
+        self._max_interval = max(min_interval, max_interval)
+        self._scale = scale_percent / 100.0
+        self._max_batch = max_batch
+        self._max_retries = max_retries
+        self._failures = {}  # job id -> consecutive failed checks
+        self._interval = min_interval
+        self._last_poll = time.time()
+        self._jobs = _OrderedDict()  # job id -> (module, future)
+        self._cond = _threading.Condition()
+        self._thread = None
+
+    def add(self, module, future):
+        with self._cond:
+            self._jobs[future.job_id] = (module, future)
+            self._interval = self._min_interval
+            if self._thread is None:
+                self._thread = _threading.Thread(target=self._run,
+                                                 name='JobPoller')
+                self._thread.daemon = True
+                self._thread.start()
+            self._cond.notify()
+
+    def _next_batch(self):
+        with self._cond:
+            while True:
+                if not self._jobs:
+                    self._thread = None
+                    return None
+                wait = self._last_poll + self._interval - time.time()
+                if wait <= 0:
+                    break
+                self._cond.wait(wait)
+            self._last_poll = time.time()
+            batch = list(self._jobs.items())[:self._max_batch]
+            # rotate so that jobs past max_batch are checked next pass
+            for job_id, job in batch:
+                del self._jobs[job_id]
+                self._jobs[job_id] = job
+            return batch
+
+    def _run(self):
+        try:
+            while True:
+                batch = self._next_batch()
+                if batch is None:
+                    return
+                try:
+                    self._poll(batch)
+                except Exception as e:
+                    # fail the jobs of this pass rather than leave their
+                    # futures waiting on a pass that never finishes
+                    for job_id, (_, future) in batch:
+                        if not future.done():
+                            future._set_exception(e)
+                        self._failures.pop(job_id, None)
+                        with self._cond:
+                            self._jobs.pop(job_id, None)
+        finally:
+            with self._cond:
+                # let the next add start a new thread
+                if self._thread is _threading.current_thread():
+                    self._thread = None
+
+    def _poll(self, batch):
+        by_module = _OrderedDict()
+        for job_id, (module, future) in batch:
+            by_module.setdefault(module, []).append((job_id, future))
+        finished = False
+        retrying = False
+        for module, jobs in by_module.items():
+            states = self._client._check_jobs(
+                module, [job_id for job_id, _ in jobs])
+            for job_id, future in jobs:
+                job_state = states[job_id]
+                if isinstance(job_state, Exception):
+                    failures = self._failures.get(job_id, 0) + 1
+                    if (_is_transient(job_state) and
+                            failures <= self._max_retries):
+                        # try again on a later pass
+                        self._failures[job_id] = failures
+                        call_stats.record_retry(module + '._check_job')
+                        retrying = True
+                        continue
+                    future._set_exception(job_state)
+                elif not job_state['finished']:
+                    self._failures.pop(job_id, None)
+                    continue
+                elif job_state.get('error'):
+                    future._set_exception(_job_error(job_state['error']))
+                else:
+                    future._set_result(_unpack_job_result(job_state))
+                finished = True
+                self._failures.pop(job_id, None)
+                with self._cond:
+                    self._jobs.pop(job_id, None)
+        with self._cond:
+            if retrying:
+                # back off while the service has trouble
+                self._interval = min(
+                    max(self._interval, self._min_interval) * 2,
+                    self._max_interval)
+            elif finished:
+                self._interval = self._min_interval
+            else:
+                self._interval = min(self._interval * self._scale,
+                                     self._max_interval)
+
+
 class BaseClient(object):
     '''
     The KBase base client.
@@ -116,6 +749,29 @@ class BaseClient(object):
     lookup_url - set to true when contacting KBase dynamic services.
     async_job_check_time_ms - the wait time between checking job state for
         asynchronous jobs run with the run_job method.
+    http_pool_size - the maximum number of pooled connections kept open per
+        host. Connection pools are shared by all clients in the process that
+        contact the same host.
+    http_keep_alive - set to False to close the connection after each call.
+    job_poll_max_time_ms - the maximum wait between checks of jobs started
+        with start_job or run_jobs.
+    job_poll_max_batch - the maximum number of jobs checked per polling
+        pass for jobs started with start_job or run_jobs. The jobs of a
+        service are checked with one batch request.
+    job_poll_max_retries - the number of times in a row the check of a job
+        started with start_job or run_jobs may fail with a transient error
+        (connection errors, timeouts, HTTP 429, 502, 503 or 504) before
+        its future fails.
+    service_url_cache_ttl - the number of seconds a dynamic service url
+        looked up from the Service Wizard is reused. 0 disables the cache.
+    response_cache - a ResponseCache for the results of idempotent methods.
+        Results are not cached by default.
+    idempotent_methods - overrides IDEMPOTENT_METHODS, the methods whose
+        results may be cached. Only the given methods are cached; status
+        methods are not added.
+    compress_min_bytes - request bodies of at least this many bytes are
+        sent gzip compressed to servers that accept it. None disables
+        compression.
     '''
     def __init__(
             self, url=None, timeout=30 * 60, user_id=None,
@@ -125,7 +781,16 @@ class BaseClient(object):
             lookup_url=False,
             async_job_check_time_ms=100,
             async_job_check_time_scale_percent=150,
-            async_job_check_max_time_ms=300000):
+            async_job_check_max_time_ms=300000,
+            http_pool_size=10,
+            http_keep_alive=True,
+            job_poll_max_time_ms=10000,
+            job_poll_max_batch=50,
+            job_poll_max_retries=8,
+            service_url_cache_ttl=300,
+            response_cache=None,
+            idempotent_methods=None,
+            compress_min_bytes=16384):
         if url is None:
             raise ValueError('A url is required')
         scheme, _, _, _, _, _ = _urlparse(url)
@@ -133,78 +798,170 @@ class BaseClient(object):
             raise ValueError(url + " isn't a valid http url")
         self.url = url
         self.timeout = int(timeout)
-        self._headers = dict()
+        self._auth = (token, user_id, password, ignore_authrc, auth_svc)
+        self._resolved_headers = None
+        self._login = None  # the login the token came from, if any
         self.trust_all_ssl_certificates = trust_all_ssl_certificates
         self.lookup_url = lookup_url
         self.async_job_check_time = async_job_check_time_ms / 1000.0
         self.async_job_check_time_scale_percent = (
             async_job_check_time_scale_percent)
         self.async_job_check_max_time = async_job_check_max_time_ms / 1000.0
+        self.http_pool_size = http_pool_size
+        self.http_keep_alive = http_keep_alive
+        self.job_poll_max_time = job_poll_max_time_ms / 1000.0
+        self.job_poll_max_batch = job_poll_max_batch
+        self.job_poll_max_retries = job_poll_max_retries
+        self._batch_job_checks = True
+        self.service_url_cache_ttl = service_url_cache_ttl
+        self.response_cache = response_cache
+        self.idempotent_methods = (IDEMPOTENT_METHODS
+                                   if idempotent_methods is None
+                                   else idempotent_methods)
+        self._cache_status = idempotent_methods is None
+        self.compress_min_bytes = compress_min_bytes
+        # job id -> cached result list, or cache key for a job to store
+        self._cached_jobs = {}
+        self._caching_jobs = {}
+        # job id -> [service method, submission time, polls]
+        self._job_stats = {}
+        self._poller = None
+        self._poller_lock = _threading.Lock()
+        if self.timeout < 1:
+            raise ValueError('Timeout value must be at least 1 second')
+
+    @property
+    def _headers(self):
+        # auth is resolved on first use rather than at construction, and
+        # tokens fetched or read from a config file are shared per process;
+        # a token from a login is renewed after _LOGIN_TOKEN_TTL_SEC or when
+        # a service rejects it
+        headers = self._resolved_headers
+        if headers is None:
+            headers = self._resolved_headers = self._resolve_headers()
+        return headers
+
+    def _resolve_headers(self):
+        token, user_id, password, ignore_authrc, auth_svc = self._auth
+        headers = dict()
+        self._login = None
         # token overrides user_id and password
         if token is not None:
-            self._headers['AUTHORIZATION'] = token
+            headers['AUTHORIZATION'] = token
         elif user_id is not None and password is not None:
-            self._headers['AUTHORIZATION'] = _get_token(
-                user_id, password, auth_svc)
+            self._login = (user_id, password, auth_svc)
+            headers['AUTHORIZATION'] = _get_token_cached(*self._login)
         elif 'KB_AUTH_TOKEN' in _os.environ:
-            self._headers['AUTHORIZATION'] = _os.environ.get('KB_AUTH_TOKEN')
+            headers['AUTHORIZATION'] = _os.environ.get('KB_AUTH_TOKEN')
         elif not ignore_authrc:
             authdata = _read_inifile()
             if authdata is not None:
                 if authdata.get('token') is not None:
-                    self._headers['AUTHORIZATION'] = authdata['token']
+                    headers['AUTHORIZATION'] = authdata['token']
                 elif(authdata.get('user_id') is not None and
                         authdata.get('password') is not None):
-                    self._headers['AUTHORIZATION'] = _get_token(
-                        authdata['user_id'], authdata['password'], auth_svc)
-        if self.timeout < 1:
-            raise ValueError('Timeout value must be at least 1 second')
+                    self._login = (authdata['user_id'], authdata['password'],
+                                   auth_svc)
+                    headers['AUTHORIZATION'] = _get_token_cached(*self._login)
+        return headers
 
-    def _call(self, url, method, params, context=None):
-        arg_hash = {'method': method,
-                    'params': params,
-                    'version': '1.1',
-                    'id': str(_random.random())[2:]
-                    }
-        if context:
-            if type(context) is not dict:
-                raise ValueError('context is not type dict as required.')
-            arg_hash['context'] = context
-
-        body = _json.dumps(arg_hash, cls=_JSONObjectEncoder)
-        ret = _requests.post(url, data=body, headers=self._headers,
-                             timeout=self.timeout,
-                             verify=not self.trust_all_ssl_certificates)
+    def _forget_login_token(self):
+        # drops a token that came from a login, so that the next call logs
+        # in again; returns False if the token did not come from a login
+        login = self._login
+        if login is None:
+            return False
+        _forget_auth(_login_key(*login))
+        self._resolved_headers = None
+        return True
+
+    def _post(self, url, body, method, relogin=True):
+        session = _get_session(url, self.http_pool_size, self.http_keep_alive)
+        scheme, netloc, _, _, _, _ = _urlparse(url)
+        host = (scheme, netloc)
+        headers = self._headers
+        uncompressed = body
+        if (self.compress_min_bytes is not None and
+                len(body) >= self.compress_min_bytes and
+                host in _GZIP_HOSTS):
+            body = _gzip(body)
+            headers = dict(headers)
+            headers['Content-Encoding'] = 'gzip'
+        start = time.time()
+        ret = None
+        try:
+            ret = session.post(url, data=body, headers=headers,
+                               timeout=self.timeout,
+                               verify=not self.trust_all_ssl_certificates)
+        finally:
+            call_stats.record_call(
+                method, time.time() - start, len(body),
+                None if ret is None else len(ret.content),
+                ret is None or ret.status_code != 200)
+        if _accepts_gzip(ret.headers.get('Accept-Encoding')):
+            _GZIP_HOSTS.add(host)
+        elif host in _GZIP_HOSTS:
+            _GZIP_HOSTS.discard(host)
+            if ret.status_code == 415 and 'Content-Encoding' in headers:
+                # the server no longer takes compressed bodies
+                call_stats.record_retry(method)
+                return self._post(url, uncompressed, method, relogin)
+        if ret.status_code == 401 and relogin and self._forget_login_token():
+            # the token from the login may have expired; log in again
+            call_stats.record_retry(method)
+            return self._post(url, uncompressed, method, False)
         ret.encoding = 'utf-8'
         if ret.status_code == 500:
-            if ret.headers.get(_CT) == _AJ:
-                err = ret.json()
-                if 'error' in err:
-                    raise ServerError(**err['error'])
-                else:
-                    raise ServerError('Unknown', 0, ret.text)
-            else:
-                raise ServerError('Unknown', 0, ret.text)
+            raise _rpc_error(ret.headers.get(_CT), ret.text)
         if not ret.ok:
             ret.raise_for_status()
-        resp = ret.json()
-        if 'result' not in resp:
-            raise ServerError('Unknown', 0, 'An unknown server error occurred')
-        if not resp['result']:
-            return
-        if len(resp['result']) == 1:
-            return resp['result'][0]
-        return resp['result']
+        return ret.json()
+
+    def _call(self, url, method, params, context=None):
+        return _rpc_result(self._post(url, _rpc_body(method, params, context),
+                                      method))
 
     def _get_service_url(self, service_method, service_version):
         if not self.lookup_url:
             return self.url
         service, _ = service_method.split('.')
+        if self.service_url_cache_ttl <= 0:
+            return self._lookup_service_url(service, service_version)
+        key = (self.url, service, service_version)
+        while True:
+            with _SERVICE_URLS_LOCK:
+                cached = _SERVICE_URLS.get(key)
+                if cached and cached[1] > time.time():
+                    return cached[0]
+                lookup = _SERVICE_URL_LOOKUPS.get(key)
+                if lookup is None:
+                    lookup = _SERVICE_URL_LOOKUPS[key] = _threading.Event()
+                    break
+            # another thread is looking this service up; use its answer,
+            # or try again ourselves if it failed
+            lookup.wait()
+        try:
+            url = self._lookup_service_url(service, service_version)
+            with _SERVICE_URLS_LOCK:
+                _SERVICE_URLS[key] = (url,
+                                      time.time() + self.service_url_cache_ttl)
+            return url
+        finally:
+            with _SERVICE_URLS_LOCK:
+                del _SERVICE_URL_LOOKUPS[key]
+            lookup.set()
+
+    def _lookup_service_url(self, service, service_version):
         service_status_ret = self._call(
             self.url, 'ServiceWizard.get_service_status',
             [{'module_name': service, 'version': service_version}])
         return service_status_ret['url']
 
+    def _forget_service_url(self, service_method, service_version):
+        service, _ = service_method.split('.')
+        with _SERVICE_URLS_LOCK:
+            _SERVICE_URLS.pop((self.url, service, service_version), None)
+
     def _set_up_context(self, service_ver=None, context=None):
         if service_ver:
             if not context:
@@ -212,15 +969,102 @@ class BaseClient(object):
             context['service_ver'] = service_ver
         return context
 
+    def _cache_key(self, kind, service_method, args, service_ver):
+        if self.response_cache is None:
+            return None
+        if service_method in self.idempotent_methods:
+            check = self.idempotent_methods[service_method]
+            if check is not None and not check(args):
+                return None
+        elif not (self._cache_status and service_method.endswith('.status')):
+            return None
+        # results may depend on the caller's access, so never share them
+        # between users or services
+        token = self._headers.get('AUTHORIZATION') or ''
+        return self.response_cache.key(
+            kind, self.url, _hashlib.sha256(token.encode('utf-8')).hexdigest(),
+            service_method, args, service_ver)
+
     def _check_job(self, service, job_id):
-        return self._call(self.url, service + '._check_job', [job_id])
+        if job_id in self._cached_jobs:
+            return {'finished': 1, 'result': self._cached_jobs.pop(job_id)}
+        return self._job_checked(job_id, self._call(
+            self.url, service + '._check_job', [job_id]))
+
+    def _check_jobs(self, service, job_ids):
+        '''
+        Checks the state of several jobs of a service, with a single batch
+        request where the service takes them. Returns a dict of job id ->
+        job state, or the exception the check of that job failed with.
+        '''
+        states = {}
+        remote = []
+        for job_id in job_ids:
+            if job_id in self._cached_jobs:
+                states[job_id] = self._check_job(service, job_id)
+            else:
+                remote.append(job_id)
+        if len(remote) > 1 and self._batch_job_checks:
+            batch = RPCBatch(self)
+            futures = [(job_id, batch._queue(
+                self.url, service + '._check_job', [job_id]))
+                for job_id in remote]
+            batch.execute()
+            errors = [future.exception(0) for _, future in futures]
+            if (all(e is not None and e is errors[0] for e in errors) and
+                    _batch_refused(errors[0])):
+                # the whole batch was refused; the service may not take
+                # batch requests, so check the jobs one by one from now on
+                self._batch_job_checks = False
+                call_stats.record_retry('batch')
+            else:
+                for (job_id, future), error in zip(futures, errors):
+                    states[job_id] = (error if error is not None else
+                                      self._job_checked(job_id,
+                                                        future.result(0)))
+                return states
+        for job_id in remote:
+            try:
+                states[job_id] = self._check_job(service, job_id)
+            except Exception as e:
+                states[job_id] = e
+        return states
+
+    def _job_checked(self, job_id, job_state):
+        # bookkeeping for a job state returned by the service
+        job_stats = self._job_stats.get(job_id)
+        if job_stats is not None:
+            job_stats[2] += 1
+        if job_state['finished']:
+            if job_stats is not None:
+                del self._job_stats[job_id]
+                call_stats.record_job(job_stats[0], time.time() - job_stats[1],
+                                      job_stats[2],
+                                      bool(job_state.get('error')))
+            key = self._caching_jobs.pop(job_id, None)
+            if key is not None and not job_state.get('error'):
+                self.response_cache.put(key, job_state['result'])
+        return job_state
 
     def _submit_job(self, service_method, args, service_ver=None,
                     context=None):
+        key = self._cache_key('job', service_method, args, service_ver)
+        if key is not None:
+            hit, result = self.response_cache.get(key)
+            if hit:
+                # answered by _check_job without contacting the service
+                job_id = 'cached:' + str(_random.random())[2:]
+                self._cached_jobs[job_id] = result
+                return job_id
         context = self._set_up_context(service_ver, context)
         mod, meth = service_method.split('.')
-        return self._call(self.url, mod + '._' + meth + '_submit',
-                          args, context)
+        submitted = time.time()
+        job_id = self._call(self.url, mod + '._' + meth + '_submit',
+                            args, context)
+        self._job_stats[job_id] = [service_method, submitted, 0]
+        if key is not None:
+            self._caching_jobs[job_id] = key
+        return job_id
 
     def run_job(self, service_method, args, service_ver=None, context=None):
         '''
@@ -235,6 +1079,8 @@ class BaseClient(object):
         '''
         mod, _ = service_method.split('.')
         job_id = self._submit_job(service_method, args, service_ver, context)
+        if job_id in self._cached_jobs:
+            return _unpack_job_result(self._check_job(mod, job_id))
         async_job_check_time = self.async_job_check_time
         while True:
             time.sleep(async_job_check_time)
@@ -245,11 +1091,57 @@ class BaseClient(object):
                 async_job_check_time = self.async_job_check_max_time
             job_state = self._check_job(mod, job_id)
             if job_state['finished']:
-                if not job_state['result']:
-                    return
-                if len(job_state['result']) == 1:
-                    return job_state['result'][0]
-                return job_state['result']
+                return _unpack_job_result(job_state)
+
+    def start_job(self, service_method, args, service_ver=None,
+                  context=None):
+        '''
+        Start a SDK method asynchronously and return an RPCFuture for its
+        result. All jobs started by a client are checked by one shared
+        polling thread.
+        Required arguments:
+        service_method - the service and method to run, e.g. myserv.mymeth.
+        args - a list of arguments to the method.
+        Optional arguments:
+        service_ver - the version of the service to run, e.g. a git hash
+            or dev/beta/release.
+        context - the rpc context dict.
+        '''
+        mod, _ = service_method.split('.')
+        future = RPCFuture(
+            self._submit_job(service_method, args, service_ver, context))
+        with self._poller_lock:
+            if self._poller is None:
+                self._poller = _JobPoller(
+                    self, self.async_job_check_time,
+                    self.job_poll_max_time,
+                    self.async_job_check_time_scale_percent,
+                    self.job_poll_max_batch, self.job_poll_max_retries)
+        self._poller.add(mod, future)
+        return future
+
+    def run_jobs(self, service_method, args_list, service_ver=None,
+                 context=None, timeout=None):
+        '''
+        Run a SDK method asynchronously once per entry in args_list and wait
+        for all of the jobs to finish. Returns the results in the order of
+        args_list. The jobs are waited for in that order, so if several
+        fail, the error raised is that of the first failed job in args_list,
+        not of the job that failed first.
+        Required arguments:
+        service_method - the service and method to run, e.g. myserv.mymeth.
+        args_list - a list of argument lists, one per job.
+        Optional arguments:
+        service_ver - the version of the service to run, e.g. a git hash
+            or dev/beta/release.
+        context - the rpc context dict.
+        timeout - the maximum number of seconds to wait for all jobs.
+        '''
+        futures = [self.start_job(service_method, args, service_ver, context)
+                   for args in args_list]
+        deadline = None if timeout is None else time.time() + timeout
+        return [f.result(None if deadline is None else
+                         max(0, deadline - time.time())) for f in futures]
 
     def call_method(self, service_method, args, service_ver=None,
                     context=None):
@@ -263,6 +1155,126 @@ class BaseClient(object):
             or dev/beta/release.
         context - the rpc context dict.
         '''
+        key = self._cache_key('call', service_method, args, service_ver)
+        if key is not None:
+            hit, result = self.response_cache.get(key)
+            if hit:
+                return result
         url = self._get_service_url(service_method, service_ver)
         context = self._set_up_context(service_ver, context)
-        return self._call(url, service_method, args, context)
+        try:
+            result = self._call(url, service_method, args, context)
+        except (_requests.exceptions.ConnectionError,
+                _requests.exceptions.HTTPError) as e:
+            if not self.lookup_url:
+                raise
+            # the service may have moved; look it up again and, if it did,
+            # send the call once more to its new url
+            self._forget_service_url(service_method, service_ver)
+            try:
+                moved_to = self._get_service_url(service_method, service_ver)
+            except Exception:
+                moved_to = url
+            if moved_to == url:
+                raise e
+            call_stats.record_retry(service_method)
+            result = self._call(moved_to, service_method, args, context)
+        if key is not None:
+            self.response_cache.put(key, result)
+        return result
+
+    def batch(self):
+        '''
+        Start a JSON-RPC batch. Calls queued on the returned RPCBatch are
+        sent together, one HTTP request per service url, when its execute
+        method is called or its with block exits.
+        '''
+        return RPCBatch(self)
+
+
+class RPCBatch(object):
+    '''
+    Method calls queued to be sent as a single JSON-RPC batch request:
+
+        with client.batch() as batch:
+            objs = batch.call_method('DataFileUtil.get_objects', [params])
+            stat = batch.call_method('DataFileUtil.status', [])
+        objs.result()
+
+    Each call returns an RPCFuture that is completed with its own result or
+    error once the batch has been executed.
+    '''
+
+    def __init__(self, client):
+        self._client = client
+        self._calls = []  # (url, request, future)
+
+    def call_method(self, service_method, args, service_ver=None,
+                    context=None):
+        '''
+        Queue a call to a standard or dynamic service. Takes the same
+        arguments as BaseClient.call_method.
+        '''
+        url = self._client._get_service_url(service_method, service_ver)
+        context = self._client._set_up_context(service_ver, context)
+        return self._queue(url, service_method, args, context)
+
+    def _queue(self, url, service_method, args, context=None):
+        future = RPCFuture()
+        self._calls.append((url, _rpc_request(service_method, args, context),
+                            future))
+        return future
+
+    def execute(self):
+        '''
+        Send the queued calls and route each response to its future.
+        '''
+        calls, self._calls = self._calls, []
+        by_url = _OrderedDict()
+        for url, request, future in calls:
+            by_url.setdefault(url, []).append((request, future))
+        for url, entries in by_url.items():
+            pending = {}
+            for request, future in entries:
+                while request['id'] in pending:
+                    request['id'] = str(_random.random())[2:]
+                pending[request['id']] = future
+            try:
+                resp = self._client._post(url, _json.dumps(
+                    [request for request, _ in entries],
+                    cls=_JSONObjectEncoder), 'batch')
+            except Exception as e:
+                for future in pending.values():
+                    future._set_exception(e)
+                continue
+            if not isinstance(resp, list):
+                if isinstance(resp, dict) and resp.get('error'):
+                    error = _job_error(resp['error'])
+                else:
+                    error = ServerError('Unknown', 0, _NOT_A_BATCH +
+                                        _json.dumps(resp)[:200])
+                for future in pending.values():
+                    future._set_exception(error)
+                continue
+            for entry in resp:
+                future = pending.pop(entry.get('id'), None)
+                if future is None:
+                    continue
+                if entry.get('error'):
+                    future._set_exception(_job_error(entry['error']))
+                    continue
+                try:
+                    future._set_result(_rpc_result(entry))
+                except ServerError as e:
+                    future._set_exception(e)
+            for future in pending.values():
+                if not future.done():
+                    future._set_exception(ServerError(
+                        'Unknown', 0, 'No response for batched call'))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.execute()
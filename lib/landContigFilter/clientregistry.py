@@ -0,0 +1,52 @@
+'''
+A registry of reusable service clients.
+'''
+import hashlib
+import threading
+import time
+
+
+class ClientRegistry(object):
+    '''
+    Hands out service clients for one url, keyed by (client class, token),
+    so repeated calls reuse the same client instead of constructing a new
+    one. The clients share the pooled HTTP connections of baseclient and
+    are safe to use from several threads at once. Clients that have not
+    been handed out for idle_timeout seconds are released.
+    '''
+
+    def __init__(self, url, idle_timeout=600):
+        self.url = url
+        self.idle_timeout = idle_timeout
+        self._clients = {}  # (class, token hash) -> [client, last used]
+        self._lock = threading.Lock()
+
+    def get(self, client_class, token=None):
+        '''
+        Returns a client_class instance for the token, e.g.
+        registry.get(AssemblyUtil, ctx['token']).
+        '''
+        token_hash = None
+        if token:
+            token_hash = hashlib.sha256(
+                token if isinstance(token, bytes) else
+                token.encode('utf-8')).hexdigest()
+        key = (client_class, token_hash)
+        now = time.time()
+        with self._lock:
+            self._release_idle(now)
+            entry = self._clients.get(key)
+            if entry is None:
+                entry = self._clients[key] = [
+                    client_class(self.url, token=token), now]
+            entry[1] = now
+            return entry[0]
+
+    def _release_idle(self, now):
+        for key, (_, last_used) in list(self._clients.items()):
+            if now - last_used > self.idle_timeout:
+                del self._clients[key]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._clients)
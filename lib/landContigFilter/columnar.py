@@ -0,0 +1,161 @@
+'''
+Columnar export of per-contig tables.
+
+The binary layout is meant to be memory-mapped by downstream tools instead of
+re-parsing text:
+
+    8 bytes   magic, 'CTGCOL01'
+    8 bytes   little-endian uint64 length of the JSON header
+    n bytes   JSON header, space padded to an 8 byte boundary
+    ...       column blocks, each starting on an 8 byte boundary
+
+The header lists num_rows and, for every column, its name, a NumPy style
+dtype and the offset/nbytes of its block(s) from the start of the file.
+Numeric columns are a single contiguous '<i8' or '<f8' array, so
+numpy.memmap(path, dtype, 'r', offset, shape=(num_rows,)) maps them directly.
+String columns are stored as a string table: an '<i8' array of num_rows + 1
+offsets into a UTF-8 data block.
+'''
+import json
+import mmap
+import struct
+
+MAGIC = b'CTGCOL01'
+EXTENSION = '.ctgcol'
+
+# (name, dtype) in file order
+CONTIG_COLUMNS = [('assembly_ref', 'string'),
+                  ('contig_id', 'string'),
+                  ('length', '<i8'),
+                  ('gc_content', '<f8'),
+                  ('description', 'string')]
+
+_STRUCT_CODES = {'<i8': 'q', '<f8': 'd'}
+_MISSING = {'<i8': -1, '<f8': float('nan')}
+
+
+def _pad(nbytes):
+    return (8 - nbytes % 8) % 8
+
+
+def _encode(value):
+    if value is None:
+        return b''
+    if isinstance(value, bytes):
+        return value
+    return u'{}'.format(value).encode('utf-8')
+
+
+def contig_rows(assemblies):
+    '''
+    Flatten (ref, object_data) tuples as returned by get_objects into one
+    row per contig.
+    '''
+    rows = []
+    for assembly_ref, assembly in assemblies:
+        contigs = assembly['data'].get('contigs') or {}
+        for name in contigs:
+            contig = contigs[name]
+            rows.append({'assembly_ref': assembly_ref,
+                         'contig_id': contig.get('contig_id', name),
+                         'length': contig.get('length'),
+                         'gc_content': contig.get('gc_content'),
+                         'description': contig.get('description')})
+    return rows
+
+
+def write_tsv(path, rows, columns=CONTIG_COLUMNS):
+    with open(path, 'wb') as tsv:
+        tsv.write(b'\t'.join(_encode(name) for name, _ in columns) + b'\n')
+        for row in rows:
+            values = [_encode(row.get(name)).replace(b'\t', b' ')
+                      .replace(b'\n', b' ') for name, _ in columns]
+            tsv.write(b'\t'.join(values) + b'\n')
+
+
+def write_columns(path, rows, columns=CONTIG_COLUMNS):
+    '''
+    Write rows (a list of dicts) to path in the columnar binary layout.
+    '''
+    blocks = []
+    for name, dtype in columns:
+        if dtype == 'string':
+            data = [_encode(row.get(name)) for row in rows]
+            offsets = [0]
+            for value in data:
+                offsets.append(offsets[-1] + len(value))
+            blocks.append((name, dtype,
+                           [struct.pack('<%dq' % len(offsets), *offsets),
+                            b''.join(data)]))
+        else:
+            missing = _MISSING[dtype]
+            cast = int if dtype == '<i8' else float
+            values = [missing if row.get(name) is None else cast(row[name])
+                      for row in rows]
+            blocks.append((name, dtype,
+                           [struct.pack('<%d%s' % (len(values),
+                                                   _STRUCT_CODES[dtype]),
+                                        *values)]))
+
+    # The header size depends on the offsets it records, so grow the
+    # reserved header space until the layout is stable.
+    header_len = 0
+    while True:
+        offset = 16 + header_len
+        meta = []
+        for name, dtype, parts in blocks:
+            column = {'name': name, 'dtype': dtype}
+            part_meta = []
+            for part in parts:
+                part_meta.append({'offset': offset, 'nbytes': len(part)})
+                offset += len(part) + _pad(len(part))
+            if dtype == 'string':
+                column['offsets'], column['data'] = part_meta
+            else:
+                column.update(part_meta[0])
+            meta.append(column)
+        header = json.dumps({'num_rows': len(rows),
+                             'columns': meta}).encode('utf-8')
+        needed = len(header) + _pad(len(header))
+        if needed == header_len:
+            break
+        header_len = needed
+
+    with open(path, 'wb') as out:
+        out.write(MAGIC)
+        out.write(struct.pack('<Q', header_len))
+        out.write(header + b' ' * (header_len - len(header)))
+        for _, _, parts in blocks:
+            for part in parts:
+                out.write(part + b'\0' * _pad(len(part)))
+
+
+def read_columns(path):
+    '''
+    Memory-map a file written by write_columns and return a dict of column
+    name -> list of values.
+    '''
+    with open(path, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        if mm[:8] != MAGIC:
+            raise ValueError(path + ' is not a contig column file')
+        header_len, = struct.unpack_from('<Q', mm, 8)
+        header = json.loads(mm[16:16 + header_len].decode('utf-8'))
+        n = header['num_rows']
+        columns = {}
+        for column in header['columns']:
+            if column['dtype'] == 'string':
+                offsets = struct.unpack_from('<%dq' % (n + 1), mm,
+                                             column['offsets']['offset'])
+                start = column['data']['offset']
+                columns[column['name']] = [
+                    mm[start + offsets[i]:start + offsets[i + 1]]
+                    .decode('utf-8') for i in range(n)]
+            else:
+                columns[column['name']] = list(struct.unpack_from(
+                    '<%d%s' % (n, _STRUCT_CODES[column['dtype']]), mm,
+                    column['offset']))
+        return columns
+    finally:
+        mm.close()
@@ -0,0 +1,146 @@
+'''
+A queue that is fair between users.
+'''
+import time
+from collections import deque
+
+
+class FairQueue(object):
+    '''
+    Items are queued per user and taken from the users in weighted round
+    robin (deficit round robin with a cost of one per item), so a user with
+    many queued items does not hold up the others. A user with weight 2 is
+    served twice as often as a user with weight 1 while both have items
+    queued.
+
+    weights - a dict of user -> weight; other users get default_weight.
+    idle_after - the seconds after which a user with nothing queued is no
+        longer listed by user_stats().
+
+    The queue is not thread safe; callers hold their own lock.
+    '''
+
+    def __init__(self, weights=None, default_weight=1, idle_after=3600):
+        if min(list((weights or {}).values()) + [default_weight]) <= 0:
+            raise ValueError('Weights must be greater than 0')
+        self.weights = dict(weights or {})
+        self.default_weight = default_weight
+        self.idle_after = idle_after
+        self._queues = {}  # user -> deque of (item, time queued)
+        self._credit = {}
+        self._active = deque()  # users with queued items, in serving order
+        # user -> [items served, total seconds waited, last served], for
+        # the users served within idle_after
+        self._served = {}
+        self._served_total = 0
+        self._wait_total = 0.0
+
+    def __len__(self):
+        return sum(len(q) for q in self._queues.values())
+
+    def put(self, user, item):
+        queue = self._queues.get(user)
+        if queue is None:
+            queue = self._queues[user] = deque()
+            self._credit[user] = 0
+            self._active.append(user)
+        queue.append((item, time.time()))
+
+    def get(self):
+        '''
+        Removes and returns the next (user, item). Raises IndexError if the
+        queue is empty.
+        '''
+        if not self._active:
+            raise IndexError('get from an empty FairQueue')
+        while True:
+            user = self._active[0]
+            if self._credit[user] >= 1:
+                self._credit[user] -= 1
+                queue = self._queues[user]
+                item, queued = queue.popleft()
+                if not queue:
+                    self._drop(user)
+                now = time.time()
+                served = self._served.setdefault(user, [0, 0.0, now])
+                served[0] += 1
+                served[1] += now - queued
+                served[2] = now
+                self._served_total += 1
+                self._wait_total += now - queued
+                self._forget_idle(now)
+                return user, item
+            self._credit[user] += self.weights.get(user, self.default_weight)
+            self._active.rotate(-1)
+
+    def remove(self, user, item):
+        '''
+        Removes a queued item, e.g. one whose caller gave up waiting.
+        Returns False if it was not queued.
+        '''
+        queue = self._queues.get(user)
+        if queue is None:
+            return False
+        for entry in queue:
+            if entry[0] is item:
+                queue.remove(entry)
+                if not queue:
+                    self._drop(user)
+                return True
+        return False
+
+    def _drop(self, user):
+        del self._queues[user]
+        del self._credit[user]
+        self._active.remove(user)
+
+    def _forget_idle(self, now):
+        for user, (_, _, last_served) in list(self._served.items()):
+            if last_served < now - self.idle_after and \
+                    user not in self._queues:
+                del self._served[user]
+
+    def stats(self):
+        '''
+        Returns a dict with the totals over all users: depth and users, the
+        queued items and the users they belong to, oldest_wait, the seconds
+        the oldest item has waited, and served and wait_total, the items
+        served so far and the seconds they waited in total.
+        '''
+        now = time.time()
+        return {'depth': len(self),
+                'users': len(self._queues),
+                'oldest_wait': max([now - q[0][1]
+                                    for q in self._queues.values()] + [0]),
+                'served': self._served_total,
+                'wait_total': self._wait_total}
+
+    def user_stats(self):
+        '''
+        Returns a dict of user -> {depth, oldest_wait, served, wait_total}
+        as in stats(), for the users with queued items or served within
+        idle_after seconds.
+        '''
+        now = time.time()
+        self._forget_idle(now)
+        stats = {}
+        for user in set(self._queues) | set(self._served):
+            queue = self._queues.get(user) or ()
+            served, wait_total, _ = self._served.get(user, (0, 0.0, None))
+            stats[user] = {'depth': len(queue),
+                           'oldest_wait': now - queue[0][1] if queue else 0,
+                           'served': served,
+                           'wait_total': wait_total}
+        return stats
+
+
+def parse_weights(text):
+    '''
+    Parses 'user:weight, user:weight' into a dict.
+    '''
+    weights = {}
+    for item in (text or '').split(','):
+        if item.strip():
+            user, _, weight = item.rpartition(':')
+            weights[user.strip()] = float(weight)
+    return weights
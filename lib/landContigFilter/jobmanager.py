@@ -0,0 +1,574 @@
+'''
+Runs RPC calls as local asynchronous jobs.
+
+Jobs run on a bounded pool of worker processes shared by all the processes
+of the service; queued jobs are handed to the pool fairly between users
+(see FairQueue). Their state and results are kept in a SQLite file, so any
+server process can answer for them; tokens are only kept in memory.
+
+The pool belongs to a job process, started by JobManager.start before the
+starting process runs any other thread, e.g. by the uwsgi master before it
+forks the server processes. A process forked while another thread holds a
+lock (of the log writer, the HTTP session pools, the metrics or SQLite)
+finds the lock held for good, so neither the job process nor its workers
+are forked from a server process. Server processes hand their jobs to the
+job process over a Unix socket that only the service's user can use.
+
+Workers send the pid running a job and a heartbeat to the job process,
+which records them. The job process sweeps the file periodically and fails
+the jobs that can no longer finish: those of an exited job process or
+worker, those whose heartbeat stopped and, if a timeout is set, those
+running for too long. Workers do not use the file themselves: the pool
+forks new workers at any time, and a worker forked while another thread
+used SQLite can find the file locked for good.
+'''
+import errno
+import fcntl
+import json
+import multiprocessing
+import os
+import select
+import shutil
+import signal
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+
+from landContigFilter.fairqueue import FairQueue
+
+QUEUED = 'queued'
+RUNNING = 'running'
+COMPLETED = 'completed'
+ERROR = 'error'
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    user_id TEXT,
+    method TEXT NOT NULL,
+    status TEXT NOT NULL,
+    owner_pid INTEGER NOT NULL,
+    submitted REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    result TEXT,
+    error TEXT,
+    worker_pid INTEGER,
+    heartbeat REAL
+)'''
+
+# columns added after the first release, for files created before them
+_ADDED_COLUMNS = (('worker_pid', 'INTEGER'), ('heartbeat', 'REAL'))
+
+# a running job whose heartbeat is this many intervals old is failed
+_MISSED_HEARTBEATS = 6
+
+# the seconds the job process and a server process get to send a message
+_MESSAGE_TIMEOUT_SEC = 30
+
+
+class JobNotFoundError(KeyError):
+    pass
+
+
+class JobsUnavailableError(Exception):
+    ''' The job process did not take the call. '''
+    pass
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == 1  # EPERM: alive, but not ours
+    return True
+
+
+# the pipe a pool worker sends its heartbeats to
+_beats_fd = None
+
+
+def _init_worker(beats_fd):
+    global _beats_fd
+    _beats_fd = beats_fd
+    # the job process only wakes up on SIGTERM; a worker is simply stopped
+    signal.set_wakeup_fd(-1)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+
+def _beat(job_id):
+    # a write this short to a pipe is atomic, so workers need no lock that
+    # a killed worker could leave held
+    os.write(_beats_fd, '{} {} {!r}\n'.format(
+        job_id, os.getpid(), time.time()).encode('ascii'))
+
+
+def _heartbeat(job_id, interval, stop):
+    while not stop.wait(interval):
+        _beat(job_id)
+
+
+def _run_job(run, job_id, request, token, user_id, heartbeat_interval):
+    # executed in a pool worker process
+    stop = threading.Event()
+    try:
+        _beat(job_id)
+        beat = threading.Thread(target=_heartbeat, name='job-heartbeat',
+                                args=(job_id, heartbeat_interval, stop))
+        beat.daemon = True
+        beat.start()
+        return job_id, json.dumps(run(request, token, user_id))
+    except Exception as e:
+        return job_id, json.dumps({'error': {
+            'name': 'Unexpected Server Error', 'code': 0,
+            'message': str(e), 'error': None}})
+    finally:
+        stop.set()
+
+
+def _send(conn, message):
+    conn.sendall(json.dumps(message).encode('utf-8') + b'\n')
+
+
+def _receive(conn):
+    data = b''
+    while not data.endswith(b'\n'):
+        chunk = conn.recv(65536)
+        if not chunk:
+            break
+        data += chunk
+    if not data:
+        return None
+    return json.loads(data.decode('utf-8'))
+
+
+class JobManager(object):
+    '''
+    db_path - the SQLite file holding the job states.
+    run - a picklable function run(request, token, user_id) that executes a
+        JSON-RPC request dict and returns the JSON-RPC response dict.
+    max_workers - the number of worker processes, i.e. the number of jobs
+        run at once by the service.
+    retention - finished jobs are removed after this many seconds.
+    user_weights - a dict of user -> weight for the fair queuing of jobs;
+        users not listed have weight 1.
+    heartbeat_interval - the number of seconds between the heartbeats of a
+        running job and between sweeps for jobs that can no longer finish.
+    timeout - running jobs are stopped and failed after this many seconds;
+        None for no limit.
+    '''
+
+    def __init__(self, db_path, run, max_workers=2, retention=24 * 3600,
+                 user_weights=None, heartbeat_interval=10, timeout=None):
+        self.db_path = db_path
+        self.run = run
+        self.max_workers = max_workers
+        self.retention = retention
+        self.user_weights = user_weights
+        self.heartbeat_interval = heartbeat_interval
+        self.timeout = timeout
+        self.socket_path = None  # of the job process, once started
+        self.job_pid = None
+        self._directory = None
+        self._starter_pid = None
+        self._alive_fd = None
+        self._pool = None
+        self._stop = threading.Event()
+        self._sweeper = None
+        self._worker_beats_fd = None
+        self._queue = FairQueue(user_weights)
+        self._running = 0
+        self._dispatched = {}  # job id -> AsyncResult, for running jobs
+        self._lock = threading.Lock()
+        self._execute('PRAGMA journal_mode=WAL')
+        self._execute(_SCHEMA)
+        columns = set(row['name'] for row in
+                      self._execute('PRAGMA table_info(jobs)'))
+        for name, kind in _ADDED_COLUMNS:
+            if name not in columns:
+                self._execute('ALTER TABLE jobs ADD COLUMN {} {}'.format(
+                    name, kind))
+        self.sweep()
+
+    def _connect(self):
+        db = sqlite3.connect(self.db_path, timeout=30)
+        db.row_factory = sqlite3.Row
+        return db
+
+    def _execute(self, sql, args=()):
+        db = self._connect()
+        try:
+            with db:
+                return db.execute(sql, args).fetchall()
+        finally:
+            db.close()
+
+    def _update(self, sql, args=()):
+        # returns the number of rows changed
+        db = self._connect()
+        try:
+            with db:
+                return db.execute(sql, args).rowcount
+        finally:
+            db.close()
+
+    def _interruption(self, row, now):
+        # returns why a queued or running job can no longer finish, or None
+        if not _pid_alive(row['owner_pid']):
+            return 'The job was interrupted by a restart of the service'
+        if row['status'] != RUNNING:
+            return None
+        if row['worker_pid'] is not None and not _pid_alive(
+                row['worker_pid']):
+            return 'The worker process running the job exited'
+        if row['owner_pid'] != os.getpid():
+            # only the process that runs a job may stop its worker
+            return None
+        if row['heartbeat'] < now - self.heartbeat_interval * \
+                _MISSED_HEARTBEATS:
+            message = 'The job stopped sending heartbeats'
+        elif self.timeout and row['started'] < now - self.timeout:
+            message = 'The job did not finish within {} seconds'.format(
+                self.timeout)
+        else:
+            return None
+        if row['worker_pid'] is not None:
+            try:
+                os.kill(row['worker_pid'], signal.SIGTERM)
+            except OSError:
+                pass
+        return message
+
+    def sweep(self):
+        '''
+        Fails the jobs that can no longer finish, and frees the worker
+        slots of those the job process ran. Runs every heartbeat_interval
+        seconds in the job process.
+        '''
+        now = time.time()
+        for row in self._execute(
+                'SELECT job_id, status, owner_pid, worker_pid, started, '
+                'heartbeat FROM jobs WHERE status IN (?, ?)',
+                (QUEUED, RUNNING)):
+            message = self._interruption(row, now)
+            if message is not None:
+                self._finish(row['job_id'], None, {
+                    'name': 'JobInterrupted', 'code': -32000,
+                    'message': message, 'error': None})
+        with self._lock:
+            if self._pool is None or not self._dispatched:
+                return
+            for job_id, result in list(self._dispatched.items()):
+                if result.ready() and not result.successful():
+                    # the worker failed outside the job, so no callback
+                    try:
+                        result.get()
+                    except Exception as e:
+                        self._finish(job_id, None, {
+                            'name': 'Unexpected Server Error', 'code': 0,
+                            'message': str(e), 'error': None})
+            ids = list(self._dispatched)
+            unfinished = set(row['job_id'] for row in self._execute(
+                'SELECT job_id FROM jobs WHERE status IN (?, ?) AND '
+                'job_id IN ({})'.format(', '.join('?' * len(ids))),
+                [QUEUED, RUNNING] + ids))
+            for job_id in ids:
+                if job_id not in unfinished:
+                    # failed above or by check: its callback never comes
+                    del self._dispatched[job_id]
+                    self._running -= 1
+            self._dispatch()
+
+    def _sweep_forever(self, stop):
+        while not stop.wait(self.heartbeat_interval):
+            try:
+                self.sweep()
+            except Exception:
+                traceback.print_exc()
+
+    def _record_beats(self, beats):
+        with beats:
+            for line in iter(beats.readline, b''):
+                job_id, pid, beat_time = line.decode('ascii').split()
+                try:
+                    self._update(
+                        'UPDATE jobs SET worker_pid = ?, heartbeat = ? '
+                        'WHERE job_id = ? AND status = ?',
+                        (int(pid), float(beat_time), job_id, RUNNING))
+                except sqlite3.Error:
+                    traceback.print_exc()  # the next beat may get through
+
+    def _start_thread(self, target, name, *args):
+        thread = threading.Thread(target=target, args=args, name=name)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def start(self):
+        '''
+        Forks the job process, which runs the jobs submitted by this process
+        and the processes it forks later. Call before this process starts
+        any thread. The job process exits when this process and those it
+        forked have exited.
+        '''
+        if self.job_pid is not None:
+            raise RuntimeError('The job process is already running')
+        directory = tempfile.mkdtemp(prefix='jobs-')  # only for this user
+        socket_path = os.path.join(directory, 'jobs.sock')
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(socket_path)
+        listener.listen(128)
+        alive_fd, self._alive_fd = os.pipe()
+        # an exec, e.g. a uwsgi reload, closes the write end too
+        flags = fcntl.fcntl(self._alive_fd, fcntl.F_GETFD)
+        fcntl.fcntl(self._alive_fd, fcntl.F_SETFD, flags | fcntl.FD_CLOEXEC)
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                os.close(self._alive_fd)
+                self._serve(listener, alive_fd)
+            except KeyboardInterrupt:
+                pass
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                # not sys.exit: the handlers of the starting process, e.g.
+                # those of multiprocessing, are not the job process's
+                os._exit(code)
+        listener.close()
+        os.close(alive_fd)
+        self._directory = directory
+        self.socket_path = socket_path
+        self.job_pid = pid
+        self._starter_pid = os.getpid()
+
+    def _serve(self, listener, alive_fd):
+        # the main loop of the job process, until the processes that could
+        # submit jobs are gone or it is stopped. SIGTERM only wakes the loop,
+        # through the wakeup fd: a handler runs in the main thread once it
+        # runs Python code again, not while it waits in select, and an
+        # exception raised wherever it lands, e.g. in the fork of a worker,
+        # can leave a lock held and the shut down waiting on it
+        stop_fd, wake_fd = os.pipe()
+        fcntl.fcntl(wake_fd, fcntl.F_SETFL,
+                    fcntl.fcntl(wake_fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+        signal.set_wakeup_fd(wake_fd)
+        signal.signal(signal.SIGTERM, lambda signum, frame: None)
+        # the pool forks its workers before any thread of this process runs
+        beats_fd, self._worker_beats_fd = os.pipe()
+        self._pool = multiprocessing.Pool(
+            self.max_workers, _init_worker, (self._worker_beats_fd,))
+        try:
+            self._start_thread(self._record_beats, 'job-heartbeats',
+                               os.fdopen(beats_fd, 'rb'))
+            self._sweeper = self._start_thread(self._sweep_forever,
+                                               'job-sweeper', self._stop)
+            while True:
+                try:
+                    readable = select.select([listener, alive_fd, stop_fd],
+                                             [], [],
+                                             self.heartbeat_interval)[0]
+                except (select.error, OSError) as e:
+                    if e.args[0] != errno.EINTR:  # py2 does not retry
+                        raise
+                    continue
+                if alive_fd in readable or stop_fd in readable:
+                    # stopped, or end of file: no process can submit jobs
+                    return
+                if listener in readable:
+                    conn = listener.accept()[0]
+                    self._start_thread(self._answer, 'job-client', conn)
+        finally:
+            self._shut_down()
+
+    def _answer(self, conn):
+        # answers a message of a server process
+        try:
+            conn.settimeout(_MESSAGE_TIMEOUT_SEC)
+            message = _receive(conn)
+            if message['call'] == 'submit':
+                reply = {'job_id': self._submit(
+                    message['request'], message['token'],
+                    message['user_id'])}
+            else:
+                with self._lock:
+                    reply = {'stats': [self._running, self._queue.stats()]}
+        except Exception as e:
+            traceback.print_exc()
+            reply = {'error': str(e)}
+        try:
+            _send(conn, reply)
+        except (socket.error, ValueError):
+            pass  # the caller gave up
+        finally:
+            conn.close()
+
+    def _shut_down(self):
+        # stops the workers and fails the unfinished jobs of the job process
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        self._stop.set()
+        if self._sweeper is not None:
+            self._sweeper.join()
+        with self._lock:
+            pool = self._pool
+            self._pool = None
+            self._queue = FairQueue(self.user_weights)
+            self._running = 0
+            self._dispatched = {}
+        # not with the lock held: the pool waits for its callbacks
+        pool.terminate()
+        os.close(self._worker_beats_fd)
+        for row in self._execute(
+                'SELECT job_id FROM jobs WHERE owner_pid = ? AND '
+                'status IN (?, ?)', (os.getpid(), QUEUED, RUNNING)):
+            self._finish(row['job_id'], None, {
+                'name': 'JobInterrupted', 'code': -32000,
+                'message': 'The job was interrupted by a restart of the '
+                           'service', 'error': None})
+
+    def close(self):
+        '''
+        Stops the job process, which fails its unfinished jobs. Only the
+        process that started it can stop it.
+        '''
+        if self.job_pid is None or self._starter_pid != os.getpid():
+            return
+        try:
+            os.kill(self.job_pid, signal.SIGTERM)
+            os.waitpid(self.job_pid, 0)
+        except OSError:
+            pass  # already gone, or reaped by e.g. the uwsgi master
+        os.close(self._alive_fd)
+        shutil.rmtree(self._directory, ignore_errors=True)
+        self.socket_path = self._directory = None
+        self.job_pid = self._starter_pid = self._alive_fd = None
+        # fails the jobs of a job process that was killed before it could
+        self.sweep()
+
+    def _call(self, message):
+        # sends a message to the job process and returns its reply
+        if self.socket_path is None:
+            raise JobsUnavailableError('Local jobs are not running')
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            conn.settimeout(_MESSAGE_TIMEOUT_SEC)
+            conn.connect(self.socket_path)
+            _send(conn, message)
+            reply = _receive(conn)
+        except (socket.error, ValueError) as e:
+            raise JobsUnavailableError(
+                'The job process did not answer: {}'.format(e))
+        finally:
+            conn.close()
+        if reply is None:
+            raise JobsUnavailableError('The job process did not answer')
+        if 'error' in reply:
+            raise JobsUnavailableError(reply['error'])
+        return reply
+
+    def submit(self, request, token=None, user_id=None):
+        '''
+        Queues a JSON-RPC request dict in the job process and returns the
+        job id. Raises JobsUnavailableError if the job process does not
+        take it.
+        '''
+        return self._call({'call': 'submit', 'request': request,
+                           'token': token, 'user_id': user_id})['job_id']
+
+    def _submit(self, request, token, user_id):
+        # runs in the job process
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._execute('DELETE FROM jobs WHERE finished < ?',
+                      (now - self.retention,))
+        self._execute(
+            'INSERT INTO jobs (job_id, user_id, method, status, owner_pid, '
+            'submitted) VALUES (?, ?, ?, ?, ?, ?)',
+            (job_id, user_id, request['method'], QUEUED, os.getpid(), now))
+        request = dict(request, id=job_id)
+        with self._lock:
+            if self._pool is None:
+                raise JobsUnavailableError('The job process is stopping')
+            self._queue.put(user_id, (job_id, request, token))
+            self._dispatch()
+        return job_id
+
+    def _dispatch(self):
+        # called with the lock held
+        while self._running < self.max_workers and len(self._queue):
+            user_id, (job_id, request, token) = self._queue.get()
+            self._running += 1
+            # a worker is free, so the job starts now; until its first
+            # heartbeat arrives, the start counts as one
+            now = time.time()
+            self._update(
+                'UPDATE jobs SET status = ?, started = ?, heartbeat = ? '
+                'WHERE job_id = ?', (RUNNING, now, now, job_id))
+            self._dispatched[job_id] = self._pool.apply_async(
+                _run_job, (self.run, job_id, request, token, user_id,
+                           self.heartbeat_interval),
+                callback=self._completed)
+
+    def _completed(self, job_result):
+        # runs in the pool's result handler thread
+        job_id, response = job_result
+        with self._lock:
+            if self._dispatched.pop(job_id, None) is None:
+                return  # failed by a sweep, which freed its slot
+        response = json.loads(response)
+        self._finish(job_id, response.get('result'), response.get('error'))
+        with self._lock:
+            self._running -= 1
+            self._dispatch()
+
+    def stats(self):
+        '''
+        Returns the number of running jobs and the FairQueue stats of the
+        queued jobs, from the job process. Raises JobsUnavailableError if
+        it does not answer.
+        '''
+        running, queue = self._call({'call': 'stats'})['stats']
+        return running, queue
+
+    def _finish(self, job_id, result, error):
+        # a job is only finished once, so a job failed by a sweep keeps the
+        # sweep's error
+        self._update(
+            'UPDATE jobs SET status = ?, finished = ?, result = ?, '
+            'error = ? WHERE job_id = ? AND status IN (?, ?)',
+            (ERROR if error else COMPLETED, time.time(), json.dumps(result),
+             json.dumps(error), job_id, QUEUED, RUNNING))
+
+    def check(self, job_id, user_id=None):
+        '''
+        Returns the state of a job as a dict with the keys job_id, method,
+        status, finished (0 or 1), submitted, started, result and error.
+        Raises JobNotFoundError if there is no such job or it belongs to
+        another user.
+        '''
+        rows = self._execute('SELECT * FROM jobs WHERE job_id = ?',
+                             (job_id,))
+        if not rows or rows[0]['user_id'] != user_id:
+            raise JobNotFoundError('No job with id ' + str(job_id))
+        row = rows[0]
+        if row['status'] in (QUEUED, RUNNING):
+            message = self._interruption(row, time.time())
+            if message is not None:
+                self._finish(job_id, None, {
+                    'name': 'JobInterrupted', 'code': -32000,
+                    'message': message, 'error': None})
+                return self.check(job_id, user_id)
+        return {'job_id': row['job_id'],
+                'method': row['method'],
+                'status': row['status'],
+                'finished': 1 if row['status'] in (COMPLETED, ERROR) else 0,
+                'submitted': row['submitted'],
+                'started': row['started'],
+                'result': json.loads(row['result'] or 'null'),
+                'error': json.loads(row['error'] or 'null')}
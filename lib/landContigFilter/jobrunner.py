@@ -0,0 +1,333 @@
+'''
+A long-lived runner for the async jobs run from the command line.
+
+Run from the command line, each job starts a new interpreter that imports
+the service and sets it up before the job can start. The runner does that
+once: it listens on a Unix socket and runs the jobs sent to it in warm
+worker processes, forked after the service was loaded. A job reads its
+input file and writes its output file as on the command line, and what it
+prints is sent back to the submitter, which prints it and exits with the
+job's exit code.
+
+Submit a job with
+    python jobrunner.py <socket> <input_file> <output_file> [<token>]
+which exits with UNAVAILABLE if no runner could take the job, so that the
+caller can run it directly instead (see run_landContigFilter_async_job.sh).
+The runner tells the submitter when the job starts; from then on the job
+is not run again if the connection is lost, but fails.
+
+A fixed number of threads serve the connections, one per worker; further
+connections wait in a bounded queue, and are refused once it is full.
+
+This module only uses the standard library, so submitting stays cheap.
+'''
+import errno
+import fcntl
+import json
+import multiprocessing
+import os
+import select
+import signal
+import socket
+import stat
+import sys
+import tempfile
+import threading
+import traceback
+
+try:
+    import queue as _queue  # py3
+except ImportError:
+    import Queue as _queue  # py2
+
+# EX_TEMPFAIL: the job was not run, run it some other way
+UNAVAILABLE = 75
+
+# the seconds a worker gets to stop a job after its timeout before the job
+# counts as lost, e.g. with its worker
+_STOP_GRACE_SEC = 60
+
+# the seconds a submitter gets to send its job
+_READ_TIMEOUT_SEC = 30
+
+# the environment a job depends on; the runner only takes jobs submitted
+# with the same values as its own
+ENV_KEYS = ('SDK_CALLBACK_URL', 'KB_DEPLOYMENT_CONFIG')
+
+
+class RunnerUnavailable(Exception):
+    ''' The runner did not start the job. '''
+    pass
+
+
+class JobLost(Exception):
+    ''' The connection to the runner was lost after the job started. '''
+    pass
+
+
+class JobTimeout(Exception):
+    pass
+
+
+def _environment():
+    return dict((key, os.environ.get(key)) for key in ENV_KEYS)
+
+
+def _read_message(conn):
+    # reads one message only: the runner sends the result of a short job
+    # right after 'started', and the bytes after the newline are the next
+    # message's
+    data = b''
+    while not data.endswith(b'\n'):
+        chunk = conn.recv(65536, socket.MSG_PEEK)
+        if not chunk:
+            break
+        end = chunk.find(b'\n')
+        data += conn.recv(end + 1 if end >= 0 else len(chunk))
+    if not data:
+        return None
+    return json.loads(data.decode('utf-8'))
+
+
+def _send_message(conn, message):
+    conn.sendall(json.dumps(message).encode('utf-8') + b'\n')
+
+
+def _init_worker():
+    # the runner only wakes up on SIGTERM; a worker is simply stopped
+    signal.set_wakeup_fd(-1)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+
+def _timed_out(signum, frame):
+    raise JobTimeout('The job did not finish within its time limit')
+
+
+def _run_captured(run, input_file_path, output_file_path, token, timeout):
+    # executed in the main thread of a worker process, one job at a time
+    out = tempfile.TemporaryFile(mode='w+')
+    stdout, stderr = sys.stdout, sys.stderr
+    sys.stdout = sys.stderr = out
+    signal.signal(signal.SIGALRM, _timed_out)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        exit_code = run(input_file_path, output_file_path, token)
+    except Exception:
+        traceback.print_exc()
+        exit_code = 1
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        sys.stdout, sys.stderr = stdout, stderr
+    out.seek(0)
+    with out:
+        return exit_code, out.read()
+
+
+class JobRunner(object):
+    '''
+    socket_path - the Unix socket to listen on; only the user running the
+        runner may connect to it.
+    run - a picklable function run(input_file_path, output_file_path, token)
+        that runs a job and returns its exit code, e.g. process_async_cli.
+    workers - the number of worker processes, i.e. the number of jobs run
+        at once.
+    timeout - the seconds a job may run before it is stopped and fails.
+    max_waiting - the number of jobs that may wait for a worker; further
+        jobs are refused.
+    '''
+
+    def __init__(self, socket_path, run, workers=2, timeout=24 * 3600,
+                 max_waiting=32):
+        self.socket_path = os.path.abspath(socket_path)
+        self.run = run
+        self.workers = workers
+        self.timeout = timeout
+        self.max_waiting = max_waiting
+        self.environment = _environment()
+        self._pool = None
+        self._waiting = _queue.Queue(max_waiting)
+
+    def _bind(self):
+        if os.path.exists(self.socket_path):
+            try:
+                submit_socket = socket.socket(socket.AF_UNIX,
+                                              socket.SOCK_STREAM)
+                submit_socket.connect(self.socket_path)
+                submit_socket.close()
+                raise RuntimeError('A job runner is already listening on ' +
+                                   self.socket_path)
+            except socket.error:
+                # left behind by a runner that is gone
+                os.unlink(self.socket_path)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o177)
+        try:
+            server.bind(self.socket_path)
+        finally:
+            os.umask(old_umask)
+        os.chmod(self.socket_path, stat.S_IRUSR | stat.S_IWUSR)
+        server.listen(64)
+        return server
+
+    def serve_forever(self):
+        '''
+        Serves jobs until the process is terminated.
+        '''
+        server = self._bind()
+        self._pool = multiprocessing.Pool(self.workers, _init_worker)
+        # SIGTERM wakes the loop through the wakeup fd: the handler only runs
+        # in the main thread once it runs Python code again, which it would
+        # not do while waiting in accept if a thread of the pool got the
+        # signal
+        stop_fd, wake_fd = os.pipe()
+        fcntl.fcntl(wake_fd, fcntl.F_SETFL,
+                    fcntl.fcntl(wake_fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+        signal.set_wakeup_fd(wake_fd)
+        signal.signal(signal.SIGTERM, lambda signum, frame: None)
+        for _ in range(self.workers):
+            thread = threading.Thread(target=self._handle_waiting,
+                                      name='job-runner-connection')
+            thread.daemon = True
+            thread.start()
+        print('Job runner listening on {} with {} workers'.format(
+            self.socket_path, self.workers))
+        try:
+            while True:
+                try:
+                    readable = select.select([server, stop_fd], [], [])[0]
+                except (OSError, select.error) as e:
+                    if e.args[0] == errno.EINTR:
+                        continue
+                    raise
+                if stop_fd in readable:
+                    sys.exit(0)
+                conn, _ = server.accept()
+                try:
+                    self._waiting.put_nowait(conn)
+                except _queue.Full:
+                    self._refuse(conn, 'the job runner has {} jobs waiting '
+                                 'already'.format(self.max_waiting),
+                                 read_job=True)
+        finally:
+            server.close()
+            os.unlink(self.socket_path)
+            self._pool.terminate()
+
+    def _refuse(self, conn, reason, read_job=False):
+        try:
+            if read_job:
+                # the submitter sends its job before it reads the answer
+                conn.settimeout(1)
+                _read_message(conn)
+            _send_message(conn, {'refused': reason})
+        except (socket.error, ValueError):
+            pass
+        finally:
+            conn.close()
+
+    def _handle_waiting(self):
+        while True:
+            conn = self._waiting.get()
+            try:
+                self._handle(conn)
+            except Exception:
+                traceback.print_exc()
+
+    def _handle(self, conn):
+        # a worker is free: the number of handlers is the number of workers
+        try:
+            conn.settimeout(_READ_TIMEOUT_SEC)
+            job = _read_message(conn)
+            conn.settimeout(None)
+        except (socket.error, ValueError):
+            # the submitter sees the connection close before the job
+            # started, and runs the job itself
+            traceback.print_exc()
+            conn.close()
+            return
+        if job is None:
+            conn.close()
+            return
+        if job.get('environment') != self.environment:
+            self._refuse(conn, 'the job runner has a different '
+                         'environment: ' + json.dumps(self.environment))
+            return
+        try:
+            _send_message(conn, {'started': True})
+            result = self._pool.apply_async(
+                _run_captured, (self.run, job['input'], job['output'],
+                                job.get('token'), self.timeout))
+            try:
+                exit_code, output = result.get(
+                    self.timeout + _STOP_GRACE_SEC)
+            except multiprocessing.TimeoutError:
+                # e.g. the worker died; the pool starts a new one
+                exit_code, output = 1, (
+                    'The job runner lost the job: it did not finish within '
+                    '{} seconds\n'.format(self.timeout))
+            _send_message(conn, {'exit_code': exit_code, 'output': output})
+        except socket.error:
+            # the submitter sees the connection close after the job
+            # started, and fails it
+            traceback.print_exc()
+        finally:
+            conn.close()
+
+
+def submit(socket_path, input_file_path, output_file_path, token=None):
+    '''
+    Runs a job on the runner listening on socket_path and returns its exit
+    code and what it printed. Raises RunnerUnavailable if the runner did not
+    start the job, and JobLost if the connection was lost after it started.
+    '''
+    job = {'input': os.path.abspath(input_file_path),
+           'output': os.path.abspath(output_file_path),
+           'token': token,
+           'environment': _environment()}
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            conn.connect(socket_path)
+            _send_message(conn, job)
+            reply = _read_message(conn)
+        except (socket.error, ValueError) as e:
+            raise RunnerUnavailable(str(e))
+        if reply is None:
+            raise RunnerUnavailable('The job runner closed the connection')
+        if 'refused' in reply:
+            raise RunnerUnavailable(reply['refused'])
+        try:
+            reply = _read_message(conn)
+        except (socket.error, ValueError) as e:
+            raise JobLost(str(e))
+        if reply is None:
+            raise JobLost('The job runner closed the connection')
+    finally:
+        conn.close()
+    return reply['exit_code'], reply['output']
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 4 or len(sys.argv) > 5:
+        print('Usage: <program> <socket> <input_file> <output_file> '
+              '[<token_or_token_file>]')
+        sys.exit(1)
+    token = None
+    if len(sys.argv) == 5:
+        if os.path.isfile(sys.argv[4]):
+            with open(sys.argv[4]) as token_file:
+                token = token_file.read()
+        else:
+            token = sys.argv[4]
+    try:
+        exit_code, output = submit(sys.argv[1], sys.argv[2], sys.argv[3],
+                                   token)
+    except RunnerUnavailable as e:
+        sys.stderr.write('Job runner unavailable: {}\n'.format(e))
+        sys.exit(UNAVAILABLE)
+    except JobLost as e:
+        sys.stderr.write('Lost the job runner while it ran the job: '
+                         '{}\n'.format(e))
+        sys.exit(1)
+    sys.stdout.write(output)
+    sys.exit(exit_code)
@@ -56,11 +56,22 @@ class landContigFilter(object):
            by other SDK modules which call your code, or the output
            visualizations in the Narrative.  'report_name' and 'report_ref'
            are special output fields- if defined, the Narrative can
-           automatically render your Report.) -> structure: parameter
-           "report_name" of String, parameter "report_ref" of String,
-           parameter "assembly_output" of type "assembly_ref", parameter
-           "n_initial_contigs" of Long, parameter "n_contigs_removed" of
-           Long, parameter "n_contigs_remaining" of Long
+           automatically render your Report. @optional timings) -> structure:
+           parameter "report_name" of String, parameter "report_ref" of
+           String, parameter "assembly_output" of type "assembly_ref",
+           parameter "n_initial_contigs" of Long, parameter
+           "n_contigs_removed" of Long, parameter "n_contigs_remaining" of
+           Long, parameter "timings" of type "Timings" (Where the time of a
+           method call went. stages - the steps of the call in the order they
+           ran: validate, download, filter, write, save and report. A call
+           that reused the new Assembly of an identical call in progress has a
+           wait stage in place of download to save. total_seconds - the wall
+           time of the whole call. peak_rss_kb - the peak resident set size of
+           the service process, in kilobytes.) -> structure: parameter
+           "stages" of list of type "StageTime" (The wall time of one step of
+           a method call, in seconds.) -> structure: parameter "stage" of
+           String, parameter "seconds" of Double, parameter "total_seconds" of
+           Double, parameter "peak_rss_kb" of Long
         """
         return self._client.call_method(
             'landContigFilter.filter_contigs',
@@ -77,11 +88,22 @@ class landContigFilter(object):
            by other SDK modules which call your code, or the output
            visualizations in the Narrative.  'report_name' and 'report_ref'
            are special output fields- if defined, the Narrative can
-           automatically render your Report.) -> structure: parameter
-           "report_name" of String, parameter "report_ref" of String,
-           parameter "assembly_output" of type "assembly_ref", parameter
-           "n_initial_contigs" of Long, parameter "n_contigs_removed" of
-           Long, parameter "n_contigs_remaining" of Long
+           automatically render your Report. @optional timings) -> structure:
+           parameter "report_name" of String, parameter "report_ref" of
+           String, parameter "assembly_output" of type "assembly_ref",
+           parameter "n_initial_contigs" of Long, parameter
+           "n_contigs_removed" of Long, parameter "n_contigs_remaining" of
+           Long, parameter "timings" of type "Timings" (Where the time of a
+           method call went. stages - the steps of the call in the order they
+           ran: validate, download, filter, write, save and report. A call
+           that reused the new Assembly of an identical call in progress has a
+           wait stage in place of download to save. total_seconds - the wall
+           time of the whole call. peak_rss_kb - the peak resident set size of
+           the service process, in kilobytes.) -> structure: parameter
+           "stages" of list of type "StageTime" (The wall time of one step of
+           a method call, in seconds.) -> structure: parameter "stage" of
+           String, parameter "seconds" of Double, parameter "total_seconds" of
+           Double, parameter "peak_rss_kb" of Long
         """
         return self._client.call_method(
             'landContigFilter.filter_contigs_max',
@@ -89,12 +111,29 @@ class landContigFilter(object):
 
     def assembly_metadata_report(self, params, context=None):
         """
-        :param params: instance of type "AssemblyMetadataReportParams" ->
-           structure: parameter "assembly_input_ref" of type "assembly_ref",
-           parameter "workspace_name" of String, parameter "showContigs" of
-           type "boolean" (A boolean. 0 = false, other = true.)
-        :returns: instance of type "AssemblyMetadataResults" -> structure:
-           parameter "report_name" of String, parameter "report_ref" of String
+        :param params: instance of type "AssemblyMetadataReportParams"
+           (assembly_input_refs - a list of Assembly or AssemblySet
+           references to report on together with assembly_input_ref. All of
+           them are fetched with a single batched get_objects call.
+           @optional assembly_input_ref assembly_input_refs) -> structure:
+           parameter "assembly_input_ref" of type "assembly_ref", parameter
+           "assembly_input_refs" of list of type "assembly_ref", parameter
+           "workspace_name" of String, parameter "showContigs" of type
+           "boolean" (A boolean. 0 = false, other = true.)
+        :returns: instance of type "AssemblyMetadataResults" (@optional
+           timings) -> structure: parameter "report_name" of String, parameter
+           "report_ref" of String, parameter "report_content" of String,
+           parameter "timings" of type "Timings" (Where the time of a method
+           call went. stages - the steps of the call in the order they ran:
+           validate, download, filter, write, save and report. A call that
+           reused the new Assembly of an identical call in progress has a wait
+           stage in place of download to save. total_seconds - the wall time
+           of the whole call. peak_rss_kb - the peak resident set size of the
+           service process, in kilobytes.) -> structure: parameter "stages" of
+           list of type "StageTime" (The wall time of one step of a method
+           call, in seconds.) -> structure: parameter "stage" of String,
+           parameter "seconds" of Double, parameter "total_seconds" of Double,
+           parameter "peak_rss_kb" of Long
         """
         return self._client.call_method(
             'landContigFilter.assembly_metadata_report',
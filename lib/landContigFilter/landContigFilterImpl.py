@@ -2,12 +2,18 @@
 #BEGIN_HEADER
 # The header block is where all import statments should live
 import os
+import re
+import shutil
 import uuid
-from Bio import SeqIO
-from pprint import pprint, pformat
+from xml.sax.saxutils import escape
+from landContigFilter.asynclog import brief
 from AssemblyUtil.AssemblyUtilClient import AssemblyUtil
 from KBaseReport.KBaseReportClient import KBaseReport
 from DataFileUtil.DataFileUtilClient import DataFileUtil
+from landContigFilter import columnar
+from landContigFilter.clientregistry import ClientRegistry
+from landContigFilter.singleflight import SingleFlight
+from landContigFilter.stagetimer import StageTimer, format_timings
 #END_HEADER
 
 
@@ -46,7 +52,7 @@ This sample module contains one small method - filter_contigs.
         # Make HTML folder
         html_folder = os.path.join(read_file_path, 'html')
         os.mkdir(html_folder)
-        for file in os.listdir(read_file_path):
+        for file in sorted(os.listdir(read_file_path)):
             label = ".".join(file.split(".")[1:])
             if (file.endswith(".zip")):
                 desc = 'Zip file generated by fastqc that contains ' + \
@@ -55,6 +61,20 @@ This sample module contains one small method - filter_contigs.
                                          'name': file,
                                          'label': label,
                                          'description': desc})
+            if (file.endswith(".tsv")):
+                desc = 'Per-contig table (contig_id, length, gc_content, ' + \
+                       'description) as tab-separated text'
+                output_zip_files.append({'path': os.path.join(read_file_path, file),
+                                         'name': file,
+                                         'label': label,
+                                         'description': desc})
+            if (file.endswith(columnar.EXTENSION)):
+                desc = 'Per-contig table in a columnar binary layout ' + \
+                       'that can be memory-mapped (see landContigFilter.columnar)'
+                output_zip_files.append({'path': os.path.join(read_file_path, file),
+                                         'name': file,
+                                         'label': label,
+                                         'description': desc})
             if (file.endswith(".html")):
                 # Move html into html folder
                 shutil.move(os.path.join(read_file_path, file), os.path.join(html_folder, file))
@@ -76,9 +96,10 @@ This sample module contains one small method - filter_contigs.
         with open(os.path.join(html_folder, "index.html"), 'w') as index_file:
             index_file.write(html_string)
 
-        shock = self.dfu.file_to_shock({'file_path': html_folder,
-                                        'make_handle': 0,
-                                        'pack': 'zip'})
+        dfu = self.clients.get(DataFileUtil, token)
+        shock = dfu.file_to_shock({'file_path': html_folder,
+                                   'make_handle': 0,
+                                   'pack': 'zip'})
         desc = 'HTML files generated by fastqc that contains report on ' + \
                'quality of reads'
         output_html_files.append({'shock_id': shock['shock_id'],
@@ -93,10 +114,139 @@ This sample module contains one small method - filter_contigs.
             'workspace_name': ws,
             'report_object_name': 'kb_fastqc_report_' + uuid_string
         }
-        kbase_report_client = KBaseReport(self.callback_url, token=token)
+        kbase_report_client = self.clients.get(KBaseReport, token)
         output = kbase_report_client.create_extended_report(report_params)
         return output
 
+    def get_assembly_objects(self, dfu, refs):
+        """
+        Fetch the Assembly objects for refs with a single get_objects call.
+        AssemblySets are expanded in place; all of their items are fetched
+        together with one more get_objects call.  Returns a list of
+        (ref, object_data) tuples in input order.
+        """
+        objects = dfu.get_objects({'object_refs': refs})['data']
+        slots = []
+        item_refs = []
+        for ref, obj in zip(refs, objects):
+            if obj['info'][2].startswith('KBaseSets.AssemblySet'):
+                refs_in_set = [ref + ';' + item['ref'] for item in obj['data']['items']]
+                slots.append(refs_in_set)
+                item_refs.extend(refs_in_set)
+            else:
+                slots.append((ref, obj))
+        items = {}
+        if item_refs:
+            item_objects = dfu.get_objects({'object_refs': item_refs})['data']
+            items = dict(zip(item_refs, item_objects))
+        assemblies = []
+        for slot in slots:
+            if isinstance(slot, tuple):
+                assemblies.append(slot)
+            else:
+                assemblies.extend((item_ref, items[item_ref]) for item_ref in slot)
+        return assemblies
+
+    def assembly_metadata_text(self, assembly_ref, assembly):
+        assembly_metadata = assembly['data']
+        string = "\nAssembly Metadata: " + assembly['info'][1] + " (" + assembly_ref + ")\n"
+        for item in ['assembly_id', 'dna_size', 'gc_content', 'num_contigs',
+                     'fasta_handle_ref', 'md5', 'type', 'taxon_ref']:
+            if item in assembly_metadata:
+                string += "\t{:20} = {}".format(item, assembly_metadata[item]) + "\n"
+
+        if 'fasta_handle_info' in assembly_metadata and 'node_file_name' in assembly_metadata['fasta_handle_info']:
+            string += "\tfilename             = " + assembly_metadata['fasta_handle_info']['node_file_name'] + "\n"
+        string += "BASE counts\n"
+        for base in assembly_metadata.get('base_counts', {}):
+            string += "\t{:5} = {}".format(base, str(assembly_metadata['base_counts'][base])) + "\n"
+        string += "\nName\tLength\tGC content\tContigID\tDescription\n"
+        if 'contigs' in assembly_metadata:
+            myContig = assembly_metadata['contigs']
+            for ctg in myContig:
+                string += ctg
+                for item in ['length', 'gc_content', 'contig_id', 'description']:
+                    if item in myContig[ctg]:
+                        string += "\t{}".format(myContig[ctg][item])
+                    else:
+                        string += "\t"
+                string += "\n"
+        return string
+
+    def assembly_comparison_text(self, assemblies):
+        columns = ['dna_size', 'num_contigs', 'gc_content', 'md5']
+        string = "\nAssembly Comparison\n"
+        string += "Name\tRef\tDNA size\tContigs\tGC content\tMD5\n"
+        for assembly_ref, assembly in assemblies:
+            string += assembly['info'][1] + "\t" + assembly_ref
+            for item in columns:
+                string += "\t{}".format(assembly['data'].get(item, ''))
+            string += "\n"
+        return string
+
+    def filter_assembly(self, token, assembly_input_ref, workspace_name, keep, timer):
+        """
+        Download the Assembly, keep the contigs for which keep(record) is true
+        and save them as a new Assembly in workspace_name.  Returns
+        (new_assembly_ref, n_total, n_remaining).
+        """
+        # Bio.SeqIO takes longer to import than the rest of the service, so it
+        # is imported on first use rather than by every process at startup
+        # (see preload-modules in deploy.cfg)
+        from Bio import SeqIO
+        print('Downloading Assembly data as a Fasta file.')
+        timer.start('download')
+        assemblyUtil = self.clients.get(AssemblyUtil, token)
+        fasta_file = assemblyUtil.get_assembly_as_fasta({'ref': assembly_input_ref})
+
+        timer.start('filter')
+        good_contigs = []
+        n_total = 0
+        n_remaining = 0
+        for record in SeqIO.parse(fasta_file['path'], 'fasta'):
+            n_total += 1
+            if keep(record):
+                good_contigs.append(record)
+                n_remaining += 1
+
+        print('Filtered Assembly to ' + str(n_remaining) + ' contigs out of ' + str(n_total))
+        timer.start('write')
+        filtered_fasta_file = os.path.join(self.shared_folder, 'filtered_' + str(uuid.uuid4()) + '.fasta')
+        SeqIO.write(good_contigs, filtered_fasta_file, 'fasta')
+
+        timer.start('save')
+        print('Uploading filtered Assembly data.')
+        new_assembly = assemblyUtil.save_assembly_from_fasta({'file': {'path': filtered_fasta_file},
+                                                              'workspace_name': workspace_name,
+                                                              'assembly_name': fasta_file['assembly_name']
+                                                              })
+        return new_assembly, n_total, n_remaining
+
+    def shared_filter_assembly(self, ctx, key, assembly_input_ref, workspace_name, keep, timer):
+        """
+        filter_assembly, shared with identical calls in progress in this
+        server process: the same user, method, input, thresholds and
+        workspace.  A call that arrives while an identical one runs waits for
+        it and reuses the new Assembly, or gets its error; only the report is
+        made per call.  Calls handled by other server processes do not share.
+
+        Calls of other users never share a run, not even users of a shared
+        Narrative: the run reads the input and saves to the workspace with
+        the first caller's token, so a waiting user would get an Assembly
+        without this service checking that they may read the input or write
+        the workspace, and saved under another user's name.  Sharing between
+        users needs both checks per call against the Workspace, which this
+        service has no client for.
+        """
+        (new_assembly, n_total, n_remaining), shared = self.in_flight.do(
+            (ctx['user_id'],) + key,
+            lambda: self.filter_assembly(ctx['token'], assembly_input_ref,
+                                         workspace_name, keep, timer),
+            lambda: timer.start('wait'))
+        if shared:
+            print('Reused the filtered Assembly ' + new_assembly + ' of an identical call in progress.')
+        return new_assembly, n_total, n_remaining
+
     #END_CLASS_HEADER
 
     # config contains contents of config file in a hash or None if it couldn't
@@ -109,6 +259,10 @@ This sample module contains one small method - filter_contigs.
         self.callback_url = os.environ['SDK_CALLBACK_URL']
         self.scratch = os.path.abspath(config['scratch'])
         self.shared_folder = config['scratch']
+        # service clients are reused across calls and threads
+        self.clients = ClientRegistry(self.callback_url)
+        # identical filter calls in progress share one run
+        self.in_flight = SingleFlight()
 
         #END_CONSTRUCTOR
         pass
@@ -137,25 +291,39 @@ This sample module contains one small method - filter_contigs.
            by other SDK modules which call your code, or the output
            visualizations in the Narrative.  'report_name' and 'report_ref'
            are special output fields- if defined, the Narrative can
-           automatically render your Report.) -> structure: parameter
-           "report_name" of String, parameter "report_ref" of String,
-           parameter "assembly_output" of type "assembly_ref", parameter
-           "n_initial_contigs" of Long, parameter "n_contigs_removed" of
-           Long, parameter "n_contigs_remaining" of Long
+           automatically render your Report. @optional timings) -> structure:
+           parameter "report_name" of String, parameter "report_ref" of
+           String, parameter "assembly_output" of type "assembly_ref",
+           parameter "n_initial_contigs" of Long, parameter
+           "n_contigs_removed" of Long, parameter "n_contigs_remaining" of
+           Long, parameter "timings" of type "Timings" (Where the time of a
+           method call went. stages - the steps of the call in the order they
+           ran: validate, download, filter, write, save and report. A call
+           that reused the new Assembly of an identical call in progress has a
+           wait stage in place of download to save. total_seconds - the wall
+           time of the whole call. peak_rss_kb - the peak resident set size of
+           the service process, in kilobytes.) -> structure: parameter
+           "stages" of list of type "StageTime" (The wall time of one step of
+           a method call, in seconds.) -> structure: parameter "stage" of
+           String, parameter "seconds" of Double, parameter "total_seconds" of
+           Double, parameter "peak_rss_kb" of Long
         """
         # ctx is the context object
         # return variables are: output
         #BEGIN filter_contigs
 
+        timer = StageTimer()
+
         # Print statements to stdout/stderr are captured and available as the App log
         print('Starting Filter Contigs function. Params=')
-        pprint(params)
+        print(brief(params))
 
         # Step 1 - Parse/examine the parameters and catch any errors
         # It is important to check that parameters exist and are defined, and that nice error
         # messages are returned to users.  Parameter values go through basic validation when
         # defined in a Narrative App, but advanced users or other SDK developers can call
         # this function directly, so validation is still important.
+        timer.start('validate')
         print('Validating parameters.')
         if 'workspace_name' not in params:
             raise ValueError('Parameter workspace_name is not set in input arguments')
@@ -175,44 +343,23 @@ This sample module contains one small method - filter_contigs.
             raise ValueError('min_length parameter cannot be negative (' + str(min_length) + ')')
 
 
-        # Step 2 - Download the input data as a Fasta and
+        # Steps 2 to 4 - Download the input data as a Fasta, filter the contigs with BioPython
+        # and save the new Assembly back to the system.  Identical calls of a user in progress,
+        # e.g. from a Narrative open in several tabs, do this only once.
         # We can use the AssemblyUtils module to download a FASTA file from our Assembly data object.
-        # The return object gives us the path to the file that was created.
-        print('Downloading Assembly data as a Fasta file.')
-        assemblyUtil = AssemblyUtil(self.callback_url)
-        fasta_file = assemblyUtil.get_assembly_as_fasta({'ref': assembly_input_ref})
-
-
-        # Step 3 - Actually perform the filter operation, saving the good contigs to a new fasta file.
-        # We can use BioPython to parse the Fasta file and build and save the output to a file.
-        good_contigs = []
-        n_total = 0
-        n_remaining = 0
-        for record in SeqIO.parse(fasta_file['path'], 'fasta'):
-            n_total += 1
-            if len(record.seq) >= min_length:
-                good_contigs.append(record)
-                n_remaining += 1
-
-        print('Filtered Assembly to ' + str(n_remaining) + ' contigs out of ' + str(n_total))
-        filtered_fasta_file = os.path.join(self.shared_folder, 'filtered.fasta')
-        SeqIO.write(good_contigs, filtered_fasta_file, 'fasta')
-
-
-        # Step 4 - Save the new Assembly back to the system
-        print('Uploading filtered Assembly data.')
-        new_assembly = assemblyUtil.save_assembly_from_fasta({'file': {'path': filtered_fasta_file},
-                                                              'workspace_name': workspace_name,
-                                                              'assembly_name': fasta_file['assembly_name']
-                                                              })
+        new_assembly, n_total, n_remaining = self.shared_filter_assembly(
+            ctx, ('filter_contigs', assembly_input_ref, workspace_name, min_length),
+            assembly_input_ref, workspace_name,
+            lambda record: len(record.seq) >= min_length, timer)
 
 
         # Step 5 - Build a Report and return
+        timer.start('report')
         reportObj = {
             'objects_created': [{'ref': new_assembly, 'description': 'Filtered contigs'}],
             'text_message': 'Filtered Assembly to ' + str(n_remaining) + ' contigs out of ' + str(n_total)
         }
-        report = KBaseReport(self.callback_url)
+        report = self.clients.get(KBaseReport, ctx['token'])
         report_info = report.create({'report': reportObj, 'workspace_name': params['workspace_name']})
 
 
@@ -222,9 +369,11 @@ This sample module contains one small method - filter_contigs.
                   'assembly_output': new_assembly,
                   'n_initial_contigs': n_total,
                   'n_contigs_removed': n_total - n_remaining,
-                  'n_contigs_remaining': n_remaining
+                  'n_contigs_remaining': n_remaining,
+                  'timings': timer.stop()
                   }
-        print('returning:' + pformat(output))
+        print('Timings: ' + format_timings(output['timings']))
+        print('returning:' + brief(output))
                 
         #END filter_contigs
 
@@ -246,25 +395,39 @@ This sample module contains one small method - filter_contigs.
            by other SDK modules which call your code, or the output
            visualizations in the Narrative.  'report_name' and 'report_ref'
            are special output fields- if defined, the Narrative can
-           automatically render your Report.) -> structure: parameter
-           "report_name" of String, parameter "report_ref" of String,
-           parameter "assembly_output" of type "assembly_ref", parameter
-           "n_initial_contigs" of Long, parameter "n_contigs_removed" of
-           Long, parameter "n_contigs_remaining" of Long
+           automatically render your Report. @optional timings) -> structure:
+           parameter "report_name" of String, parameter "report_ref" of
+           String, parameter "assembly_output" of type "assembly_ref",
+           parameter "n_initial_contigs" of Long, parameter
+           "n_contigs_removed" of Long, parameter "n_contigs_remaining" of
+           Long, parameter "timings" of type "Timings" (Where the time of a
+           method call went. stages - the steps of the call in the order they
+           ran: validate, download, filter, write, save and report. A call
+           that reused the new Assembly of an identical call in progress has a
+           wait stage in place of download to save. total_seconds - the wall
+           time of the whole call. peak_rss_kb - the peak resident set size of
+           the service process, in kilobytes.) -> structure: parameter
+           "stages" of list of type "StageTime" (The wall time of one step of
+           a method call, in seconds.) -> structure: parameter "stage" of
+           String, parameter "seconds" of Double, parameter "total_seconds" of
+           Double, parameter "peak_rss_kb" of Long
         """
         # ctx is the context object
         # return variables are: output
         #BEGIN filter_contigs_max
 
+        timer = StageTimer()
+
         # Print statements to stdout/stderr are captured and available as the App log
         print('Starting Filter Contigs Min/Max function. Params=')
-        pprint(params)
+        print(brief(params))
 
         # Step 1 - Parse/examine the parameters and catch any errors
         # It is important to check that parameters exist and are defined, and that nice error
         # messages are returned to users.  Parameter values go through basic validation when
         # defined in a Narrative App, but advanced users or other SDK developers can call
         # this function directly, so validation is still important.
+        timer.start('validate')
         print('Validating parameters.')
         if 'workspace_name' not in params:
             raise ValueError('Parameter workspace_name is not set in input arguments')
@@ -294,44 +457,23 @@ This sample module contains one small method - filter_contigs.
             raise ValueError('max_length parameter cannot be less than min_length (' + str(max_length) + ')')
 
 
-        # Step 2 - Download the input data as a Fasta and
+        # Steps 2 to 4 - Download the input data as a Fasta, filter the contigs with BioPython
+        # and save the new Assembly back to the system.  Identical calls of a user in progress,
+        # e.g. from a Narrative open in several tabs, do this only once.
         # We can use the AssemblyUtils module to download a FASTA file from our Assembly data object.
-        # The return object gives us the path to the file that was created.
-        print('Downloading Assembly data as a Fasta file.')
-        assemblyUtil = AssemblyUtil(self.callback_url)
-        fasta_file = assemblyUtil.get_assembly_as_fasta({'ref': assembly_input_ref})
-
-
-        # Step 3 - Actually perform the filter operation, saving the good contigs to a new fasta file.
-        # We can use BioPython to parse the Fasta file and build and save the output to a file.
-        good_contigs = []
-        n_total = 0
-        n_remaining = 0
-        for record in SeqIO.parse(fasta_file['path'], 'fasta'):
-            n_total += 1
-            if len(record.seq) >= min_length and len(record.seq) <= max_length:
-                good_contigs.append(record)
-                n_remaining += 1
-
-        print('Filtered Assembly to ' + str(n_remaining) + ' contigs out of ' + str(n_total))
-        filtered_fasta_file = os.path.join(self.shared_folder, 'filtered.fasta')
-        SeqIO.write(good_contigs, filtered_fasta_file, 'fasta')
-
-
-        # Step 4 - Save the new Assembly back to the system
-        print('Uploading filtered Assembly data.')
-        new_assembly = assemblyUtil.save_assembly_from_fasta({'file': {'path': filtered_fasta_file},
-                                                              'workspace_name': workspace_name,
-                                                              'assembly_name': fasta_file['assembly_name']
-                                                              })
+        new_assembly, n_total, n_remaining = self.shared_filter_assembly(
+            ctx, ('filter_contigs_max', assembly_input_ref, workspace_name, min_length, max_length),
+            assembly_input_ref, workspace_name,
+            lambda record: len(record.seq) >= min_length and len(record.seq) <= max_length, timer)
 
 
         # Step 5 - Build a Report and return
+        timer.start('report')
         reportObj = {
             'objects_created': [{'ref': new_assembly, 'description': 'Filtered contigs'}],
             'text_message': 'Filtered Assembly to ' + str(n_remaining) + ' contigs out of ' + str(n_total)
         }
-        report = KBaseReport(self.callback_url)
+        report = self.clients.get(KBaseReport, ctx['token'])
         report_info = report.create({'report': reportObj, 'workspace_name': params['workspace_name']})
 
 
@@ -341,9 +483,11 @@ This sample module contains one small method - filter_contigs.
                   'assembly_output': new_assembly,
                   'n_initial_contigs': n_total,
                   'n_contigs_removed': n_total - n_remaining,
-                  'n_contigs_remaining': n_remaining
+                  'n_contigs_remaining': n_remaining,
+                  'timings': timer.stop()
                   }
-        print('returning:' + pformat(output))
+        print('Timings: ' + format_timings(output['timings']))
+        print('returning:' + brief(output))
                 
         #END filter_contigs_max
 
@@ -356,38 +500,61 @@ This sample module contains one small method - filter_contigs.
 
     def assembly_metadata_report(self, ctx, params):
         """
-        :param params: instance of type "AssemblyMetadataReportParams" ->
-           structure: parameter "assembly_input_ref" of type "assembly_ref",
-           parameter "workspace_name" of String, parameter "showContigs" of
-           type "boolean" (A boolean. 0 = false, other = true.)
-        :returns: instance of type "AssemblyMetadataResults" -> structure:
-           parameter "report_name" of String, parameter "report_ref" of String
+        :param params: instance of type "AssemblyMetadataReportParams"
+           (assembly_input_refs - a list of Assembly or AssemblySet
+           references to report on together with assembly_input_ref. All of
+           them are fetched with a single batched get_objects call.
+           @optional assembly_input_ref assembly_input_refs) -> structure:
+           parameter "assembly_input_ref" of type "assembly_ref", parameter
+           "assembly_input_refs" of list of type "assembly_ref", parameter
+           "workspace_name" of String, parameter "showContigs" of type
+           "boolean" (A boolean. 0 = false, other = true.)
+        :returns: instance of type "AssemblyMetadataResults" (@optional
+           timings) -> structure: parameter "report_name" of String, parameter
+           "report_ref" of String, parameter "report_content" of String,
+           parameter "timings" of type "Timings" (Where the time of a method
+           call went. stages - the steps of the call in the order they ran:
+           validate, download, filter, write, save and report. A call that
+           reused the new Assembly of an identical call in progress has a wait
+           stage in place of download to save. total_seconds - the wall time
+           of the whole call. peak_rss_kb - the peak resident set size of the
+           service process, in kilobytes.) -> structure: parameter "stages" of
+           list of type "StageTime" (The wall time of one step of a method
+           call, in seconds.) -> structure: parameter "stage" of String,
+           parameter "seconds" of Double, parameter "total_seconds" of Double,
+           parameter "peak_rss_kb" of Long
         """
  
         # ctx is the context object
         # return variables are: output
         #BEGIN assembly_metadata_report
 
+        timer = StageTimer()
         token = ctx['token']
         uuid_string = str(uuid.uuid4())
         write_file_path = self.scratch+"/"+uuid_string
+        os.makedirs(write_file_path)
 
         # Print statements to stdout/stderr are captured and available as the App log
         print('Starting Assembly MetaData Report Function. Params=')
-        pprint(params)
+        print(brief(params))
 
         # Step 1 - Parse/examine the parameters and catch any errors
         # It is important to check that parameters exist and are defined, and that nice error
         # messages are returned to users.  Parameter values go through basic validation when
         # defined in a Narrative App, but advanced users or other SDK developers can call
         # this function directly, so validation is still important.
+        timer.start('validate')
         print('Validating parameters.')
         if 'workspace_name' not in params:
             raise ValueError('Parameter workspace_name is not set in input arguments')
         workspace_name = params['workspace_name']
-        if 'assembly_input_ref' not in params:
+        assembly_input_refs = []
+        for ref in [params.get('assembly_input_ref')] + list(params.get('assembly_input_refs') or []):
+            if ref and ref not in assembly_input_refs:
+                assembly_input_refs.append(ref)
+        if not assembly_input_refs:
             raise ValueError('Parameter assembly_input_ref is not set in input arguments')
-        assembly_input_ref = params['assembly_input_ref']
         if 'showContigs' not in params:
             raise ValueError('Parameter showContigs is not set in input arguments')
         showContigs_orig = params['showContigs']
@@ -400,103 +567,51 @@ This sample module contains one small method - filter_contigs.
             raise ValueError('showContigs parameter cannot be negative (' + str(showContigs) + ')')
         if showContigs > 1:
             raise ValueError('showContigs parameter cannot be greater than one (' + str(showContigs) + ')')
-       
 
-        # Step 2 - Download the input data as a Fasta and
-        # We can use the AssemblyUtils module to download a FASTA file from our Assembly data object.
-        # The return object gives us the path to the file that was created.
-        print('Downloading Assembly data as a Fasta file.')
-#        assemblyUtil = AssemblyUtil(self.callback_url)
-#        fasta_file = assemblyUtil.get_assembly_as_fasta({'ref': assembly_input_ref})
 
+        # Step 2 - Download the Assembly objects
+        # All of the requested Assemblies (and the members of any AssemblySet) are fetched
+        # with batched get_objects calls rather than one round trip per Assembly.
+        timer.start('download')
+        print('Downloading ' + str(len(assembly_input_refs)) + ' Assembly object(s).')
+        data_file_cli = self.clients.get(DataFileUtil, token)
+        assemblies = self.get_assembly_objects(data_file_cli, assembly_input_refs)
 
-        # Step 3 - Actually perform the filter operation, saving the good contigs to a new fasta file.
-        # We can use BioPython to parse the Fasta file and build and save the output to a file.
 
-        data_file_cli = DataFileUtil(self.callback_url)
-#        assembly_metadata = data_file_cli.get_objects({'object_refs': ['assembly_input_ref']})['data'][0]['data']
-        assembly = data_file_cli.get_objects({'object_refs': [assembly_input_ref]})
-        assembly_metadata = assembly['data'][0]['data']
-        
-        string =  "\nAssembly Metadata\n"
-        list = ['assembly_id', 'dna_size', 'gc_content', 'num_contigs', 
-               'fasta_handle_ref', 'md5', 'type', 'taxon_ref']
-        for item in list:
-            if item in assembly_metadata:
-                string += "\t{:20} = {}".format(item,assembly_metadata[item]) + "\n"
-
-        if 'fasta_handle_info' in assembly_metadata and 'node_file_name' in assembly_metadata['fasta_handle_info']:     
-            string += "\tfilename             = " + assembly_metadata['fasta_handle_info']['node_file_name'] + "\n"
-        string += "BASE counts\n"
-        for base in assembly_metadata['base_counts']:
-#            string += "\t" + base + str(assembly_metadata['base_counts'][base]) + "\n"
-            string += "\t{:5} = {}".format(base,str(assembly_metadata['base_counts'][base])) + "\n"
-        string +=  "\nName\tLength\tGC content\tContigID\tDescription\n" 
-        if 'contigs' in assembly_metadata:
-            myContig = assembly_metadata['contigs']
-            for ctg in myContig:
-                list = ['length', 'gc_content', 'contig_id', 'description']
-                string += ctg 
-#                describeDict(myContig[ctg])
-                for item in list:
-                    if item in myContig[ctg]:
-                        string += "\t{}".format(myContig[ctg][item])  
-                    else:
-                        string += "\t"
-                string += "\n"
+        # Step 3 - Build the comparative table and one report page per Assembly
+        timer.start('write')
+        comparison = self.assembly_comparison_text(assemblies)
+        pages = [('comparison', comparison)]
+        for assembly_ref, assembly in assemblies:
+            pages.append((assembly['info'][1],
+                          self.assembly_metadata_text(assembly_ref, assembly)))
 
+        string = "\n\n".join(page_text for _, page_text in pages)
         report_path = os.path.join(write_file_path, 'assembly_metadata_report.txt')
-        report_txt = open(report_path,"w")
-        report_txt.write(string)
-        report_txt.close()
-#        with open('assembly_metadata_report.txt',"w") as report_txt:
-#            report_txt.write(string)
-#        with open('assembly_metadata_report.html',"w") as report_txt:
-#            report_txt.write(string)
-#        output_file = [] 
-#        output_file.append({'path' : os.path.join(self.shared_folder, 'assembly_metadata_report.txt'),
-#                            'name' : 'assembly_metadata_report.txt',
-#                            'label' : 'AssemblyMetadata.label',
-#                            'description' : 'Text output for the assembly metadata'})
-#        html_file = [] 
-#        html_file.append({'path' : os.path.join(self.shared_folder, 'assembly_metadata_report.html'),
-#                           'name' : 'assembly_metadata_report.html',
-#                           'label' : 'AssemblyMetadata.label.html',
-#                           'description' : 'Text output for the assembly metadata'})
-
-        print string
+        with open(report_path, "w") as report_txt:
+            report_txt.write(string)
+        for i, (page_name, page_text) in enumerate(pages):
+            page_file = '{:03d}.{}.html'.format(i, re.sub(r'[^\w\-]', '_', page_name))
+            with open(os.path.join(write_file_path, page_file), "w") as report_html:
+                report_html.write('<html><body><pre>' + escape(page_text) + '</pre></body></html>')
 
-        # Step 5 - Build a Report and return
-#        report_params = {'message': string,
-#                         'direct_html_link_index': 0,
-#                         'html_links': [html_file],
-#                         'file_links': [output_file],
-#                         'report_object_name': 'assembly_metadata_report_' + str(uuid.uuid4()),
-#                         'workspace_name': params['workspace_name']
-#                        }
-#        reportObj = {
-#            'objects_created': [{'ref': 'assembly_metadata_report_' + str(uuid.uuid4()), 'description': 'AssemblyMetadata'}],
-#            'report_object_name' : 'assembly_metadata_report',
-#            'text_message':  "\n" + string
-#        }
-#        report = KBaseReport(self.callback_url)
-#        report_info = report.create_extended_report({'report': reportObj, 'workspace_name': params['workspace_name']})
-#        report_info = report.create_extended_report(report_params)
+        # The per-contig data is also exported as a TSV and as contiguous columns
+        contigs = columnar.contig_rows(assemblies)
+        columnar.write_tsv(os.path.join(write_file_path, 'assembly_metadata.contigs.tsv'), contigs)
+        columnar.write_columns(os.path.join(write_file_path,
+                                            'assembly_metadata.contigs' + columnar.EXTENSION), contigs)
 
-        # STEP 6: contruct the output to send back
-#        output = {'report_name': 'My_report',
-#        'report_ref': report_info['ref']
-#                   }
-
-        output = self.create_report(token, params['workspace_name'],
-                                    uuid_string, write_file_path)
-
-        reported_output = {'report_name': output['name'],
-                           'report_ref': output['ref']}
+        print(comparison)
 
 
+        # Step 4 - Build a Report and return
+        timer.start('report')
+        output = self.create_report(token, workspace_name,
+                                    uuid_string, write_file_path)
+        output['timings'] = timer.stop()
+        print('Timings: ' + format_timings(output['timings']))
 
-        print('returning: ' + pformat(output) )
+        print('returning: ' + brief(output) )
         #END assembly_metadata_report
 
         # At some point might do deeper type checking...
@@ -1,11 +1,22 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+from landContigFilter.stagetimer import StageTimer
+# the time this process takes to be ready to serve, exported as metrics
+STARTUP = StageTimer()
+STARTUP.start('imports')
 from wsgiref.simple_server import make_server
 import sys
 import json
 import traceback
 import datetime
+import time
+import threading
+import zlib
+import importlib
+import hmac
+import tempfile
 from multiprocessing import Process
+from multiprocessing.pool import ThreadPool
 from getopt import getopt, GetoptError
 from jsonrpcbase import JSONRPCService, InvalidParamsError, KeywordError,\
     JSONRPCError, InvalidRequestError
@@ -17,14 +28,66 @@ import requests as _requests
 import random as _random
 import os
 from landContigFilter.authclient import KBaseAuth as _KBaseAuth
+from landContigFilter.baseclient import merge_call_stats, format_call_stats
+from landContigFilter import metrics
+from landContigFilter.profiling import RequestProfiler
+from landContigFilter.asynclog import AsyncLogWriter
+from landContigFilter.jobmanager import (JobManager, JobNotFoundError,
+                                         JobsUnavailableError)
+from landContigFilter.admission import (
+    AdmissionController, AdmissionRejected, parse_limits)
+from landContigFilter.fairqueue import parse_weights
+from landContigFilter.jobrunner import JobRunner
 
 DEPLOY = 'KB_DEPLOYMENT_CONFIG'
 SERVICE = 'KB_SERVICE_NAME'
 AUTH = 'auth-service-url'
 
+# request and response body compression
+ACCEPTED_ENCODINGS = 'gzip, deflate'
+_WBITS = {'gzip': 16 + zlib.MAX_WBITS, 'x-gzip': 16 + zlib.MAX_WBITS,
+          'deflate': zlib.MAX_WBITS}
+
+# the methods that can also be run as local jobs
+JOB_METHODS = ['landContigFilter.filter_contigs',
+               'landContigFilter.filter_contigs_max',
+               'landContigFilter.assembly_metadata_report']
+
+# upper bounds of the payload size histogram buckets, in bytes
+_SIZE_BUCKETS = (1024, 16 * 1024, 256 * 1024, 1024 * 1024, 16 * 1024 * 1024,
+                 256 * 1024 * 1024)
+
+METRICS = metrics.Registry()
+RPC_DURATION = METRICS.histogram(
+    'landcontigfilter_rpc_duration_seconds',
+    'Wall time of RPC method calls.', ('method',))
+RPC_IN_FLIGHT = METRICS.gauge(
+    'landcontigfilter_rpc_in_flight', 'RPC method calls in progress.',
+    ('method',))
+RPC_ERRORS = METRICS.counter(
+    'landcontigfilter_rpc_errors_total',
+    'RPC requests answered with an error.', ('method',))
+RPC_REQUEST_BYTES = METRICS.histogram(
+    'landcontigfilter_rpc_request_bytes',
+    'Size of RPC request bodies as received.', ('method',), _SIZE_BUCKETS)
+RPC_REJECTED = METRICS.counter(
+    'landcontigfilter_rpc_rejected_total',
+    'RPC calls rejected by admission control.', ('method',))
+RPC_RESPONSE_BYTES = METRICS.histogram(
+    'landcontigfilter_rpc_response_bytes',
+    'Size of RPC response bodies as sent.', ('method',), _SIZE_BUCKETS)
+
 # Note that the error fields do not match the 2.0 JSONRPC spec
 
 
+class ServerBusyError(JSONRPCError):
+    code = -32001
+    message = 'Server busy'
+
+    def __init__(self, data=None):
+        self.data = data
+
+
 def get_config_file():
     return environ.get(DEPLOY, None)
 
@@ -33,6 +96,71 @@ def get_service_name():
     return environ.get(SERVICE, None)
 
 
+class UnsupportedEncodingError(ValueError):
+    pass
+
+
+def decode_body(body, content_encoding, max_size):
+    '''
+    Undo the Content-Encoding of a request body. Raises
+    UnsupportedEncodingError for unknown encodings and ValueError for corrupt
+    data or bodies that decode to more than
+    max_size bytes.
+    '''
+    encoding = (content_encoding or 'identity').strip().lower()
+    if encoding == 'identity':
+        return body
+    if encoding not in _WBITS:
+        raise UnsupportedEncodingError(
+            'Unsupported Content-Encoding: ' + encoding)
+    try:
+        decompressor = zlib.decompressobj(_WBITS[encoding])
+        data = decompressor.decompress(body, max_size)
+        if decompressor.unconsumed_tail:
+            raise ValueError('Decoded request body exceeds %d bytes' %
+                             max_size)
+        data += decompressor.flush()
+    except zlib.error as e:
+        if encoding != 'deflate':
+            raise ValueError('Invalid %s request body: %s' % (encoding, e))
+        # some clients send raw deflate streams without the zlib wrapper
+        decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        try:
+            data = decompressor.decompress(body, max_size)
+        except zlib.error as e:
+            raise ValueError('Invalid deflate request body: %s' % e)
+        if decompressor.unconsumed_tail:
+            raise ValueError('Decoded request body exceeds %d bytes' %
+                             max_size)
+    return data
+
+
+def accepts_gzip(accept_encoding):
+    # an explicit gzip entry wins over *; a missing q means q=1 and an
+    # invalid one is taken as q=0
+    qualities = {}
+    for coding in (accept_encoding or '').split(','):
+        params = coding.split(';')
+        q = 1.0
+        for param in params[1:]:
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        qualities[params[0].strip().lower()] = q
+    for coding in ('gzip', 'x-gzip', '*'):
+        if coding in qualities:
+            return qualities[coding] > 0
+    return False
+
+
+def gzip_body(body):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(body) + compressor.flush()
+
+
 def get_config():
     if not get_config_file():
         return None
@@ -43,8 +171,10 @@ def get_config():
         retconfig[nameval[0]] = nameval[1]
     return retconfig
 
+STARTUP.start('config')
 config = get_config()
 
+STARTUP.start('impl')
 from landContigFilter.landContigFilterImpl import landContigFilter  # noqa @IgnorePep8
 impl_landContigFilter = landContigFilter(config)
 
@@ -63,6 +193,19 @@ class JSONObjectEncoder(json.JSONEncoder):
 
 class JSONRPCServiceCustom(JSONRPCService):
 
+    def __init__(self, batch_max_workers=1, profiler=None, admission=None):
+        JSONRPCService.__init__(self)
+        # the maximum number of batch request entries the process runs at
+        # once
+        self.batch_max_workers = max(1, batch_max_workers)
+        # a RequestProfiler, or None to never profile
+        self.profiler = profiler
+        # an AdmissionController, or None to admit every call
+        self.admission = admission
+        self._batch_pool = None
+        self._batch_pool_pid = None
+        self._batch_pool_lock = threading.Lock()
+
     def call(self, ctx, jsondata):
         """
         Calls jsonrpc service's method and returns its return value in a JSON
@@ -79,6 +222,33 @@ class JSONRPCServiceCustom(JSONRPCService):
 
     def _call_method(self, ctx, request):
         """Calls given method with given params and returns it value."""
+        admitted = None
+        # calls from the async CLI and local jobs were admitted already
+        if self.admission is not None and not ctx.get('CLI'):
+            try:
+                admitted = self.admission.admit(request['method'],
+                                                ctx['user_id'])
+            except AdmissionRejected as e:
+                RPC_REJECTED.inc(request['method'])
+                raise ServerBusyError(str(e))
+        RPC_IN_FLIGHT.inc(request['method'])
+        start = time.time()
+        try:
+            mode = None
+            if self.profiler is not None:
+                mode = self.profiler.mode_for(request['method'],
+                                              ctx['rpc_context'])
+            if mode is None:
+                return self._call_method_timed(ctx, request)
+            return self.profiler.run(mode, ctx, request['method'],
+                                     self._call_method_timed, ctx, request)
+        finally:
+            RPC_DURATION.observe(time.time() - start, request['method'])
+            RPC_IN_FLIGHT.dec(request['method'])
+            if admitted is not None:
+                self.admission.release(admitted)
+
+    def _call_method_timed(self, ctx, request):
         method = self.method_data[request['method']]['method']
         params = request['params']
         result = None
@@ -150,16 +320,20 @@ class JSONRPCServiceCustom(JSONRPCService):
         elif isinstance(rdata, list) and rdata:
             # It's a batch.
             requests = []
+            errors = []
             responds = []
 
             for rdata_ in rdata:
                 # set some default values for error handling
                 request_ = self._get_default_vals()
-                self._fill_request(request_, rdata_)
+                try:
+                    self._fill_request(request_, rdata_)
+                    errors.append(None)
+                except JSONRPCError as e:
+                    errors.append(e)
                 requests.append(request_)
 
-            for request_ in requests:
-                respond = self._handle_request(ctx, request_)
+            for respond in self._handle_batch(ctx, requests, errors):
                 # Don't respond to notifications
                 if respond is not None:
                     responds.append(respond)
@@ -173,6 +347,79 @@ class JSONRPCServiceCustom(JSONRPCService):
             # empty dict, list or wrong type
             raise InvalidRequestError
 
+    def _get_batch_pool(self):
+        # one pool per process, shared by all batch requests; a pool
+        # inherited from the parent by a forked process has no threads
+        with self._batch_pool_lock:
+            if (self._batch_pool is None or
+                    self._batch_pool_pid != os.getpid()):
+                self._batch_pool = ThreadPool(self.batch_max_workers)
+                self._batch_pool_pid = os.getpid()
+            return self._batch_pool
+
+    def _handle_batch(self, ctx, requests, errors):
+        """
+        Handles the entries of a batch and returns their responses in
+        request order. An entry that fails gets an error response of its
+        own, as Application.process_error formats it, and does not affect
+        the others. Entries are run on a pool of batch_max_workers threads
+        shared by all the batch requests of the process.
+        """
+        if self.batch_max_workers == 1 or len(requests) == 1:
+            return [self._handle_batch_entry(ctx, request_, error)
+                    for request_, error in zip(requests, errors)]
+        pool = self._get_batch_pool()
+        results = [pool.apply_async(self._handle_batch_entry,
+                                    (ctx, request_, error))
+                   for request_, error in zip(requests, errors)]
+        return [result.get() for result in results]
+
+    def _handle_batch_entry(self, ctx, request, error=None):
+        trace = None
+        if error is None:
+            entry_ctx = self._batch_entry_context(ctx, request)
+            try:
+                return self._handle_request(entry_ctx, request)
+            except JSONRPCError as e:
+                error = e
+                trace = getattr(e, 'trace', None)
+            except Exception as e:
+                error = e
+                trace = traceback.format_exc()
+            if trace and entry_ctx._logger is not None:
+                entry_ctx.log_err(trace.split('\n')[0:-1])
+        # like jsonrpcbase, don't respond to notifications unless the
+        # request itself was invalid
+        if request['id'] is None and not isinstance(error,
+                                                    InvalidRequestError):
+            return None
+        if isinstance(error, JSONRPCError):
+            err = {'code': error.code, 'name': error.message,
+                   'message': error.data}
+        else:
+            err = {'code': 0, 'name': 'Unexpected Server Error',
+                   'message': 'An unexpected server error occurred'}
+        respond = {'error': err, 'id': request['id']}
+        self._fill_ver(request['jsonrpc'], respond)
+        if 'jsonrpc' in respond:
+            err['data'] = trace
+        else:
+            err['error'] = trace
+        return respond
+
+    def _batch_entry_context(self, ctx, request):
+        """Returns a copy of the batch context describing one entry."""
+        entry_ctx = MethodContext(ctx._logger)
+        entry_ctx.update(ctx)
+        if request['method'] in self.method_data:
+            entry_ctx['module'], entry_ctx['method'] = \
+                request['method'].split('.')
+            entry_ctx['call_id'] = request['id']
+            entry_ctx['provenance'] = [{'service': entry_ctx['module'],
+                                        'method': entry_ctx['method'],
+                                        'method_params': request['params']}]
+        return entry_ctx
+
     def _handle_request(self, ctx, request):
         """Handles given request and returns its response."""
         if self.method_data[request['method']].has_key('types'):  # noqa @IgnorePep8
@@ -233,9 +480,9 @@ class MethodContext(dict):
         self._logger.clear_user_log_level()
 
     def _log(self, level, message):
-        self._logger.log_message(level, message, self['client_ip'],
-                                 self['user_id'], self['module'],
-                                 self['method'], self['call_id'])
+        log_writer.log(self._logger.log_message, level, message,
+                       self['client_ip'], self['user_id'], self['module'],
+                       self['method'], self['call_id'])
 
     def provenance(self):
         callbackURL = os.environ.get('SDK_CALLBACK_URL')
@@ -294,6 +541,269 @@ class ServerError(Exception):
             '\n' + self.data
 
 
+def client_call_stats():
+    '''
+    Returns the merged call statistics of the service clients used by this
+    process. Each generated client package ships its own copy of
+    baseclient, so the statistics of every loaded copy are combined.
+    '''
+    return merge_call_stats(
+        module.call_stats.snapshot() for name, module in
+        list(sys.modules.items()) if name.endswith('.baseclient') and
+        module is not None and hasattr(module, 'call_stats'))
+
+
+def reset_client_call_stats():
+    '''
+    Clears the call statistics of the service clients used by this process,
+    e.g. before a job run by a long-lived job runner worker.
+    '''
+    for name, module in list(sys.modules.items()):
+        if (name.endswith('.baseclient') and module is not None and
+                hasattr(module, 'call_stats')):
+            module.call_stats.reset()
+
+
+def upload_profile(ctx, path):
+    '''
+    Stores a saved profile in Shock and returns the node id.
+    '''
+    from DataFileUtil.DataFileUtilClient import DataFileUtil
+    dfu = DataFileUtil(os.environ['SDK_CALLBACK_URL'], token=ctx['token'])
+    return 'shock node ' + dfu.file_to_shock({'file_path': path,
+                                              'make_handle': 0})['shock_id']
+
+
+def get_profiler():
+    '''
+    Returns a RequestProfiler set up from the profile-* config keys, or None
+    if profiling is not enabled.
+    '''
+    if not config:
+        return None
+    methods = [m.strip() for m in config.get('profile-methods', '').split(',')
+               if m.strip()]
+    allow_context = config.get('profile-allow-context') == 'true'
+    if not methods and not allow_context:
+        return None
+    # empty or 0 means no limit
+    max_files = int(config.get('profile-max-files', 200) or 0)
+    max_age_hours = float(config.get('profile-max-age-hours', 168) or 0)
+    return RequestProfiler(
+        os.path.join(config.get('scratch', '.'), 'profiles'),
+        methods=methods, allow_context=allow_context,
+        mode=config.get('profile-mode', 'cprofile'),
+        sample_interval=float(config.get('profile-sample-interval-ms',
+                                         5)) / 1000,
+        uploader=upload_profile
+        if config.get('profile-upload') == 'true' else None,
+        max_files=max_files or None,
+        max_age=max_age_hours * 3600 or None)
+
+
+def run_request(req, token=None, user_id=None):
+    '''
+    Runs a JSON-RPC request dict outside of the HTTP server, as done by the
+    async CLI and by local jobs, and returns the response dict. user_id
+    skips the token validation if the caller has done it already.
+    '''
+    if 'version' not in req:
+        req['version'] = '1.1'
+    if 'id' not in req:
+        req['id'] = str(_random.random())[2:]
+    ctx = MethodContext(application.userlog)
+    if token:
+        if user_id is None:
+            user_id = application.auth_client.get_user(token)
+        ctx['user_id'] = user_id
+        ctx['authenticated'] = 1
+        ctx['token'] = token
+    if 'context' in req:
+        ctx['rpc_context'] = req['context']
+    ctx['CLI'] = 1
+    ctx['module'], ctx['method'] = req['method'].split('.')
+    prov_action = {'service': ctx['module'], 'method': ctx['method'],
+                   'method_params': req['params']}
+    ctx['provenance'] = [prov_action]
+    resp = None
+    try:
+        resp = application.rpc_service.call_py(ctx, req)
+    except JSONRPCError as jre:
+        trace = jre.trace if hasattr(jre, 'trace') else None
+        resp = {'id': req['id'],
+                'version': req['version'],
+                'error': {'code': jre.code,
+                          'name': jre.message,
+                          'message': jre.data,
+                          'error': trace}
+                }
+    except Exception:
+        trace = traceback.format_exc()
+        resp = {'id': req['id'],
+                'version': req['version'],
+                'error': {'code': 0,
+                          'name': 'Unexpected Server Error',
+                          'message': 'An unexpected server error occurred',
+                          'error': trace}
+                }
+    return resp
+
+
+def get_job_manager():
+    '''
+    Returns the JobManager for the _<method>_submit and _check_job calls,
+    set up from the job-* config keys, or None if local jobs are disabled.
+    Its job process is started by start_jobs.
+    '''
+    conf = config or {}
+    max_workers = int(conf.get('job-max-workers', 2))
+    if max_workers < 1:
+        return None
+    db_path = conf.get('job-db') or os.path.join(
+        conf.get('scratch', '.'), 'jobs.sqlite3')
+    timeout = conf.get('job-timeout-hours')
+    return JobManager(db_path, run_request, max_workers=max_workers,
+                      retention=float(conf.get('job-retention-hours',
+                                               24)) * 3600,
+                      user_weights=parse_weights(conf.get('user-weights')),
+                      timeout=float(timeout) * 3600 if timeout else None)
+
+
+def queue_lines(queues, label_names, label_values):
+    '''
+    Renders (name, (running, FairQueue stats)) queues, e.g. those of the
+    admission limits. Users are not labels: user names are not for metrics
+    stores, and each would be a series of its own.
+    '''
+    lines = metrics.gauge_lines(
+        'landcontigfilter_queue_running',
+        'Calls or jobs running under a concurrency limit.',
+        [({'queue': name}, running) for name, (running, _) in queues],
+        label_names, label_values)
+    for metric, key, kind, doc in (
+            ('queue_depth', 'depth', 'gauge', 'Calls or jobs waiting.'),
+            ('queue_users', 'users', 'gauge',
+             'Users with calls or jobs waiting.'),
+            ('queue_oldest_wait_seconds', 'oldest_wait', 'gauge',
+             'How long the oldest waiting call or job has waited.'),
+            ('queue_served_total', 'served', 'counter',
+             'Calls or jobs let through after waiting.'),
+            ('queue_wait_seconds_total', 'wait_total', 'counter',
+             'Time waited by the calls or jobs let through.')):
+        lines.extend(metrics.gauge_lines(
+            'landcontigfilter_' + metric, doc,
+            [({'queue': name}, stats[key])
+             for name, (_, stats) in queues],
+            label_names, label_values, kind))
+    return lines
+
+
+def get_admission():
+    '''
+    Returns the AdmissionController set up from the method-concurrency,
+    max-concurrent-calls, admission-*, cheap-methods and server-threads
+    config keys, or None if no limits are configured. The limited calls are
+    capped to leave a thread of each server process to the cheap calls.
+    '''
+    conf = config or {}
+    limits = parse_limits(conf.get('method-concurrency'))
+    total_limit = int(conf.get('max-concurrent-calls') or 0) or None
+    if not limits and not total_limit:
+        return None
+    threads = int(conf.get('server-threads', 5))
+    if total_limit is not None and total_limit >= threads:
+        raise ValueError(
+            'max-concurrent-calls ({}) must be below server-threads ({}) so '
+            'that cheap calls find a free thread'.format(total_limit,
+                                                         threads))
+    return AdmissionController(
+        limits, total_limit,
+        max_waiting=int(conf.get('admission-queue-size', 1)),
+        timeout=float(conf.get('admission-timeout', 10)),
+        cheap_methods=[m.strip() for m in
+                       conf.get('cheap-methods', '').split(',') if m.strip()],
+        user_weights=parse_weights(conf.get('user-weights')),
+        max_calls=threads - 1)
+
+
+def get_log_writer():
+    '''
+    Returns the AsyncLogWriter for the server and method logs, set up from
+    the log-* config keys.
+    '''
+    conf = config or {}
+    return AsyncLogWriter(
+        max_queue=int(conf.get('log-queue-size', 10000)),
+        rate_limit=float(conf.get('log-rate-limit', 0)),
+        max_message_size=int(conf.get('log-max-message-size', 4096)),
+        priority_level=log.ERR)
+
+log_writer = get_log_writer()
+
+
+def preload_modules(names):
+    '''
+    Imports the modules in the comma separated names, e.g. the ones the
+    service otherwise imports on first use. Run in the uwsgi master, before
+    it forks the workers, this makes the workers share the modules' memory
+    copy-on-write and spares each of them the import.
+    '''
+    for name in (names or '').split(','):
+        if name.strip():
+            try:
+                importlib.import_module(name.strip())
+            except Exception as e:
+                # not fatal, whatever the module raised: it is imported
+                # again where it is used, and fails there
+                print 'Could not preload module %s: %s' % (name.strip(), e)
+
+
+def startup_metrics(label_names, label_values):
+    '''
+    Renders the time the process took to start as metrics. Under uwsgi the
+    workers inherit the timings of the master.
+    '''
+    return metrics.gauge_lines(
+        'landcontigfilter_startup_seconds',
+        'Time spent in each stage of the start of the service process.',
+        [({'stage': s['stage']}, s['seconds'])
+         for s in STARTUP_TIMINGS['stages']] +
+        [({'stage': 'total'}, STARTUP_TIMINGS['total_seconds'])],
+        label_names, label_values)
+
+
+def client_call_metrics(label_names, label_values):
+    '''
+    Renders client_call_stats() as metrics.
+    '''
+    stats = client_call_stats()
+    lines = metrics.gauge_lines(
+        'landcontigfilter_client_calls_total',
+        'Calls made by service clients.',
+        [({'method': m}, s['calls']) for m, s in sorted(stats.items())],
+        label_names, label_values, 'counter')
+    lines.extend(metrics.gauge_lines(
+        'landcontigfilter_client_errors_total',
+        'Failed calls made by service clients.',
+        [({'method': m}, s['errors']) for m, s in sorted(stats.items())],
+        label_names, label_values, 'counter'))
+    lines.extend(metrics.gauge_lines(
+        'landcontigfilter_client_retries_total',
+        'Calls made by service clients that were sent again after failing.',
+        [({'method': m}, s.get('retries', 0))
+         for m, s in sorted(stats.items())],
+        label_names, label_values, 'counter'))
+    name = 'landcontigfilter_client_call_duration_seconds'
+    lines.extend(['# HELP {} Wall time of service client HTTP calls.'
+                  .format(name), '# TYPE {} histogram'.format(name)])
+    for method, s in sorted(stats.items()):
+        if 'wall_time' in s:
+            lines.extend(metrics.histogram_samples(
+                name, label_names + ('method',), label_values + (method,),
+                s['wall_time']['buckets'], s['wall_time']['sum']))
+    return lines
+
+
 def getIPAddress(environ):
     xFF = environ.get('HTTP_X_FORWARDED_FOR')
     realIP = environ.get('HTTP_X_REAL_IP')
@@ -317,9 +827,10 @@ class Application(object):
         self.serverlog.set_log_file(self.userlog.get_log_file())
 
     def log(self, level, context, message):
-        self.serverlog.log_message(level, message, context['client_ip'],
-                                   context['user_id'], context['module'],
-                                   context['method'], context['call_id'])
+        log_writer.log(self.serverlog.log_message, level, message,
+                       context['client_ip'], context['user_id'],
+                       context['module'], context['method'],
+                       context['call_id'])
 
     def __init__(self):
         submod = get_service_name() or 'landContigFilter'
@@ -331,7 +842,15 @@ class Application(object):
             submod, ip_address=True, authuser=True, module=True, method=True,
             call_id=True, logfile=self.userlog.get_log_file())
         self.serverlog.set_log_level(6)
-        self.rpc_service = JSONRPCServiceCustom()
+        self.rpc_service = JSONRPCServiceCustom(
+            batch_max_workers=int(config.get('batch-max-workers', 1))
+            if config else 1,
+            profiler=get_profiler(), admission=get_admission())
+        self.gzip_min_bytes = int(config.get('gzip-min-bytes', 16384)
+                                  if config else 16384)
+        self.max_request_bytes = int(
+            config.get('max-decoded-request-bytes', 1 << 30)
+            if config else 1 << 30)
         self.method_authentication = dict()
         self.rpc_service.add(impl_landContigFilter.filter_contigs,
                              name='landContigFilter.filter_contigs',
@@ -348,10 +867,168 @@ class Application(object):
         self.rpc_service.add(impl_landContigFilter.status,
                              name='landContigFilter.status',
                              types=[dict])
+        self.job_manager = get_job_manager()
+        if self.job_manager is not None:
+            for method in JOB_METHODS:
+                self.add_job_method(method)
+            self.rpc_service.add(self.check_job,
+                                 name='landContigFilter._check_job',
+                                 types=[basestring])
+            self.method_authentication['landContigFilter._check_job'] = 'required'  # noqa
         authurl = config.get(AUTH) if config else None
         self.auth_client = _KBaseAuth(authurl)
+        # metrics are only served when a path is configured, and only to
+        # callers with the metrics token when one is set
+        self.metrics_path = config.get('metrics-path') if config else None
+        self.metrics_token = config.get('metrics-token') if config else None
+        self.metrics_files = None
+        if self.metrics_path:
+            # a directory per server by default: the processes uwsgi forks
+            # share the pid of the process that loaded the application
+            self.metrics_files = metrics.ProcessFiles(
+                METRICS, config.get('metrics-dir') or os.path.join(
+                    tempfile.gettempdir(),
+                    'landContigFilter-metrics-{}'.format(os.getpid())))
+            self.metrics_files.remove_dead()
+        METRICS.add_collector(self.auth_metrics)
+        METRICS.add_collector(self.scratch_metrics)
+        METRICS.add_collector(client_call_metrics)
+        METRICS.add_collector(self.queue_metrics)
+        METRICS.add_collector(self.shared_call_metrics)
+        METRICS.add_collector(startup_metrics)
+
+    def add_job_method(self, method):
+        '''
+        Adds the _<method>_submit call that runs method as a local job.
+        '''
+        module, name = method.split('.')
+
+        def submit(ctx, *params):
+            request = {'method': method, 'params': list(params),
+                       'version': '1.1'}
+            if ctx['rpc_context']:
+                request['context'] = ctx['rpc_context']
+            try:
+                return [self.job_manager.submit(request, ctx['token'],
+                                                ctx['user_id'])]
+            except JobsUnavailableError as e:
+                err = JSONServerError()
+                err.data = e.args[0]
+                raise err
+        submit_name = '{}._{}_submit'.format(module, name)
+        self.rpc_service.add(submit, name=submit_name,
+                             types=self.rpc_service.method_data[method].get(
+                                 'types'))
+        self.method_authentication[submit_name] = \
+            self.method_authentication[method]
+
+    def start_jobs(self):
+        '''
+        Starts the job process of the local jobs, if enabled. Call in the
+        process that loads the application, before it starts any thread or
+        forks the server processes. A failure is logged, not raised: the
+        service runs without local jobs, whose submits fail.
+        '''
+        if self.job_manager is None:
+            return
+        try:
+            self.job_manager.start()
+        except Exception as e:
+            print 'Could not start the local jobs: %s' % e
+
+    def check_job(self, ctx, job_id):
+        '''
+        Returns the state of a local job. A failed job raises its error.
+        '''
+        try:
+            job_state = self.job_manager.check(job_id, ctx['user_id'])
+        except JobNotFoundError as e:
+            err = JSONServerError()
+            err.data = e.args[0]
+            raise err
+        error = job_state.pop('error')
+        if error:
+            err = JSONServerError()
+            err.data = error.get('message')
+            err.trace = error.get('error')
+            raise err
+        return [job_state]
+
+    def auth_metrics(self, label_names, label_values):
+        caches = [('valid', self.auth_client._cache.stats()),
+                  ('rejected', self.auth_client._rejected.stats())]
+        for _, stats in caches:
+            lookups = stats['hits'] + stats['misses']
+            stats['hit_ratio'] = (float(stats['hits']) / lookups
+                                  if lookups else 0.0)
+        lines = []
+        for name, kind in (('hits', 'counter'), ('misses', 'counter'),
+                           ('evictions', 'counter'),
+                           ('expirations', 'counter'), ('size', 'gauge'),
+                           ('hit_ratio', 'gauge')):
+            lines.extend(metrics.gauge_lines(
+                'landcontigfilter_auth_cache_' + name +
+                ('_total' if kind == 'counter' else ''),
+                'Auth token cache ' + name.replace('_', ' ') + '.',
+                [({'cache': cache}, stats[name]) for cache, stats in caches],
+                label_names, label_values, kind))
+        return lines
+
+    def queue_metrics(self, label_names, label_values):
+        # the admission limits of this process. The local jobs are those of
+        # the job process, rendered by job_metrics
+        if self.rpc_service.admission is None:
+            return []
+        return queue_lines(sorted(self.rpc_service.admission.stats().items()),
+                           label_names, label_values)
+
+    def job_metrics(self):
+        # the exposition text of the job process's queue, shown alongside
+        # those of the server processes
+        if self.job_manager is None:
+            return []
+        try:
+            stats = self.job_manager.stats()
+        except JobsUnavailableError:
+            return []
+        return ['\n'.join(queue_lines(
+            [('local jobs', stats)], ('pid',),
+            (str(self.job_manager.job_pid),))) + '\n']
+
+    def shared_call_metrics(self, label_names, label_values):
+        running, waiting, shared = impl_landContigFilter.in_flight.stats()
+        return (metrics.gauge_lines(
+            'landcontigfilter_shared_calls_running',
+            'Filter runs in progress that identical calls can wait on.',
+            [({}, running)], label_names, label_values) + metrics.gauge_lines(
+            'landcontigfilter_shared_calls_waiting',
+            'Calls waiting on an identical filter run in progress.',
+            [({}, waiting)], label_names, label_values) + metrics.gauge_lines(
+            'landcontigfilter_shared_calls_total',
+            'Calls that reused the result of an identical filter run.',
+            [({}, shared)], label_names, label_values, 'counter'))
+
+    def scratch_metrics(self, label_names, label_values):
+        scratch = config.get('scratch') if config else None
+        if not scratch or not os.path.isdir(scratch):
+            return []
+        st = os.statvfs(scratch)
+        return (metrics.gauge_lines(
+            'landcontigfilter_scratch_size_bytes',
+            'Size of the scratch file system.',
+            [({'path': scratch}, st.f_blocks * st.f_frsize)],
+            label_names, label_values) + metrics.gauge_lines(
+            'landcontigfilter_scratch_free_bytes',
+            'Space available to the service on the scratch file system.',
+            [({'path': scratch}, st.f_bavail * st.f_frsize)],
+            label_names, label_values))
 
     def __call__(self, environ, start_response):
+        if self.metrics_files is not None:
+            self.metrics_files.start()
+            if (environ.get('PATH_INFO') == self.metrics_path and
+                    environ['REQUEST_METHOD'] == 'GET'):
+                return self.serve_metrics(environ, start_response)
         # Context object, equivalent to the perl impl CallContext
         ctx = MethodContext(self.userlog)
         ctx['client_ip'] = getIPAddress(environ)
@@ -368,6 +1045,9 @@ class Application(object):
         else:
             request_body = environ['wsgi.input'].read(body_size)
             try:
+                request_body = decode_body(
+                    request_body, environ.get('HTTP_CONTENT_ENCODING'),
+                    self.max_request_bytes)
                 req = json.loads(request_body)
             except ValueError as ve:
                 err = {'error': {'code': -32700,
@@ -376,26 +1056,46 @@ class Application(object):
                                  }
                        }
                 rpc_result = self.process_error(err, ctx, {'version': '1.1'})
+                if isinstance(ve, UnsupportedEncodingError):
+                    status = '415 Unsupported Media Type'
             else:
-                ctx['module'], ctx['method'] = req['method'].split('.')
-                ctx['call_id'] = req['id']
+                # a batch is described by its first well-formed call;
+                # call_py gives each entry its own context and answers
+                # malformed ones with an invalid request error
+                calls = [call for call in
+                         (req if isinstance(req, list) else [req])
+                         if isinstance(call, dict) and
+                         isinstance(call.get('method'), basestring)]
+                first = calls[0] if calls else {}
+                if '.' in first.get('method', ''):
+                    ctx['module'], ctx['method'] = \
+                        first['method'].split('.', 1)
+                ctx['call_id'] = first.get('id')
                 ctx['rpc_context'] = {
                     'call_stack': [{'time': self.now_in_utc(),
-                                    'method': req['method']}
+                                    'method': first.get('method')}
                                    ]
                 }
+                rpc_context = first.get('context')
+                if isinstance(rpc_context, dict) and 'profile' in rpc_context:
+                    ctx['rpc_context']['profile'] = rpc_context['profile']
                 prov_action = {'service': ctx['module'],
                                'method': ctx['method'],
-                               'method_params': req['params']
+                               'method_params': first.get('params')
                                }
                 ctx['provenance'] = [prov_action]
+                # errors for the whole batch are not tied to one call
+                described = req if isinstance(req, dict) else {}
                 try:
                     token = environ.get('HTTP_AUTHORIZATION')
-                    # parse out the method being requested and check if it
-                    # has an authentication requirement
-                    method_name = req['method']
-                    auth_req = self.method_authentication.get(
-                        method_name, 'none')
+                    # parse out the methods being requested and check if
+                    # they have an authentication requirement
+                    auth_reqs = set(self.method_authentication.get(
+                        call['method'], 'none') for call in calls)
+                    auth_req = 'none'
+                    for level in ('optional', 'required'):
+                        if level in auth_reqs:
+                            auth_req = level
                     if auth_req != 'none':
                         if token is None and auth_req == 'required':
                             err = JSONServerError()
@@ -432,7 +1132,8 @@ class Application(object):
                                      }
                            }
                     trace = jre.trace if hasattr(jre, 'trace') else None
-                    rpc_result = self.process_error(err, ctx, req, trace)
+                    rpc_result = self.process_error(err, ctx, described,
+                                                    trace)
                 except Exception:
                     err = {'error': {'code': 0,
                                      'name': 'Unexpected Server Error',
@@ -440,7 +1141,7 @@ class Application(object):
                                                 'occurred',
                                      }
                            }
-                    rpc_result = self.process_error(err, ctx, req,
+                    rpc_result = self.process_error(err, ctx, described,
                                                     traceback.format_exc())
 
         # print 'Request method was %s\n' % environ['REQUEST_METHOD']
@@ -458,11 +1159,44 @@ class Application(object):
             ('Access-Control-Allow-Origin', '*'),
             ('Access-Control-Allow-Headers', environ.get(
                 'HTTP_ACCESS_CONTROL_REQUEST_HEADERS', 'authorization')),
-            ('content-type', 'application/json'),
-            ('content-length', str(len(response_body)))]
+            ('Accept-Encoding', ACCEPTED_ENCODINGS),
+            ('Vary', 'Accept-Encoding'),
+            ('content-type', 'application/json')]
+        if (len(response_body) >= self.gzip_min_bytes and
+                accepts_gzip(environ.get('HTTP_ACCEPT_ENCODING'))):
+            response_body = gzip_body(response_body)
+            response_headers.append(('Content-Encoding', 'gzip'))
+        response_headers.append(('content-length', str(len(response_body))))
+        if environ['REQUEST_METHOD'] != 'OPTIONS':
+            self.record_request(ctx, status, body_size, len(response_body))
         start_response(status, response_headers)
         return [response_body]
 
+    def record_request(self, ctx, status, request_bytes, response_bytes):
+        method = '{}.{}'.format(ctx['module'], ctx['method'])
+        if method not in self.rpc_service.method_data:
+            # keep unknown method names out of the metric labels
+            method = 'unknown'
+        RPC_REQUEST_BYTES.observe(request_bytes, method)
+        RPC_RESPONSE_BYTES.observe(response_bytes, method)
+        if status != '200 OK':
+            RPC_ERRORS.inc(method)
+
+    def serve_metrics(self, environ, start_response):
+        if self.metrics_token:
+            token = environ.get('HTTP_AUTHORIZATION', '')
+            if token.startswith('Bearer '):
+                token = token[len('Bearer '):]
+            if not hmac.compare_digest(str(token), str(self.metrics_token)):
+                start_response('401 Unauthorized',
+                               [('WWW-Authenticate', 'Bearer'),
+                                ('content-length', '0')])
+                return ['']
+        body = self.metrics_files.render(self.job_metrics()).encode('utf-8')
+        start_response('200 OK', [('content-type', metrics.CONTENT_TYPE),
+                                  ('content-length', str(len(body)))])
+        return [body]
+
     def process_error(self, error, context, request, trace=None):
         if trace:
             self.log(log.ERR, context, trace.split('\n')[0:-1])
@@ -490,6 +1224,7 @@ class Application(object):
                         60)
         return "%s%+02d:%02d" % (dtnow.isoformat(), hh, mm)
 
+STARTUP.start('application')
 application = Application()
 
 # This is the uwsgi application dictionary. On startup uwsgi will look
@@ -517,10 +1252,19 @@ try:
         from gevent import monkey
         monkey.patch_all()
     uwsgi.applications = {'': application}
+    # uwsgi loads this file in the master process before forking the workers
+    # (unless it runs with --lazy-apps)
+    STARTUP.start('preload')
+    preload_modules(config.get('preload-modules') if config else None)
+    # after the preload, which the job workers share
+    STARTUP.start('jobs')
+    application.start_jobs()
 except ImportError:
     # Not available outside of wsgi, ignore
     pass
 
+STARTUP_TIMINGS = STARTUP.stop()
+
 _proc = None
 
 
@@ -535,6 +1279,7 @@ def start_server(host='localhost', port=0, newprocess=False):
     global _proc
     if _proc:
         raise RuntimeError('server is already running')
+    application.start_jobs()
     httpd = make_server(host, port, application)
     port = httpd.server_address[1]
     print "Listening on port %s" % port
@@ -555,50 +1300,16 @@ def stop_server():
 
 def process_async_cli(input_file_path, output_file_path, token):
     exit_code = 0
+    reset_client_call_stats()
     with open(input_file_path) as data_file:
         req = json.load(data_file)
-    if 'version' not in req:
-        req['version'] = '1.1'
-    if 'id' not in req:
-        req['id'] = str(_random.random())[2:]
-    ctx = MethodContext(application.userlog)
-    if token:
-        user = application.auth_client.get_user(token)
-        ctx['user_id'] = user
-        ctx['authenticated'] = 1
-        ctx['token'] = token
-    if 'context' in req:
-        ctx['rpc_context'] = req['context']
-    ctx['CLI'] = 1
-    ctx['module'], ctx['method'] = req['method'].split('.')
-    prov_action = {'service': ctx['module'], 'method': ctx['method'],
-                   'method_params': req['params']}
-    ctx['provenance'] = [prov_action]
-    resp = None
-    try:
-        resp = application.rpc_service.call_py(ctx, req)
-    except JSONRPCError as jre:
-        trace = jre.trace if hasattr(jre, 'trace') else None
-        resp = {'id': req['id'],
-                'version': req['version'],
-                'error': {'code': jre.code,
-                          'name': jre.message,
-                          'message': jre.data,
-                          'error': trace}
-                }
-    except Exception:
-        trace = traceback.format_exc()
-        resp = {'id': req['id'],
-                'version': req['version'],
-                'error': {'code': 0,
-                          'name': 'Unexpected Server Error',
-                          'message': 'An unexpected server error occurred',
-                          'error': trace}
-                }
+    resp = run_request(req, token)
     if 'error' in resp:
         exit_code = 500
     with open(output_file_path, "w") as f:
         f.write(json.dumps(resp, cls=JSONObjectEncoder))
+    print('Service client calls made by this job:\n' +
+          format_call_stats(client_call_stats()))
     return exit_code
 
 if __name__ == "__main__":
@@ -613,7 +1324,8 @@ if __name__ == "__main__":
                 token = sys.argv[3]
         sys.exit(process_async_cli(sys.argv[1], sys.argv[2], token))
     try:
-        opts, args = getopt(sys.argv[1:], "", ["port=", "host="])
+        opts, args = getopt(sys.argv[1:], "", ["port=", "host=",
+                                               "job-runner="])
     except GetoptError as err:
         # print help information and exit:
         print str(err)  # will print something like "option -a not recognized"
@@ -626,6 +1338,16 @@ if __name__ == "__main__":
         elif o == '--host':
             host = a
             print "Host set to %s" % host
+        elif o == '--job-runner':
+            # run async jobs sent to the socket instead of serving HTTP
+            preload_modules(config.get('preload-modules') if config else None)
+            conf = config or {}
+            JobRunner(a, process_async_cli,
+                      workers=int(conf.get('job-runner-workers', 2)),
+                      timeout=float(conf.get('job-runner-timeout-hours',
+                                             24)) * 3600,
+                      max_waiting=int(conf.get('job-runner-queue-size', 32))
+                      ).serve_forever()
         else:
             assert False, "unhandled option"
 
@@ -0,0 +1,417 @@
+'''
+In-process service metrics rendered in the Prometheus text exposition format.
+
+Metrics are kept per process and labelled with its pid (and uwsgi worker id
+when available). Under uwsgi a scrape reaches whichever worker takes it, so
+ProcessFiles has every process write its metrics to a shared directory and
+the worker answering a scrape merges them: counters and histograms are
+summed over all the processes, gauges are shown per live process.
+'''
+from __future__ import unicode_literals
+
+import io
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import uwsgi as _uwsgi
+except ImportError:
+    _uwsgi = None
+
+CONTENT_TYPE = str('text/plain; version=0.0.4; charset=utf-8')
+
+# upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+                   30, 60, 300, 1800)
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return repr(int(value))
+    return repr(value)
+
+
+def _escape(value):
+    return ('{}'.format(value).replace('\\', '\\\\').replace('\n', '\\n')
+            .replace('"', '\\"'))
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(n, _escape(v))
+                          for n, v in zip(names, values)) + '}'
+
+
+class _Metric(object):
+
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if len(labels) != len(self.labels):
+            raise ValueError('{} takes the labels {}'.format(
+                self.name, ', '.join(self.labels)))
+        return tuple(labels)
+
+    def header(self):
+        return ['# HELP {} {}'.format(self.name, self.documentation),
+                '# TYPE {} {}'.format(self.name, self.kind)]
+
+    def samples(self, const_names, const_values):
+        with self._lock:
+            items = sorted(self._values.items())
+        return ['{}{} {}'.format(
+            self.name, _format_labels(const_names + self.labels,
+                                      const_values + key),
+            _format_value(value)) for key, value in items]
+
+
+class Counter(_Metric):
+    ''' A value that only goes up. '''
+
+    kind = 'counter'
+
+    def inc(self, *labels, **kwargs):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = (self._values.get(key, 0) +
+                                 kwargs.get('amount', 1))
+
+
+class Gauge(_Metric):
+    ''' A value that goes up and down. '''
+
+    kind = 'gauge'
+
+    def set(self, value, *labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, *labels, **kwargs):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = (self._values.get(key, 0) +
+                                 kwargs.get('amount', 1))
+
+    def dec(self, *labels, **kwargs):
+        self.inc(*labels, amount=-kwargs.get('amount', 1))
+
+
+class Histogram(_Metric):
+    ''' Observations counted into cumulative buckets. '''
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(),
+                 buckets=LATENCY_BUCKETS):
+        super(Histogram, self).__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        key = self._key(labels)
+        with self._lock:
+            hist = self._values.get(key)
+            if hist is None:
+                hist = self._values[key] = [[0] * (len(self.buckets) + 1),
+                                            0]
+            i = 0
+            while i < len(self.buckets) and value > self.buckets[i]:
+                i += 1
+            hist[0][i] += 1
+            hist[1] += value
+
+    def samples(self, const_names, const_values):
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for
+                           key, (counts, total) in self._values.items())
+        lines = []
+        for key, (counts, total) in items:
+            lines.extend(histogram_samples(
+                self.name, const_names + self.labels, const_values + key,
+                zip(self.buckets + (float('inf'),), counts), total))
+        return lines
+
+
+def histogram_samples(name, label_names, label_values, buckets, total):
+    '''
+    Render one histogram from (upper bound, count) pairs, where each count
+    is of the observations in that bucket only.
+    '''
+    lines = []
+    cumulative = 0
+    for le, count in buckets:
+        cumulative += count
+        lines.append('{}_bucket{} {}'.format(
+            name, _format_labels(label_names + ('le',),
+                                 label_values + (_format_value(
+                                     float(le)),)),
+            cumulative))
+    labels = _format_labels(label_names, label_values)
+    lines.append('{}_sum{} {}'.format(name, labels, _format_value(total)))
+    lines.append('{}_count{} {}'.format(name, labels, cumulative))
+    return lines
+
+
+def worker_labels():
+    ''' The labels identifying this process. '''
+    names, values = ('pid',), (str(os.getpid()),)
+    if _uwsgi is not None:
+        names += ('worker',)
+        values += (str(_uwsgi.worker_id()),)
+    return names, values
+
+
+class Registry(object):
+    '''
+    A set of metrics and collector functions. Collectors are called at
+    render time and return lines of exposition text, for values that are
+    cheaper to read on demand than to track.
+    '''
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self.register(Counter(name, documentation, labels))
+
+    def gauge(self, name, documentation, labels=()):
+        return self.register(Gauge(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(),
+                  buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def add_collector(self, collector):
+        '''
+        collector(label_names, label_values) returns a list of lines.
+        '''
+        self._collectors.append(collector)
+
+    def render(self):
+        names, values = worker_labels()
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.header())
+            lines.extend(metric.samples(names, values))
+        for collector in self._collectors:
+            lines.extend(collector(names, values))
+        return '\n'.join(lines) + '\n'
+
+
+# the labels identifying a process, dropped when samples are summed over
+# processes
+_PROCESS_LABELS = ('pid', 'worker')
+
+_SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})? (\S+)$')
+_LABEL = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"')
+_ESCAPED = re.compile(r'\\(.)')
+
+
+def _unescape(value):
+    return _ESCAPED.sub(lambda m: '\n' if m.group(1) == 'n' else m.group(1),
+                        value)
+
+
+def parse(text):
+    '''
+    Parse exposition text as rendered by Registry.render. Returns a list of
+    [name, kind, documentation, samples] metric families, where samples is a
+    list of (sample name, ((label, value), ...), value).
+    '''
+    families = []
+    family = None
+    for line in text.splitlines():
+        if line.startswith('# HELP '):
+            name, _, documentation = line[len('# HELP '):].partition(' ')
+            family = [name, 'untyped', documentation, []]
+            families.append(family)
+        elif line.startswith('# TYPE '):
+            name, _, kind = line[len('# TYPE '):].partition(' ')
+            if family is None or family[0] != name:
+                family = [name, kind, '', []]
+                families.append(family)
+            family[1] = kind
+        elif line and not line.startswith('#'):
+            match = _SAMPLE.match(line)
+            if match is None:
+                continue
+            if family is None:
+                family = [match.group(1), 'untyped', '', []]
+                families.append(family)
+            labels = tuple((n, _unescape(v)) for n, v in
+                           _LABEL.findall(match.group(2) or ''))
+            family[3].append((match.group(1), labels,
+                              float(match.group(3))))
+    return families
+
+
+def aggregate(texts):
+    '''
+    Merge the exposition texts of several processes, given as (text, alive)
+    pairs. Counters and histograms are summed over all the processes,
+    including those that are gone, without the process labels. Gauges keep
+    their process labels and are only shown for live processes.
+    '''
+    families = OrderedDict()  # name -> [kind, documentation, samples]
+    for text, alive in texts:
+        for name, kind, documentation, samples in parse(text):
+            family = families.get(name)
+            if family is None:
+                family = families[name] = [kind, documentation,
+                                           OrderedDict()]
+            values = family[2]
+            for sample_name, labels, value in samples:
+                if kind in ('counter', 'histogram'):
+                    key = (sample_name, tuple(
+                        label for label in labels
+                        if label[0] not in _PROCESS_LABELS))
+                    values[key] = values.get(key, 0) + value
+                elif alive:
+                    values[(sample_name, labels)] = value
+    lines = []
+    for name, (kind, documentation, values) in families.items():
+        lines.extend(['# HELP {} {}'.format(name, documentation),
+                      '# TYPE {} {}'.format(name, kind)])
+        for (sample_name, labels), value in values.items():
+            lines.append('{}{} {}'.format(
+                sample_name, _format_labels([n for n, _ in labels],
+                                            [v for _, v in labels]),
+                _format_value(value)))
+    return '\n'.join(lines) + '\n'
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == 1  # EPERM: alive, but not ours
+    return True
+
+
+class ProcessFiles(object):
+    '''
+    Shares the metrics of the processes of a service, e.g. uwsgi workers,
+    through files in a directory only they use.
+
+    registry - the Registry of each process.
+    directory - the directory of the files, one per process.
+    interval - the number of seconds between writes of a process's file;
+        a scrape shows the other processes' metrics as of their last write.
+    '''
+
+    def __init__(self, registry, directory, interval=10):
+        self.registry = registry
+        self.directory = directory
+        self.interval = interval
+        self._pid = None
+        self._path = None
+        self._lock = threading.Lock()
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def start(self):
+        '''
+        Starts writing the metrics of this process every interval seconds.
+        Call in each process, e.g. on every request; only the first call in
+        a process starts the writer.
+        '''
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # a pid may be reused by a later process, so the file is named
+            # after the start time too
+            self._path = os.path.join(self.directory, '{}-{}.prom'.format(
+                os.getpid(), int(time.time() * 1000)))
+            self._pid = os.getpid()
+        thread = threading.Thread(target=self._run, name='metrics-writer')
+        thread.daemon = True
+        thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.write()
+            except Exception:
+                pass  # e.g. the directory is gone; try again later
+            time.sleep(self.interval)
+
+    def write(self):
+        '''
+        Writes the metrics of this process to its file and returns them.
+        '''
+        text = self.registry.render()
+        with self._lock:
+            temp = self._path + '.tmp'
+            with io.open(temp, 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.rename(temp, self._path)
+        return text
+
+    def render(self, extra=()):
+        '''
+        Renders the metrics of all the processes, with those of this process
+        up to date. extra - the exposition texts of other live processes
+        that do not write files, e.g. a job process.
+        '''
+        self.start()
+        texts = [(self.write(), True)] + [(text, True) for text in extra]
+        for name in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, name)
+            if not name.endswith('.prom') or path == self._path:
+                continue
+            try:
+                with io.open(path, encoding='utf-8') as f:
+                    texts.append((f.read(), _pid_alive(
+                        int(name.split('-')[0]))))
+            except (IOError, OSError, ValueError):
+                continue
+        return aggregate(texts)
+
+    def remove_dead(self):
+        '''
+        Removes the files of processes that are gone, e.g. those left by an
+        earlier run of the service.
+        '''
+        for name in os.listdir(self.directory):
+            try:
+                if not _pid_alive(int(name.split('-')[0].split('.')[0])):
+                    os.remove(os.path.join(self.directory, name))
+            except (OSError, ValueError):
+                pass
+
+
+def gauge_lines(name, documentation, samples, label_names, label_values,
+                kind='gauge'):
+    '''
+    Render a metric from a list of (labels dict, value) samples.
+    '''
+    lines = ['# HELP {} {}'.format(name, documentation),
+             '# TYPE {} {}'.format(name, kind)]
+    for labels, value in samples:
+        keys = tuple(sorted(labels))
+        lines.append('{}{} {}'.format(
+            name, _format_labels(label_names + keys,
+                                 label_values + tuple(labels[k]
+                                                      for k in keys)),
+            _format_value(value)))
+    return lines
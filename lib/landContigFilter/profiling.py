@@ -0,0 +1,181 @@
+'''
+Opt-in profiling of single RPC calls.
+
+Two modes are supported:
+cprofile - the deterministic profiler. Saves a pstats file (load it with
+    pstats, snakeviz, etc.) and a text summary of the top functions by
+    cumulative time.
+sample - a low overhead sampling profiler that records the stack of the
+    thread running the call every few milliseconds. Saves the stacks in the
+    collapsed ("folded") format read by flamegraph.pl and speedscope.
+'''
+import cProfile
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+
+MODES = ('cprofile', 'sample')
+
+
+class _Sampler(object):
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = {}
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run,
+                                        name='profile-sampler')
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('{} ({}:{})'.format(
+                    code.co_name, os.path.basename(code.co_filename),
+                    code.co_firstlineno))
+                frame = frame.f_back
+            if stack:
+                key = ';'.join(reversed(stack))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+                self.samples += 1
+
+    def save(self, path):
+        with open(path, 'w') as out:
+            for stack, count in sorted(self.stacks.items(),
+                                       key=lambda item: -item[1]):
+                out.write('{} {}\n'.format(stack, count))
+
+
+class RequestProfiler(object):
+    '''
+    Decides which calls to profile and profiles them.
+    directory - where profiles are saved.
+    methods - the full names of the methods profiled on every call.
+    allow_context - if True, a caller can ask for a profile of its call by
+        setting 'profile' in the RPC context to true or to one of MODES.
+    mode - the mode used when none is asked for.
+    sample_interval - the seconds between samples in sample mode.
+    uploader - optional uploader(ctx, path) that stores a saved profile
+        somewhere it can be downloaded from and returns a description of
+        where, e.g. a Shock node id.
+    max_files - the most files kept in directory; the oldest are removed
+        after each profile is saved. None for no limit.
+    max_age - files older than this many seconds are removed after each
+        profile is saved. None for no limit.
+    '''
+
+    def __init__(self, directory, methods=(), allow_context=False,
+                 mode='cprofile', sample_interval=0.005, uploader=None,
+                 max_files=200, max_age=7 * 24 * 3600):
+        if mode not in MODES:
+            raise ValueError('Unknown profile mode ' + str(mode))
+        self.directory = directory
+        self.methods = frozenset(methods)
+        self.allow_context = allow_context
+        self.mode = mode
+        self.sample_interval = sample_interval
+        self.uploader = uploader
+        self.max_files = max_files
+        self.max_age = max_age
+
+    def mode_for(self, method, rpc_context):
+        '''
+        Returns the mode to profile a call of method with, or None.
+        '''
+        requested = None
+        if self.allow_context and isinstance(rpc_context, dict):
+            requested = rpc_context.get('profile')
+        if requested in MODES:
+            return requested
+        if requested or method in self.methods:
+            return self.mode
+        return None
+
+    def run(self, mode, ctx, method, fn, *args):
+        '''
+        Calls fn(*args) under the profiler and saves the profile, also when
+        fn raises. Where the profile went is logged through ctx.
+        '''
+        if not os.path.isdir(self.directory):
+            try:
+                os.makedirs(self.directory)
+            except OSError:
+                # another worker created it first
+                if not os.path.isdir(self.directory):
+                    raise
+        base = os.path.join(self.directory, '{}.{}.{}'.format(
+            method, time.strftime('%Y%m%dT%H%M%S'), uuid.uuid4().hex[:8]))
+        if mode == 'cprofile':
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                return fn(*args)
+            finally:
+                profiler.disable()
+                paths = [base + '.prof', base + '.txt']
+                profiler.dump_stats(paths[0])
+                with open(paths[1], 'w') as summary:
+                    stats = pstats.Stats(paths[0], stream=summary)
+                    stats.sort_stats('cumulative').print_stats(50)
+                self._saved(ctx, paths)
+        sampler = _Sampler(threading.current_thread().ident,
+                           self.sample_interval)
+        sampler.start()
+        try:
+            return fn(*args)
+        finally:
+            sampler.stop()
+            paths = [base + '.folded']
+            sampler.save(paths[0])
+            self._saved(ctx, paths)
+
+    def _saved(self, ctx, paths):
+        self._prune(paths)
+        for path in paths:
+            ctx.log_info('Saved profile ' + path)
+            if self.uploader is not None:
+                try:
+                    ctx.log_info('Uploaded profile {} to {}'.format(
+                        os.path.basename(path), self.uploader(ctx, path)))
+                except Exception as e:
+                    ctx.log_err('Upload of profile {} failed: {}'.format(
+                        path, e))
+
+    def _prune(self, keep):
+        # other workers may save and remove profiles at the same time, so
+        # files can disappear between listing and removing them
+        files = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                files.append((os.path.getmtime(path), path))
+            except OSError:
+                pass
+        files.sort(reverse=True)
+        now = time.time()
+        kept = 0
+        for mtime, path in files:
+            if path in keep or (
+                    (self.max_files is None or kept < self.max_files) and
+                    (self.max_age is None or now - mtime <= self.max_age)):
+                kept += 1
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,76 @@
+'''
+Sharing the work of identical concurrent calls.
+'''
+import threading
+
+
+class _Flight(object):
+    ''' A call in progress, shared by the threads waiting on it. '''
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight(object):
+    '''
+    Runs a function once for all the callers that ask for the same key while
+    it is running: the first caller runs it, the others wait and get its
+    result, or the exception it raised. Nothing is kept once the call
+    finishes, so a later call with the same key runs again.
+
+    Calls are only shared within a process, e.g. not between the processes
+    of a uwsgi server. A key must cover everything the result depends on,
+    including who calls if the call runs with the caller's credentials.
+    '''
+
+    def __init__(self):
+        self._flights = {}  # key -> _Flight
+        self._lock = threading.Lock()
+        self.shared = 0
+
+    def do(self, key, fn, on_wait=None):
+        '''
+        Returns (fn(), shared), where shared is True if the result came from
+        another caller's call, whose exception is raised if it failed.
+        on_wait(), if given, is called before this caller starts to wait on
+        another one's call.
+        '''
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                flight.waiters += 1
+        if not leader:
+            if on_wait is not None:
+                on_wait()
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            with self._lock:
+                self.shared += 1
+            return flight.result, True
+        try:
+            flight.result = fn()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.result, False
+
+    def stats(self):
+        '''
+        Returns the number of calls in progress, the number of callers
+        waiting on them and the number of results shared so far.
+        '''
+        with self._lock:
+            return (len(self._flights),
+                    sum(f.waiters for f in self._flights.values()),
+                    self.shared)
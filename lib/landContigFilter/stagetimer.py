@@ -0,0 +1,64 @@
+'''
+Wall time of the steps of a method call.
+'''
+import resource
+import time
+
+
+def peak_rss_kb():
+    '''
+    The peak resident set size of this process so far, in kilobytes.
+    '''
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class StageTimer(object):
+    '''
+    Times consecutive stages of a method call. Starting a stage ends the
+    previous one:
+
+        timer = StageTimer()
+        timer.start('validate')
+        ...
+        timer.start('download')
+        ...
+        timings = timer.stop()
+    '''
+
+    def __init__(self):
+        self._created = time.time()
+        self._stages = []  # {stage, seconds} in the order they ran
+        self._current = None  # (name, start time)
+
+    def start(self, name):
+        now = time.time()
+        self._end(now)
+        self._current = (name, now)
+
+    def _end(self, now):
+        if self._current is not None:
+            name, started = self._current
+            self._stages.append({'stage': name, 'seconds': now - started})
+            self._current = None
+
+    def stop(self):
+        '''
+        Ends the current stage and returns the timings, a dict with the
+        keys stages (a list of {stage, seconds} in the order they ran),
+        total_seconds and peak_rss_kb.
+        '''
+        now = time.time()
+        self._end(now)
+        return {'stages': [dict(s) for s in self._stages],
+                'total_seconds': now - self._created,
+                'peak_rss_kb': peak_rss_kb()}
+
+
+def format_timings(timings):
+    '''
+    A one line summary of the timings returned by StageTimer.stop().
+    '''
+    return ', '.join('{} {:.3f}s'.format(s['stage'], s['seconds'])
+                     for s in timings['stages']) + \
+        ' (total {:.3f}s, peak RSS {} kB)'.format(timings['total_seconds'],
+                                                  timings['peak_rss_kb'])
@@ -0,0 +1,27 @@
+import cProfile
+import os
+import pstats
+import sys
+import time
+
+# Profiles the start of the service: imports the server module, as uwsgi and
+# the async job runner do, under cProfile and prints where the time went.
+# Run with lib on the PYTHONPATH and KB_DEPLOYMENT_CONFIG set, as in
+# start_server.sh.
+if __name__ == "__main__":
+    if len(sys.argv) > 3:
+        print("Usage: <program> [<pstats_output_file>] [<number_of_functions>]")
+        sys.exit(1)
+    started = time.time()
+    profiler = cProfile.Profile()
+    profiler.enable()
+    import landContigFilter.landContigFilterServer as server
+    profiler.disable()
+    print("Import of the server module took {:.3f}s".format(time.time() - started))
+    for stage in server.STARTUP_TIMINGS['stages']:
+        print("\t{:12} {:.3f}s".format(stage['stage'], stage['seconds']))
+    if len(sys.argv) > 1:
+        profiler.dump_stats(sys.argv[1])
+        print("Saved the profile to " + os.path.abspath(sys.argv[1]))
+    stats = pstats.Stats(profiler)
+    stats.sort_stats('cumulative').print_stats(int(sys.argv[2]) if len(sys.argv) > 2 else 30)
@@ -0,0 +1,6 @@
+#!/bin/bash
+script_dir=$(dirname "$(readlink -f "$0")")
+export KB_DEPLOYMENT_CONFIG=$script_dir/../deploy.cfg
+export PYTHONPATH=$script_dir/../lib:$PATH:$PYTHONPATH
+runner_socket=${JOB_RUNNER_SOCKET:-$script_dir/../work/job-runner.sock}
+python -u $script_dir/../lib/landContigFilter/landContigFilterServer.py --job-runner=$runner_socket
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+import unittest
+
+from landContigFilter.admission import (AdmissionController,
+                                        AdmissionRejected, parse_limits)
+
+
+class _Caller(threading.Thread):
+    '''
+    Calls method through the controller and holds the call until release is
+    set.
+    '''
+
+    def __init__(self, controller, method, user=None):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.controller = controller
+        self.method = method
+        self.user = user
+        self.admitted = threading.Event()
+        self.release = threading.Event()
+        self.error = None
+
+    def run(self):
+        try:
+            token = self.controller.admit(self.method, self.user)
+        except AdmissionRejected as e:
+            self.error = e
+            return
+        self.admitted.set()
+        self.release.wait()
+        self.controller.release(token)
+
+
+class AdmissionControllerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.callers = []
+
+    def tearDown(self):
+        for caller in self.callers:
+            caller.release.set()
+            caller.join()
+
+    def call(self, controller, method, user=None):
+        caller = _Caller(controller, method, user)
+        caller.start()
+        self.callers.append(caller)
+        return caller
+
+    def wait_for_waiting(self, controller, name, count):
+        deadline = time.time() + 5
+        while time.time() < deadline:
+            if controller.stats()[name][1]['depth'] == count:
+                return
+            time.sleep(0.01)
+        self.fail('{} calls did not queue for {}'.format(count, name))
+
+    def test_method_limit(self):
+        controller = AdmissionController({'slow': 2}, timeout=5)
+        first = self.call(controller, 'slow')
+        second = self.call(controller, 'slow')
+        self.assertTrue(first.admitted.wait(5))
+        self.assertTrue(second.admitted.wait(5))
+        third = self.call(controller, 'slow')
+        self.wait_for_waiting(controller, 'slow', 1)
+        self.assertFalse(third.admitted.is_set())
+        first.release.set()
+        self.assertTrue(third.admitted.wait(5))
+        self.assertEqual(controller.stats()['slow'][0], 2)
+
+    def test_other_methods_are_not_limited(self):
+        controller = AdmissionController({'slow': 1}, timeout=5)
+        self.assertTrue(self.call(controller, 'slow').admitted.wait(5))
+        self.assertTrue(self.call(controller, 'fast').admitted.wait(5))
+
+    def test_total_limit(self):
+        controller = AdmissionController({'slow': 2}, total_limit=1,
+                                         timeout=5)
+        self.assertTrue(self.call(controller, 'slow').admitted.wait(5))
+        waiting = self.call(controller, 'other')
+        self.wait_for_waiting(controller, AdmissionController._TOTAL, 1)
+        self.assertFalse(waiting.admitted.is_set())
+
+    def test_cheap_methods_are_never_limited(self):
+        controller = AdmissionController(total_limit=1, max_waiting=0,
+                                         cheap_methods=['status'])
+        self.assertTrue(self.call(controller, 'slow').admitted.wait(5))
+        self.assertEqual(controller.admit('status'), [])
+
+    def test_full_queue_is_rejected(self):
+        controller = AdmissionController({'slow': 1}, max_waiting=1,
+                                         timeout=5)
+        self.assertTrue(self.call(controller, 'slow').admitted.wait(5))
+        self.call(controller, 'slow')
+        self.wait_for_waiting(controller, 'slow', 1)
+        start = time.time()
+        self.assertRaisesRegexp(AdmissionRejected, 'waiting calls',
+                                controller.admit, 'slow')
+        self.assertLess(time.time() - start, 1)
+
+    def test_timeout_is_rejected(self):
+        controller = AdmissionController({'slow': 1}, timeout=0.2)
+        self.assertTrue(self.call(controller, 'slow').admitted.wait(5))
+        start = time.time()
+        self.assertRaisesRegexp(AdmissionRejected, 'Timed out',
+                                controller.admit, 'slow')
+        self.assertGreaterEqual(time.time() - start, 0.2)
+        self.assertEqual(controller.stats()['slow'][1]['depth'], 0)
+
+    def test_rejection_releases_acquired_limits(self):
+        controller = AdmissionController({'slow': 1}, total_limit=1,
+                                         max_waiting=0)
+        self.assertTrue(self.call(controller, 'other').admitted.wait(5))
+        self.assertRaises(AdmissionRejected, controller.admit, 'slow')
+        self.assertEqual(controller.stats()['slow'][0], 0)
+
+    def test_max_calls(self):
+        controller = AdmissionController({'slow': 1}, max_waiting=5,
+                                         timeout=5, max_calls=2,
+                                         cheap_methods=['status'])
+        running = self.call(controller, 'slow')
+        self.assertTrue(running.admitted.wait(5))
+        self.call(controller, 'slow')
+        self.wait_for_waiting(controller, 'slow', 1)
+        start = time.time()
+        self.assertRaisesRegexp(AdmissionRejected, 'running or waiting',
+                                controller.admit, 'slow')
+        self.assertLess(time.time() - start, 1)
+        self.assertEqual(controller.admit('status'), [])
+        # a finished call makes room for one more
+        running.release.set()
+        running.join()
+        self.call(controller, 'slow')
+        self.wait_for_waiting(controller, 'slow', 1)
+
+    def test_waiting_users_are_served_fairly(self):
+        controller = AdmissionController({'slow': 1}, timeout=5)
+        running = self.call(controller, 'slow', 'user0')
+        self.assertTrue(running.admitted.wait(5))
+        waiting = [self.call(controller, 'slow', 'user1')]
+        self.wait_for_waiting(controller, 'slow', 1)
+        waiting.append(self.call(controller, 'slow', 'user1'))
+        self.wait_for_waiting(controller, 'slow', 2)
+        waiting.append(self.call(controller, 'slow', 'user2'))
+        self.wait_for_waiting(controller, 'slow', 3)
+        order = []
+        for _ in waiting:
+            # each finishing call hands its slot to the next waiting one
+            running.release.set()
+            running.join()
+            running = [c for c in waiting
+                       if c.admitted.wait(0.1) and c not in order][0]
+            order.append(running)
+        self.assertEqual(order, [waiting[0], waiting[2], waiting[1]])
+
+
+class ParseLimitsTest(unittest.TestCase):
+
+    def test_parse(self):
+        self.assertEqual(parse_limits(' a.b:2, c:10 ,'),
+                         {'a.b': 2, 'c': 10})
+        self.assertEqual(parse_limits(None), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
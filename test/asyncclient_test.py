@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+import json
+import threading
+import unittest
+
+try:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler  # py2
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import HTTPServer, BaseHTTPRequestHandler  # py3
+    from socketserver import ThreadingMixIn
+
+from landContigFilter import baseclient
+from landContigFilter.asyncclient import (
+    AsyncAssemblyUtil, AsyncDataFileUtil, AsyncKBaseReport, ServerError)
+from landContigFilter.baseclient import BaseClient
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _CallbackStandIn(BaseHTTPRequestHandler):
+    ''' Answers SDK job submissions and checks like a callback server. '''
+
+    protocol_version = 'HTTP/1.1'
+    jobs = {}
+
+    def do_POST(self):
+        req = json.loads(self.rfile.read(
+            int(self.headers['Content-Length'])).decode('utf-8'))
+        if isinstance(req, list):
+            self._respond(200, [self._answer(entry)[1] for entry in req])
+        else:
+            self._respond(*self._answer(req))
+
+    def _answer(self, req):
+        mod, meth = req['method'].split('.')
+        if meth == '_check_job':
+            result = [{'finished': 1, 'result': [self.jobs[req['params'][0]]]}]
+        elif meth == '_fail_submit':
+            return 500, {'version': '1.1', 'id': req['id'], 'error': {
+                'name': 'JSONRPCError', 'code': -32000,
+                'message': 'submit failed', 'error': 'trace'}}
+        else:
+            job_id = str(len(self.jobs))
+            self.jobs[job_id] = {'method': mod + '.' + meth[1:-len('_submit')],
+                                 'params': req['params'],
+                                 'token': self.headers.get('Authorization')}
+            result = [job_id]
+        return 200, {'version': '1.1', 'id': req['id'], 'result': result}
+
+    def _respond(self, code, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class AsyncClientTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = _ThreadingHTTPServer(('localhost', 0), _CallbackStandIn)
+        cls.url = 'http://localhost:{}'.format(cls.server.server_address[1])
+        cls.thread = threading.Thread(target=cls.server.serve_forever)
+        cls.thread.daemon = True
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def test_concurrent_get_objects(self):
+        dfu = AsyncDataFileUtil(self.url, token='sometoken',
+                                async_job_check_time_ms=1)
+        refs = ['1/{}/1'.format(i) for i in range(20)]
+        futures = [dfu.get_objects({'object_refs': [ref]}) for ref in refs]
+        results = [f.result(10) for f in futures]
+        self.assertEqual([r['params'][0]['object_refs'][0] for r in results],
+                         refs)
+        self.assertEqual(results[0]['method'], 'DataFileUtil.get_objects')
+        self.assertEqual(results[0]['token'], 'sometoken')
+
+    def test_done_callback(self):
+        report = AsyncKBaseReport(self.url, token='sometoken',
+                                  async_job_check_time_ms=1)
+        finished = threading.Event()
+        done = []
+        future = report.create({'report': {}}, context={'call_id': 'c1'})
+        future.add_done_callback(lambda f: (done.append(f.result()),
+                                            finished.set()))
+        self.assertTrue(finished.wait(10))
+        self.assertEqual(done[0]['method'], 'KBaseReport.create')
+        # added after the job finished: called at once
+        future.add_done_callback(lambda f: done.append(f))
+        self.assertIs(done[1], future)
+
+    def test_calls_are_counted(self):
+        baseclient.call_stats.reset()
+        AsyncAssemblyUtil(self.url, token='sometoken',
+                          async_job_check_time_ms=1).status().result(10)
+        self.assertIn('AssemblyUtil._status_submit',
+                      baseclient.call_stats.snapshot())
+
+    def test_server_error(self):
+        client = BaseClient(self.url, token='sometoken')
+        with self.assertRaises(ServerError) as cm:
+            client.start_job('KBaseReport.fail', [])
+        self.assertEqual(cm.exception.message, 'submit failed')
+
+    def test_unexpected_keyword(self):
+        report = AsyncKBaseReport(self.url, token='sometoken')
+        self.assertRaises(TypeError, report.status, service_ver='dev')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+import os
+import subprocess
+import sys
+import threading
+import time
+import unittest
+
+from landContigFilter.asynclog import AsyncLogWriter, brief, truncate
+
+_LIB = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib')
+
+
+class _Log(object):
+    '''
+    A log_message function that records its calls and the thread making
+    them. Calls block while `release` is clear.
+    '''
+
+    def __init__(self):
+        self.messages = []
+        self.threads = set()
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, level, message, *args):
+        self.release.wait()
+        self.threads.add(threading.current_thread().name)
+        self.messages.append((level, message) + args)
+
+
+class TruncateTest(unittest.TestCase):
+
+    def test_truncate(self):
+        self.assertEqual(truncate('abcdef', 3), 'abc... [3 more characters]')
+        self.assertEqual(truncate('abc', 3), 'abc')
+        self.assertEqual(truncate('abcdef', 0), 'abcdef')
+        self.assertEqual(truncate('abcdef', None), 'abcdef')
+
+    def test_brief(self):
+        self.assertEqual(brief({'a': 1}), "{'a': 1}")
+        self.assertTrue(brief(list(range(1000)), 10).startswith('[0,'))
+
+
+class AsyncLogWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.log = _Log()
+
+    def tearDown(self):
+        self.log.release.set()
+
+    def hold_writer(self, writer, message='info'):
+        # logs message and waits until the writer thread is blocked
+        # writing it
+        self.log.release.clear()
+        writer.log(self.log, 6, message)
+        deadline = time.time() + 5
+        while writer._queue.qsize():
+            self.assertLess(time.time(), deadline, 'the writer is stuck')
+            time.sleep(0.01)
+
+    def test_messages_are_written_in_order_by_a_thread(self):
+        writer = AsyncLogWriter()
+        for i in range(5):
+            writer.log(self.log, 6, 'message {}'.format(i), 'extra')
+        writer.flush()
+        self.assertEqual(self.log.messages,
+                         [(6, 'message {}'.format(i), 'extra')
+                          for i in range(5)])
+        self.assertEqual(self.log.threads, set(['async-log-writer']))
+
+    def test_truncation(self):
+        writer = AsyncLogWriter(max_message_size=5)
+        writer.log(self.log, 6, 'abcdefgh')
+        writer.log(self.log, 6, ['abcdefgh', 'abc'])
+        writer.flush()
+        self.assertEqual(self.log.messages,
+                         [(6, 'abcde... [3 more characters]'),
+                          (6, ['abcde... [3 more characters]', 'abc'])])
+
+    def test_rate_limit(self):
+        writer = AsyncLogWriter(rate_limit=2)
+        self.hold_writer(writer)
+        for _ in range(9):
+            writer.log(self.log, 6, 'info')
+        # errors are never limited
+        writer.log(self.log, 3, 'error')
+        self.assertEqual(writer.dropped, 8)
+        time.sleep(0.6)
+        writer.log(self.log, 6, 'later')
+        self.log.release.set()
+        writer.flush()
+        # drops are reported before the next message written
+        self.assertEqual([message for _, message in self.log.messages],
+                         ['info', '8 log messages dropped', 'info', 'error',
+                          'later'])
+
+    def test_full_queue_drops_messages(self):
+        writer = AsyncLogWriter(max_queue=2)
+        self.hold_writer(writer, 'first')
+        for i in range(5):
+            writer.log(self.log, 6, 'queued {}'.format(i))
+        self.assertEqual(writer.dropped, 3)
+        self.log.release.set()
+        writer.flush()
+        self.assertEqual([message for _, message in self.log.messages],
+                         ['first', '3 log messages dropped', 'queued 0',
+                          'queued 1'])
+
+    def test_failing_log_call_does_not_stop_the_writer(self):
+        def failing(level, message):
+            raise IOError('disk full')
+        writer = AsyncLogWriter()
+        writer.log(failing, 6, 'lost')
+        writer.log(self.log, 6, 'written')
+        writer.flush()
+        self.assertEqual(self.log.messages, [(6, 'written')])
+
+    def test_flush_waits_for_queued_messages(self):
+        writer = AsyncLogWriter()
+        self.log.release.clear()
+        for i in range(3):
+            writer.log(self.log, 6, str(i))
+        threading.Timer(0.2, self.log.release.set).start()
+        writer.flush()
+        self.assertEqual(len(self.log.messages), 3)
+
+    def test_queued_messages_are_written_at_exit(self):
+        script = '\n'.join([
+            'import sys, time',
+            'from landContigFilter.asynclog import AsyncLogWriter',
+            'def slow(level, message):',
+            '    time.sleep(0.05)',
+            '    sys.stdout.write(message + "\\n")',
+            'writer = AsyncLogWriter()',
+            'for i in range(5):',
+            '    writer.log(slow, 6, str(i))'])
+        env = dict(os.environ, PYTHONPATH=_LIB)
+        output = subprocess.check_output([sys.executable, '-c', script],
+                                         env=env)
+        self.assertEqual(output.decode('utf-8').split(),
+                         ['0', '1', '2', '3', '4'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+import json
+import threading
+import time
+import unittest
+
+try:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler  # py2
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import HTTPServer, BaseHTTPRequestHandler  # py3
+    from socketserver import ThreadingMixIn
+
+from landContigFilter.authclient import (KBaseAuth, RejectedTokenCache,
+                                         TokenCache)
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _AuthStandIn(BaseHTTPRequestHandler):
+    '''
+    Answers token validations with the (status, body) pairs queued in the
+    server's `answers` list, reusing the last one, and counts them.
+    '''
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        answers = self.server.answers
+        status, body = answers.pop(0) if len(answers) > 1 else answers[0]
+        time.sleep(self.server.delay)
+        self.server.requests += 1
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class TokenCacheTest(unittest.TestCase):
+
+    def test_hit_and_miss(self):
+        cache = TokenCache()
+        self.assertIsNone(cache.get_user(b'token1'))
+        cache.add_valid_token(b'token1', 'user1')
+        self.assertEqual(cache.get_user(b'token1'), 'user1')
+        self.assertIsNone(cache.get_user(b'token2'))
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['size']),
+                         (1, 2, 1))
+
+    def test_least_recently_used_is_evicted(self):
+        cache = TokenCache(maxsize=2)
+        cache.add_valid_token(b'token1', 'user1')
+        cache.add_valid_token(b'token2', 'user2')
+        cache.get_user(b'token1')
+        cache.add_valid_token(b'token3', 'user3')
+        self.assertEqual(cache.get_user(b'token1'), 'user1')
+        self.assertIsNone(cache.get_user(b'token2'))
+        self.assertEqual(cache.get_user(b'token3'), 'user3')
+        stats = cache.stats()
+        self.assertEqual((stats['size'], stats['maxsize'], stats['evictions'],
+                          stats['expirations']), (2, 2, 1, 0))
+
+    def test_readding_refreshes(self):
+        cache = TokenCache(maxsize=2)
+        cache.add_valid_token(b'token1', 'user1')
+        cache.add_valid_token(b'token2', 'user2')
+        cache.add_valid_token(b'token1', 'user1')
+        cache.add_valid_token(b'token3', 'user3')
+        self.assertEqual(cache.get_user(b'token1'), 'user1')
+        self.assertIsNone(cache.get_user(b'token2'))
+
+    def test_expiry(self):
+        cache = TokenCache(max_time_sec=0.1)
+        cache.add_valid_token(b'token1', 'user1')
+        self.assertEqual(cache.get_user(b'token1'), 'user1')
+        time.sleep(0.2)
+        self.assertIsNone(cache.get_user(b'token1'))
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'],
+                          stats['expirations'], stats['size']), (1, 1, 1, 0))
+
+    def test_expired_entries_are_not_counted_as_evictions(self):
+        cache = TokenCache(maxsize=1, max_time_sec=0.1)
+        cache.add_valid_token(b'token1', 'user1')
+        time.sleep(0.2)
+        cache.add_valid_token(b'token2', 'user2')
+        stats = cache.stats()
+        self.assertEqual((stats['evictions'], stats['expirations']), (0, 1))
+
+    def test_requires_token_and_user(self):
+        cache = TokenCache()
+        self.assertRaises(ValueError, cache.add_valid_token, b'', 'user1')
+        self.assertRaises(ValueError, cache.add_valid_token, b'token1', None)
+
+
+class KBaseAuthTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = _ThreadingHTTPServer(('127.0.0.1', 0), _AuthStandIn)
+        self.server.answers = [(200, {'user_id': 'user1'})]
+        self.server.requests = 0
+        self.server.delay = 0
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.auth = KBaseAuth('http://127.0.0.1:{}'.format(
+            self.server.server_address[1]))
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_valid_token_is_cached(self):
+        self.assertEqual(self.auth.get_user(b'token1'), 'user1')
+        self.assertEqual(self.auth.get_user(b'token1'), 'user1')
+        self.assertEqual(self.server.requests, 1)
+
+    def assert_rejection_cached(self, status, body, cached):
+        self.server.answers = [(status, body)]
+        self.assertRaises(ValueError, self.auth.get_user, b'token1')
+        self.assertRaises(ValueError, self.auth.get_user, b'token1')
+        self.assertEqual(self.server.requests, 1 if cached else 2)
+
+    def test_unauthorized_is_cached(self):
+        self.assert_rejection_cached(401, {'error_msg': 'Invalid token'},
+                                     True)
+
+    def test_invalid_token_code_is_cached(self):
+        self.assert_rejection_cached(400, {'error_msg': '10020 Invalid token'},
+                                     True)
+        self.auth._rejected = RejectedTokenCache()
+        self.server.requests = 0
+        self.assert_rejection_cached(400, {'error': {'appcode': 10020}}, True)
+
+    def test_other_client_errors_are_not_cached(self):
+        for status in (400, 403, 408, 429):
+            self.auth = KBaseAuth(self.auth._authurl)
+            self.server.requests = 0
+            self.assert_rejection_cached(status, {'error_msg': 'try later'},
+                                         False)
+
+    def test_server_errors_are_not_cached(self):
+        self.assert_rejection_cached(503, {'error_msg': 'unavailable'}, False)
+
+    def test_concurrent_validations_are_shared(self):
+        self.server.delay = 0.1
+        users = []
+        threads = [threading.Thread(
+            target=lambda: users.append(self.auth.get_user(b'token1')))
+            for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(users, ['user1'] * 5)
+        self.assertEqual(self.server.requests, 1)
+
+
+class RejectedTokenCacheTest(unittest.TestCase):
+
+    def test_rejection(self):
+        cache = RejectedTokenCache()
+        self.assertIsNone(cache.get_rejection(b'token1'))
+        cache.add_rejected_token(b'token1', 'Invalid token')
+        self.assertEqual(cache.get_rejection(b'token1'), 'Invalid token')
+        self.assertRaises(ValueError, cache.add_rejected_token, b'token1',
+                          '')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,666 @@
+# -*- coding: utf-8 -*-
+import json
+import threading
+import time
+import unittest
+import zlib
+
+try:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler  # py2
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import HTTPServer, BaseHTTPRequestHandler  # py3
+    from socketserver import ThreadingMixIn
+
+from landContigFilter import baseclient
+from landContigFilter.baseclient import BaseClient
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _ServiceStandIn(BaseHTTPRequestHandler):
+    '''
+    Answers JSON-RPC calls with the results queued in the server's
+    `answers` dict of method -> list of (status, body) or callables taking
+    the request, and records each request in `requests` and its
+    Content-Encoding in `encodings`. Compressed bodies are refused unless
+    the server's `accept_encoding` is set; it is then sent as the
+    Accept-Encoding of every response.
+    '''
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        data = self.rfile.read(int(self.headers['Content-Length']))
+        encoding = self.headers.get('Content-Encoding')
+        self.server.encodings.append(encoding)
+        if encoding:
+            if not self.server.accept_encoding:
+                self.server.requests.append((self.client_address, None))
+                self._respond(415, 'unsupported')
+                return
+            data = zlib.decompress(data, 16 + zlib.MAX_WBITS)
+        req = json.loads(data.decode('utf-8'))
+        self.server.requests.append((self.client_address, req))
+        method = req[0]['method'] if isinstance(req, list) else req['method']
+        answers = self.server.answers.get(method)
+        if answers:
+            answer = answers.pop(0) if len(answers) > 1 else answers[0]
+        else:
+            answer = (200, {'version': '1.1', 'result': [method]})
+        if callable(answer):
+            answer = answer(req)
+        status, body = answer
+        if isinstance(body, dict) and 'id' not in body:
+            body = dict(body, id=req['id'])
+        self._respond(status, body)
+
+    def _respond(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        if self.server.accept_encoding:
+            self.send_header('Accept-Encoding', self.server.accept_encoding)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stand_in():
+    server = _ThreadingHTTPServer(('127.0.0.1', 0), _ServiceStandIn)
+    server.requests = []
+    server.encodings = []
+    server.answers = {}
+    server.accept_encoding = None
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server, 'http://127.0.0.1:{}'.format(server.server_address[1])
+
+
+class _Jobs(object):
+    '''
+    Submits jobs that finish after `polls` checks. A check of a job in
+    `failing` is answered with the status and body queued there instead.
+    '''
+
+    def __init__(self, server, polls=1):
+        self.polls = polls
+        self.checks = {}  # job id -> number of checks
+        self.failing = {}  # job id -> list of (status, body)
+        self.lock = threading.Lock()
+        server.answers['Service._method_submit'] = [self.submit]
+        server.answers['Service._check_job'] = [self.check]
+
+    def submit(self, req):
+        with self.lock:
+            job_id = 'job{}'.format(len(self.checks))
+            self.checks[job_id] = 0
+        return 200, {'version': '1.1', 'result': [job_id]}
+
+    def _state(self, req):
+        job_id = req['params'][0]
+        with self.lock:
+            self.checks[job_id] += 1
+            finished = self.checks[job_id] >= self.polls
+        return {'version': '1.1', 'id': req['id'],
+                'result': [{'finished': int(finished),
+                            'result': [job_id] if finished else None}]}
+
+    def check(self, req):
+        if isinstance(req, list):
+            return 200, [self._state(entry) for entry in req]
+        failing = self.failing.get(req['params'][0])
+        if failing:
+            return failing.pop(0)
+        return 200, self._state(req)
+
+
+class JobPollerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server, self.url = start_stand_in()
+        self.client = BaseClient(self.url, token='token',
+                                 async_job_check_time_ms=10,
+                                 job_poll_max_time_ms=20)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _check_requests(self):
+        return [req for _, req in self.server.requests
+                if 'Service._method_submit' not in json.dumps(req)]
+
+    def test_polls_are_batched(self):
+        _Jobs(self.server, polls=2)
+        futures = [self.client.start_job('Service.method', [i])
+                   for i in range(5)]
+        results = sorted(f.result(10) for f in futures)
+        self.assertEqual(results, ['job{}'.format(i) for i in range(5)])
+        self.assertLess(len(self._check_requests()), 10)
+
+    def test_check_jobs_sends_one_request(self):
+        _Jobs(self.server)
+        job_ids = [self.client._submit_job('Service.method', [i])
+                   for i in range(5)]
+        states = self.client._check_jobs('Service', job_ids)
+        self.assertEqual(sorted(states), job_ids)
+        self.assertTrue(all(state['finished'] for state in states.values()))
+        checks = self._check_requests()
+        self.assertEqual(len(checks), 1)
+        self.assertEqual(len(checks[0]), 5)
+
+    def test_transient_errors_are_retried(self):
+        jobs = _Jobs(self.server)
+        jobs.failing['job0'] = [(503, 'unavailable'), (502, 'bad gateway')]
+        baseclient.call_stats.reset()
+        future = self.client.start_job('Service.method', [])
+        self.assertEqual(future.result(10), 'job0')
+        self.assertEqual(jobs.checks['job0'], 1)
+        self.assertEqual(baseclient.call_stats.snapshot()
+                         ['Service._check_job']['retries'], 2)
+
+    def test_retries_are_limited(self):
+        jobs = _Jobs(self.server)
+        jobs.failing['job0'] = [(503, 'unavailable')] * 10
+        self.client.job_poll_max_retries = 2
+        future = self.client.start_job('Service.method', [])
+        self.assertRaises(baseclient._requests.exceptions.HTTPError,
+                          future.result, 10)
+        self.assertEqual(len(self._check_requests()), 3)
+
+    def test_service_errors_fail_the_job(self):
+        jobs = _Jobs(self.server)
+        jobs.failing['job0'] = [(500, {'version': '1.1', 'error': {
+            'name': 'JSONRPCError', 'code': -32000, 'message': 'no job'}})]
+        future = self.client.start_job('Service.method', [])
+        self.assertRaises(baseclient.ServerError, future.result, 10)
+        self.assertEqual(len(self._check_requests()), 1)
+
+    def test_falls_back_without_batch_support(self):
+        jobs = _Jobs(self.server, polls=2)
+        self.server.answers['Service._check_job'] = [
+            lambda req: (500, {'version': '1.1', 'id': None, 'error': {
+                'name': 'JSONRPCError', 'code': -32600,
+                'message': 'Invalid request'}})
+            if isinstance(req, list) else jobs.check(req)]
+        futures = [self.client.start_job('Service.method', [i])
+                   for i in range(3)]
+        results = sorted(f.result(10) for f in futures)
+        self.assertEqual(results, ['job0', 'job1', 'job2'])
+        self.assertFalse(self.client._batch_job_checks)
+
+    def test_failed_batch_keeps_batch_support(self):
+        jobs = _Jobs(self.server)
+        self.server.answers['Service._check_job'] = [
+            (500, {'version': '1.1', 'id': None, 'error': {
+                'name': 'JSONRPCError', 'code': -32400,
+                'message': 'Token expired'}}), jobs.check]
+        job_ids = [self.client._submit_job('Service.method', [i])
+                   for i in range(3)]
+        states = self.client._check_jobs('Service', job_ids)
+        for job_id in job_ids:
+            self.assertIsInstance(states[job_id], baseclient.ServerError)
+            self.assertEqual(states[job_id].code, -32400)
+        self.assertTrue(self.client._batch_job_checks)
+        states = self.client._check_jobs('Service', job_ids)
+        self.assertTrue(all(state['finished'] for state in states.values()))
+        self.assertEqual(len(self._check_requests()), 2)
+
+    def test_failed_pass_fails_its_jobs(self):
+        _Jobs(self.server)
+
+        def check_jobs(module, job_ids):
+            raise RuntimeError('bug')
+        self.client._check_jobs = check_jobs
+        future = self.client.start_job('Service.method', [])
+        self.assertRaisesRegexp(RuntimeError, 'bug', future.result, 10)
+        del self.client._check_jobs
+        future = self.client.start_job('Service.method', [])
+        self.assertEqual(future.result(10), 'job1')
+
+
+class SessionPoolTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server, cls.url = start_stand_in()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        self.server.requests[:] = []
+        with baseclient._SESSIONS_LOCK:
+            baseclient._SESSIONS.clear()
+
+    def test_session_shared_per_host(self):
+        s1 = baseclient._get_session('http://host1:5000/a')
+        s2 = baseclient._get_session('http://host1:5000/b')
+        s3 = baseclient._get_session('http://host2:5000/a')
+        s4 = baseclient._get_session('https://host1:5000/a')
+        self.assertIs(s1, s2)
+        self.assertIsNot(s1, s3)
+        self.assertIsNot(s1, s4)
+
+    def test_keep_alive_setting(self):
+        kept = baseclient._get_session('http://host1:5000', keep_alive=True)
+        closed = baseclient._get_session('http://host1:5000',
+                                         keep_alive=False)
+        self.assertIsNot(kept, closed)
+        self.assertEqual(closed.headers['Connection'], 'close')
+        self.assertNotEqual(kept.headers.get('Connection'), 'close')
+
+    def test_first_pool_size_wins(self):
+        session = baseclient._get_session('http://host1:5000',
+                                          pool_maxsize=3)
+        baseclient._get_session('http://host1:5000', pool_maxsize=7)
+        self.assertEqual(session.get_adapter('http://host1:5000')
+                         ._pool_maxsize, 3)
+
+    def test_calls_reuse_connection(self):
+        client = BaseClient(self.url, token='token')
+        for _ in range(3):
+            client.call_method('Service.method', [])
+        ports = set(address[1] for address, _ in self.server.requests)
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(len(ports), 1)
+
+    def test_clients_share_connections(self):
+        BaseClient(self.url, token='token1').call_method('Service.a', [])
+        BaseClient(self.url, token='token2').call_method('Service.b', [])
+        ports = set(address[1] for address, _ in self.server.requests)
+        self.assertEqual(len(ports), 1)
+
+    def test_no_keep_alive_opens_new_connections(self):
+        client = BaseClient(self.url, token='token', http_keep_alive=False)
+        client.call_method('Service.method', [])
+        client.call_method('Service.method', [])
+        ports = set(address[1] for address, _ in self.server.requests)
+        self.assertEqual(len(ports), 2)
+
+
+class ServiceUrlCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server, self.url = start_stand_in()
+        self.server.answers['ServiceWizard.get_service_status'] = [
+            self.service_status]
+        with baseclient._SERVICE_URLS_LOCK:
+            baseclient._SERVICE_URLS.clear()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def service_status(self, req):
+        time.sleep(0.05)
+        return 200, {'version': '1.1', 'result': [{
+            'url': self.url + '/' + req['params'][0]['version']}]}
+
+    def lookups(self):
+        return [req for _, req in self.server.requests
+                if req['method'] == 'ServiceWizard.get_service_status']
+
+    def client(self, **kwargs):
+        return BaseClient(self.url, token='token', lookup_url=True, **kwargs)
+
+    def test_lookup_is_cached(self):
+        client = self.client()
+        client.call_method('Service.a', [], 'dev')
+        client.call_method('Service.b', [], 'dev')
+        self.client().call_method('Service.a', [], 'dev')
+        self.assertEqual(len(self.lookups()), 1)
+        self.assertEqual(len(self.server.requests), 4)
+
+    def test_lookup_per_version(self):
+        client = self.client()
+        self.assertEqual(client._get_service_url('Service.a', 'dev'),
+                         self.url + '/dev')
+        self.assertEqual(client._get_service_url('Service.a', 'beta'),
+                         self.url + '/beta')
+        self.assertEqual(len(self.lookups()), 2)
+
+    def test_lookup_expires(self):
+        client = self.client(service_url_cache_ttl=0.2)
+        client.call_method('Service.a', [], 'dev')
+        client.call_method('Service.a', [], 'dev')
+        time.sleep(0.3)
+        client.call_method('Service.a', [], 'dev')
+        self.assertEqual(len(self.lookups()), 2)
+
+    def test_no_cache(self):
+        client = self.client(service_url_cache_ttl=0)
+        client.call_method('Service.a', [], 'dev')
+        client.call_method('Service.a', [], 'dev')
+        self.assertEqual(len(self.lookups()), 2)
+
+    def test_failed_call_forgets_url(self):
+        client = self.client()
+        self.server.answers['Service.a'] = [(503, 'unavailable'),
+                                            (200, {'version': '1.1',
+                                                   'result': ['ok']})]
+        self.assertRaises(baseclient._requests.exceptions.HTTPError,
+                          client.call_method, 'Service.a', [], 'dev')
+        self.assertEqual(client.call_method('Service.a', [], 'dev'), 'ok')
+        self.assertEqual(len(self.lookups()), 2)
+
+    def test_call_follows_moved_service(self):
+        gone, gone_url = start_stand_in()
+        gone.shutdown()
+        gone.server_close()
+        urls = [gone_url, self.url + '/moved']
+        self.server.answers['ServiceWizard.get_service_status'] = [
+            lambda req: (200, {'version': '1.1',
+                               'result': [{'url': urls.pop(0)}]})]
+        baseclient.call_stats.reset()
+        client = self.client()
+        self.assertEqual(client.call_method('Service.a', [], 'dev'),
+                         'Service.a')
+        self.assertEqual(baseclient.call_stats.snapshot()['Service.a']
+                         ['retries'], 1)
+
+    def test_concurrent_lookups_are_shared(self):
+        client = self.client()
+        urls = []
+        threads = [threading.Thread(target=lambda: urls.append(
+            client._get_service_url('Service.a', 'dev'))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(urls, [self.url + '/dev'] * 5)
+        self.assertEqual(len(self.lookups()), 1)
+
+    def test_failed_lookup_is_not_cached(self):
+        client = self.client()
+        self.server.answers['ServiceWizard.get_service_status'] = [
+            (503, 'unavailable'), self.service_status]
+        self.assertRaises(baseclient._requests.exceptions.HTTPError,
+                          client._get_service_url, 'Service.a', 'dev')
+        self.assertEqual(client._get_service_url('Service.a', 'dev'),
+                         self.url + '/dev')
+
+
+class ResponseCacheTest(unittest.TestCase):
+
+    REFS = [{'object_refs': ['1/2/3']}]
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server, cls.url = start_stand_in()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.server.requests[:] = []
+        self.server.answers.clear()
+        self.cache = baseclient.ResponseCache()
+
+    def client(self, token='token', url=None, **kwargs):
+        return BaseClient(url or self.url, token=token,
+                          response_cache=self.cache, **kwargs)
+
+    def test_hit(self):
+        self.server.answers['DataFileUtil.get_objects'] = [
+            (200, {'version': '1.1', 'result': [{'data': []}]})]
+        client = self.client()
+        first = client.call_method('DataFileUtil.get_objects', self.REFS)
+        first['data'].append('changed by the caller')
+        second = client.call_method('DataFileUtil.get_objects', self.REFS)
+        self.assertEqual(second, {'data': []})
+        self.assertEqual(len(self.server.requests), 1)
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    def test_miss(self):
+        client = self.client()
+        client.call_method('DataFileUtil.get_objects', self.REFS)
+        client.call_method('DataFileUtil.get_objects',
+                           [{'object_refs': ['1/2/4']}])
+        # the latest version of an object may change
+        client.call_method('DataFileUtil.get_objects',
+                           [{'object_refs': ['1/2']}])
+        client.call_method('DataFileUtil.get_objects',
+                           [{'object_refs': ['1/2']}])
+        client.call_method('DataFileUtil.save_objects', self.REFS)
+        client.call_method('DataFileUtil.save_objects', self.REFS)
+        self.assertEqual(len(self.server.requests), 6)
+
+    def test_ttl(self):
+        self.cache = baseclient.ResponseCache(ttl=0.1)
+        client = self.client()
+        client.call_method('DataFileUtil.get_objects', self.REFS)
+        time.sleep(0.2)
+        client.call_method('DataFileUtil.get_objects', self.REFS)
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(self.cache.stats()['expirations'], 1)
+
+    def test_lru_eviction(self):
+        self.cache = baseclient.ResponseCache(maxsize=2)
+        self.cache.put('a', 1)
+        self.cache.put('b', 2)
+        self.cache.get('a')
+        self.cache.put('c', 3)
+        self.assertEqual(self.cache.get('b'), (False, None))
+        self.assertEqual(self.cache.get('a'), (True, 1))
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+    def test_keys_isolate_tokens(self):
+        self.client('token1').call_method('DataFileUtil.get_objects',
+                                          self.REFS)
+        self.client('token2').call_method('DataFileUtil.get_objects',
+                                          self.REFS)
+        self.client('token1').call_method('DataFileUtil.get_objects',
+                                          self.REFS)
+        self.assertEqual(len(self.server.requests), 2)
+        for key in self.cache._entries:
+            self.assertNotIn('token1', key)
+
+    def test_keys_isolate_urls(self):
+        other, other_url = start_stand_in()
+        try:
+            self.client().call_method('DataFileUtil.get_objects', self.REFS)
+            self.client(url=other_url).call_method(
+                'DataFileUtil.get_objects', self.REFS)
+            self.assertEqual(len(self.server.requests), 1)
+            self.assertEqual(len(other.requests), 1)
+        finally:
+            other.shutdown()
+            other.server_close()
+
+    def test_status_is_cached_by_default(self):
+        client = self.client()
+        client.call_method('KBaseReport.status', [])
+        client.call_method('KBaseReport.status', [])
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_idempotent_methods_override(self):
+        client = self.client(
+            idempotent_methods={'DataFileUtil.versions': None})
+        for _ in range(2):
+            client.call_method('KBaseReport.status', [])
+            client.call_method('DataFileUtil.get_objects', self.REFS)
+            client.call_method('DataFileUtil.versions', [])
+        self.assertEqual(len(self.server.requests), 5)
+
+
+class CallStatsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server, self.url = start_stand_in()
+        baseclient.call_stats.reset()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        baseclient._GZIP_HOSTS.clear()
+
+    def test_calls_are_recorded(self):
+        client = BaseClient(self.url, token='token')
+        client.call_method('Service.a', [])
+        self.server.answers['Service.b'] = [(503, 'unavailable')]
+        self.assertRaises(baseclient._requests.exceptions.HTTPError,
+                          client.call_method, 'Service.b', [])
+        stats = baseclient.call_stats.snapshot()
+        self.assertEqual((stats['Service.a']['calls'],
+                          stats['Service.a']['errors']), (1, 0))
+        self.assertEqual((stats['Service.b']['calls'],
+                          stats['Service.b']['errors']), (1, 1))
+        self.assertEqual(stats['Service.a']['wall_time']['count'], 1)
+
+    def test_uncompressed_retry_is_counted(self):
+        baseclient._GZIP_HOSTS.add(('http', self.url[len('http://'):]))
+        client = BaseClient(self.url, token='token', compress_min_bytes=0)
+        self.assertEqual(client.call_method('Service.a', ['x' * 100]),
+                         'Service.a')
+        self.assertEqual(len(self.server.requests), 2)
+        stats = baseclient.call_stats.snapshot()['Service.a']
+        self.assertEqual((stats['calls'], stats['errors'],
+                          stats['retries']), (2, 1, 1))
+
+    def test_merge_and_format(self):
+        stats = baseclient.CallStats()
+        stats.record_call('Service.a', 0.5, 10, 20)
+        stats.record_retry('Service.a')
+        merged = baseclient.merge_call_stats([stats.snapshot(),
+                                              stats.snapshot()])
+        self.assertEqual((merged['Service.a']['calls'],
+                          merged['Service.a']['retries']), (2, 2))
+        self.assertEqual(merged['Service.a']['wall_time']['count'], 2)
+        table = baseclient.format_call_stats(merged).split('\n')
+        self.assertIn('retries', table[0])
+        self.assertEqual(table[1].split()[:4], ['Service.a', '2', '0', '2'])
+
+
+class CompressionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server, self.url = start_stand_in()
+        self.client = BaseClient(self.url, token='token',
+                                 compress_min_bytes=100)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        baseclient._GZIP_HOSTS.clear()
+
+    def call(self, size=100):
+        return self.client.call_method('Service.a', ['x' * size])
+
+    def test_gzip_is_used_once_the_server_takes_it(self):
+        self.server.accept_encoding = 'gzip, deflate'
+        self.assertEqual(self.call(), 'Service.a')
+        self.assertEqual(self.call(), 'Service.a')
+        self.call(size=10)
+        self.assertEqual(self.server.encodings, [None, 'gzip', None])
+
+    def test_gzip_refused_by_q_value(self):
+        self.server.accept_encoding = 'gzip;q=0, deflate'
+        self.call()
+        self.call()
+        self.assertEqual(self.server.encodings, [None, None])
+
+    def test_unsupported_media_type_drops_gzip(self):
+        self.server.accept_encoding = 'gzip'
+        self.call()
+        self.server.accept_encoding = None
+        # sent compressed, refused with a 415 and sent again uncompressed
+        self.assertEqual(self.call(), 'Service.a')
+        self.call()
+        self.assertEqual(self.server.encodings,
+                         [None, 'gzip', None, None])
+        self.assertEqual(baseclient._GZIP_HOSTS, set())
+
+    def test_accepts_gzip(self):
+        accepts = baseclient._accepts_gzip
+        self.assertTrue(accepts('gzip'))
+        self.assertTrue(accepts('deflate, GZIP;q=0.5'))
+        self.assertTrue(accepts('x-gzip'))
+        self.assertTrue(accepts('*'))
+        self.assertFalse(accepts(None))
+        self.assertFalse(accepts('deflate'))
+        self.assertFalse(accepts('gzip;q=0'))
+        self.assertFalse(accepts('gzip; q=0.000'))
+        self.assertFalse(accepts('gzip;q=0, *'))
+        self.assertFalse(accepts('gzip;q=x'))
+
+
+class LoginTokenTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server, self.url = start_stand_in()
+        self.logins = []
+        self._get_token = baseclient._get_token
+        self.ttl = baseclient._LOGIN_TOKEN_TTL_SEC
+        baseclient._get_token = self.login
+        with baseclient._AUTH_CACHE_LOCK:
+            baseclient._AUTH_CACHE.clear()
+        baseclient.call_stats.reset()
+
+    def tearDown(self):
+        baseclient._get_token = self._get_token
+        baseclient._LOGIN_TOKEN_TTL_SEC = self.ttl
+        self.server.shutdown()
+        self.server.server_close()
+
+    def login(self, user_id, password, auth_svc):
+        self.logins.append(user_id)
+        return 'token{}'.format(len(self.logins))
+
+    def client(self, **kwargs):
+        return BaseClient(self.url, user_id='user', password='secret',
+                          **kwargs)
+
+    def test_login_is_shared(self):
+        self.client().call_method('Service.a', [])
+        self.client().call_method('Service.a', [])
+        self.assertEqual(self.logins, ['user'])
+
+    def test_login_expires(self):
+        baseclient._LOGIN_TOKEN_TTL_SEC = 0.1
+        self.client().call_method('Service.a', [])
+        time.sleep(0.2)
+        self.client().call_method('Service.a', [])
+        self.assertEqual(self.logins, ['user', 'user'])
+
+    def test_rejected_login_token_is_renewed(self):
+        self.server.answers['Service.a'] = [
+            (401, 'token expired'),
+            (200, {'version': '1.1', 'result': ['ok']})]
+        client = self.client()
+        self.assertEqual(client.call_method('Service.a', []), 'ok')
+        self.assertEqual(client._headers['AUTHORIZATION'], 'token2')
+        self.assertEqual(len(self.logins), 2)
+        self.assertEqual(baseclient.call_stats.snapshot()['Service.a']
+                         ['retries'], 1)
+        # the renewed token is shared
+        self.client().call_method('Service.a', [])
+        self.assertEqual(len(self.logins), 2)
+
+    def test_renewed_once(self):
+        self.server.answers['Service.a'] = [(401, 'bad user')]
+        self.assertRaises(baseclient._requests.exceptions.HTTPError,
+                          self.client().call_method, 'Service.a', [])
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_given_token_is_not_renewed(self):
+        self.server.answers['Service.a'] = [(401, 'bad token')]
+        client = BaseClient(self.url, token='token')
+        self.assertRaises(baseclient._requests.exceptions.HTTPError,
+                          client.call_method, 'Service.a', [])
+        self.assertEqual(len(self.server.requests), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
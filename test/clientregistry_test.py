@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+import unittest
+
+from landContigFilter.clientregistry import ClientRegistry
+
+
+class _Client(object):
+
+    def __init__(self, url, token=None):
+        self.url = url
+        self.token = token
+
+
+class _OtherClient(_Client):
+    pass
+
+
+class ClientRegistryTest(unittest.TestCase):
+
+    def test_client_is_reused_per_token(self):
+        registry = ClientRegistry('http://callback')
+        client = registry.get(_Client, 'token1')
+        self.assertIs(registry.get(_Client, 'token1'), client)
+        self.assertEqual((client.url, client.token),
+                         ('http://callback', 'token1'))
+        other = registry.get(_Client, 'token2')
+        self.assertIsNot(other, client)
+        self.assertEqual(other.token, 'token2')
+        self.assertIsNot(registry.get(_Client), client)
+        self.assertIs(registry.get(_Client), registry.get(_Client, ''))
+        self.assertEqual(len(registry), 3)
+
+    def test_client_is_reused_per_class(self):
+        registry = ClientRegistry('http://callback')
+        client = registry.get(_Client, 'token1')
+        other = registry.get(_OtherClient, 'token1')
+        self.assertIsInstance(other, _OtherClient)
+        self.assertIsNot(other, client)
+
+    def test_registries_do_not_share_urls(self):
+        client = ClientRegistry('http://callback1').get(_Client, 'token1')
+        other = ClientRegistry('http://callback2').get(_Client, 'token1')
+        self.assertIsNot(other, client)
+        self.assertEqual(other.url, 'http://callback2')
+
+    def test_idle_clients_are_released(self):
+        registry = ClientRegistry('http://callback', idle_timeout=0.1)
+        idle = registry.get(_Client, 'token1')
+        used = registry.get(_Client, 'token2')
+        for _ in range(3):
+            time.sleep(0.05)
+            self.assertIs(registry.get(_Client, 'token2'), used)
+        self.assertEqual(len(registry), 1)
+        self.assertIsNot(registry.get(_Client, 'token1'), idle)
+
+    def test_concurrent_gets_share_one_client(self):
+        registry = ClientRegistry('http://callback')
+        clients = []
+        threads = [threading.Thread(
+            target=lambda: clients.append(registry.get(_Client, 'token1')))
+            for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(set(id(client) for client in clients)), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
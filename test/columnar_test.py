@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+from landContigFilter import columnar
+
+_ASSEMBLIES = [('1/2/3', {'data': {'contigs': {
+    'c1': {'contig_id': 'c1', 'length': 150, 'gc_content': 0.5,
+           'description': 'first\tcontig'},
+    'c2': {'contig_id': 'c2', 'length': 20}}}}),
+    ('1/3/1', {'data': {}})]
+
+
+class ColumnarTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.rows = columnar.contig_rows(_ASSEMBLIES)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_contig_rows(self):
+        self.assertEqual(sorted(row['contig_id'] for row in self.rows),
+                         ['c1', 'c2'])
+        self.assertEqual(set(row['assembly_ref'] for row in self.rows),
+                         set(['1/2/3']))
+
+    def test_contig_columns_round_trip(self):
+        path = os.path.join(self.directory, 'round_trip' + columnar.EXTENSION)
+        columnar.write_columns(path, self.rows)
+        columns = columnar.read_columns(path)
+
+        order = sorted(range(2), key=lambda i: columns['contig_id'][i])
+        self.assertEqual([columns['length'][i] for i in order], [150, 20])
+        self.assertEqual(columns['gc_content'][order[0]], 0.5)
+        self.assertEqual(columns['description'][order[0]], 'first\tcontig')
+        self.assertEqual(columns['description'][order[1]], '')
+
+    def test_empty_table(self):
+        path = os.path.join(self.directory, 'empty' + columnar.EXTENSION)
+        columnar.write_columns(path, [])
+        self.assertEqual(columnar.read_columns(path)['contig_id'], [])
+
+    def test_other_files_are_refused(self):
+        path = os.path.join(self.directory, 'other' + columnar.EXTENSION)
+        with open(path, 'wb') as f:
+            f.write(b'not a column file')
+        self.assertRaises(ValueError, columnar.read_columns, path)
+
+    def test_tsv(self):
+        path = os.path.join(self.directory, 'contigs.tsv')
+        columnar.write_tsv(path, self.rows)
+        with open(path, 'rb') as f:
+            lines = f.read().decode('utf-8').splitlines()
+        self.assertEqual(lines[0].split('\t'),
+                         [name for name, _ in columnar.CONTIG_COLUMNS])
+        self.assertIn('1/2/3\tc1\t150\t0.5\tfirst contig', lines[1:])
+        self.assertIn('1/2/3\tc2\t20\t\t', lines[1:])
+
+
+if __name__ == '__main__':
+    unittest.main()
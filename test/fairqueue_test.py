@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+import time
+import unittest
+
+from landContigFilter.fairqueue import FairQueue, parse_weights
+
+
+class FairQueueTest(unittest.TestCase):
+
+    def drain(self, queue):
+        items = []
+        while len(queue):
+            items.append(queue.get())
+        return items
+
+    def test_users_take_turns(self):
+        queue = FairQueue()
+        for i in range(3):
+            queue.put('user1', 'a{}'.format(i))
+        queue.put('user2', 'b0')
+        queue.put('user3', 'c0')
+        queue.put('user2', 'b1')
+        self.assertEqual([item for _, item in self.drain(queue)],
+                         ['a0', 'b0', 'c0', 'a1', 'b1', 'a2'])
+
+    def test_each_user_is_first_in_first_out(self):
+        queue = FairQueue()
+        for i in range(5):
+            queue.put('user1', i)
+        self.assertEqual(self.drain(queue), [('user1', i) for i in range(5)])
+
+    def test_weights(self):
+        queue = FairQueue({'user1': 2})
+        for i in range(4):
+            queue.put('user1', 'a{}'.format(i))
+            queue.put('user2', 'b{}'.format(i))
+        self.assertEqual([user for user, _ in self.drain(queue)[:6]],
+                         ['user1', 'user1', 'user2'] * 2)
+
+    def test_fractional_weights(self):
+        queue = FairQueue({'user2': 0.5})
+        for i in range(4):
+            queue.put('user1', i)
+            queue.put('user2', i)
+        self.assertEqual([user for user, _ in self.drain(queue)[:6]],
+                         ['user1', 'user1', 'user2'] * 2)
+
+    def test_new_user_is_served_before_a_long_queue_ends(self):
+        queue = FairQueue()
+        for i in range(10):
+            queue.put('user1', i)
+        queue.get()
+        queue.put('user2', 'b0')
+        self.assertEqual([queue.get()[0] for _ in range(2)],
+                         ['user1', 'user2'])
+
+    def test_invalid_weights(self):
+        self.assertRaises(ValueError, FairQueue, {'user1': 0})
+        self.assertRaises(ValueError, FairQueue, default_weight=-1)
+
+    def test_empty(self):
+        self.assertRaises(IndexError, FairQueue().get)
+
+    def test_remove(self):
+        queue = FairQueue()
+        item = object()
+        queue.put('user1', item)
+        queue.put('user2', 'b0')
+        self.assertTrue(queue.remove('user1', item))
+        self.assertFalse(queue.remove('user1', item))
+        self.assertEqual(self.drain(queue), [('user2', 'b0')])
+
+    def test_stats(self):
+        queue = FairQueue()
+        queue.put('user1', 'a0')
+        queue.put('user1', 'a1')
+        queue.put('user2', 'b0')
+        queue.get()
+        stats = queue.stats()
+        self.assertEqual((stats['depth'], stats['users'], stats['served']),
+                         (2, 2, 1))
+        self.assertGreater(stats['oldest_wait'], 0)
+        self.assertEqual(queue.user_stats()['user1']['depth'], 1)
+
+    def test_idle_users_are_forgotten(self):
+        queue = FairQueue(idle_after=0.1)
+        queue.put('user1', 'a0')
+        queue.put('user2', 'b0')
+        queue.put('user2', 'b1')
+        queue.get()
+        queue.get()
+        self.assertEqual(sorted(queue.user_stats()), ['user1', 'user2'])
+        time.sleep(0.2)
+        # user2 still has an item queued
+        self.assertEqual(sorted(queue.user_stats()), ['user2'])
+        queue.get()
+        time.sleep(0.2)
+        self.assertEqual(queue.user_stats(), {})
+        # the totals are kept
+        self.assertEqual(queue.stats()['served'], 3)
+
+
+class ParseWeightsTest(unittest.TestCase):
+
+    def test_parse(self):
+        self.assertEqual(parse_weights(' user1:2, user2:0.5 ,'),
+                         {'user1': 2, 'user2': 0.5})
+        self.assertEqual(parse_weights(None), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from landContigFilter import jobmanager
+from landContigFilter.jobmanager import (JobManager, JobNotFoundError,
+                                         JobsUnavailableError)
+
+# no process has this pid: pids are at most 2 ** 22 on Linux
+_DEAD_PID = 2 ** 22 + 1
+
+# held by a thread of the test process while a job takes it
+_LOCK = threading.Lock()
+
+
+def _run(request, token, user_id):
+    params = request['params']
+    if params and params[0] == 'exit':
+        os._exit(1)
+    if params and params[0] == 'sleep':
+        time.sleep(params[1])
+    if params and params[0] == 'fail':
+        raise ValueError('bad value')
+    if params and params[0] == 'lock':
+        with _LOCK:
+            pass
+    if params and params[0] == 'span':
+        started = time.time()
+        time.sleep(params[1])
+        return {'version': '1.1', 'id': request['id'],
+                'result': [started, time.time()]}
+    return {'version': '1.1', 'id': request['id'],
+            'result': [user_id, token]}
+
+
+class JobManagerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.directory, 'jobs.sqlite3')
+        self.managers = []
+
+    def tearDown(self):
+        for manager in self.managers:
+            manager.close()
+        shutil.rmtree(self.directory)
+
+    def manager(self, **kwargs):
+        kwargs.setdefault('heartbeat_interval', 0.1)
+        manager = JobManager(self.db_path, _run, max_workers=1, **kwargs)
+        self.managers.append(manager)
+        manager.start()
+        return manager
+
+    def wait(self, manager, job_id, user_id='user1', timeout=10):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            state = manager.check(job_id, user_id)
+            if state['finished']:
+                return state
+            time.sleep(0.05)
+        self.fail('job {} did not finish'.format(job_id))
+
+    def request(self, *params):
+        return {'version': '1.1', 'method': 'Service.run',
+                'params': list(params)}
+
+    def test_submit_and_check(self):
+        manager = self.manager()
+        job_id = manager.submit(self.request(), 'token1', 'user1')
+        state = self.wait(manager, job_id)
+        self.assertEqual(state['status'], jobmanager.COMPLETED)
+        self.assertEqual(state['result'], ['user1', 'token1'])
+        self.assertIsNone(state['error'])
+        self.assertEqual(state['method'], 'Service.run')
+        self.assertEqual(manager.stats()[0], 0)
+
+    def test_failed_job(self):
+        manager = self.manager()
+        state = self.wait(manager, manager.submit(self.request('fail'),
+                                                  user_id='user1'))
+        self.assertEqual(state['status'], jobmanager.ERROR)
+        self.assertEqual(state['error']['message'], 'bad value')
+
+    def test_other_users_jobs_are_not_found(self):
+        manager = self.manager()
+        job_id = manager.submit(self.request(), user_id='user1')
+        self.assertRaises(JobNotFoundError, manager.check, job_id, 'user2')
+        self.assertRaises(JobNotFoundError, manager.check, 'nope', 'user1')
+
+    def test_orphaned_job(self):
+        manager = self.manager()
+        manager._execute(
+            'INSERT INTO jobs (job_id, user_id, method, status, owner_pid, '
+            'submitted) VALUES (?, ?, ?, ?, ?, ?)',
+            ('orphan', 'user1', 'Service.run', jobmanager.RUNNING, _DEAD_PID,
+             time.time()))
+        state = manager.check('orphan', 'user1')
+        self.assertEqual(state['status'], jobmanager.ERROR)
+        self.assertIn('restart', state['error']['message'])
+
+    def test_orphans_are_failed_on_startup(self):
+        self.manager()._execute(
+            'INSERT INTO jobs (job_id, user_id, method, status, owner_pid, '
+            'submitted) VALUES (?, ?, ?, ?, ?, ?)',
+            ('orphan', 'user1', 'Service.run', jobmanager.QUEUED, _DEAD_PID,
+             time.time()))
+        manager = self.manager()
+        self.assertEqual(manager._execute(
+            'SELECT status FROM jobs WHERE job_id = ?', ('orphan',))[0][0],
+            jobmanager.ERROR)
+
+    def test_dead_worker_frees_its_slot(self):
+        manager = self.manager()
+        job_id = manager.submit(self.request('exit'), user_id='user1')
+        state = self.wait(manager, job_id)
+        self.assertEqual(state['status'], jobmanager.ERROR)
+        self.assertIn('worker', state['error']['message'])
+        # the next job gets the only worker slot
+        state = self.wait(manager, manager.submit(self.request(),
+                                                  user_id='user1'))
+        self.assertEqual(state['status'], jobmanager.COMPLETED)
+
+    def test_timeout(self):
+        manager = self.manager(timeout=0.5)
+        job_id = manager.submit(self.request('sleep', 30), user_id='user1')
+        state = self.wait(manager, job_id)
+        self.assertEqual(state['status'], jobmanager.ERROR)
+        self.assertIn('did not finish', state['error']['message'])
+        state = self.wait(manager, manager.submit(self.request(),
+                                                  user_id='user1'))
+        self.assertEqual(state['status'], jobmanager.COMPLETED)
+
+    def test_not_started(self):
+        manager = JobManager(self.db_path, _run)
+        self.assertRaises(JobsUnavailableError, manager.submit,
+                          self.request(), user_id='user1')
+
+    def test_processes_share_the_workers(self):
+        manager = self.manager()
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                os.write(write_fd, manager.submit(
+                    self.request('span', 0.5), user_id='user1').encode())
+            finally:
+                os._exit(0)
+        os.close(write_fd)
+        job_ids = [manager.submit(self.request('span', 0.5),
+                                  user_id='user1')]
+        os.waitpid(pid, 0)
+        with os.fdopen(read_fd, 'rb') as f:
+            job_ids.append(f.read().decode())
+        spans = sorted(self.wait(manager, job_id)['result']
+                       for job_id in job_ids)
+        # one worker for the service, not one per process
+        self.assertLessEqual(spans[0][1], spans[1][0])
+
+    def test_workers_do_not_inherit_held_locks(self):
+        manager = self.manager()
+        taken = threading.Event()
+        release = threading.Event()
+
+        def hold():
+            with _LOCK:
+                taken.set()
+                release.wait()
+        holder = threading.Thread(target=hold)
+        holder.start()
+        try:
+            taken.wait()
+            state = self.wait(manager, manager.submit(self.request('lock'),
+                                                      user_id='user1'))
+        finally:
+            release.set()
+            holder.join()
+        self.assertEqual(state['status'], jobmanager.COMPLETED)
+
+    def test_close_fails_unfinished_jobs(self):
+        manager = self.manager()
+        running = manager.submit(self.request('sleep', 30), user_id='user1')
+        queued = manager.submit(self.request(), user_id='user1')
+        manager.close()
+        for job_id in running, queued:
+            state = manager.check(job_id, 'user1')
+            self.assertEqual(state['status'], jobmanager.ERROR)
+            self.assertIn('restart', state['error']['message'])
+        self.assertRaises(JobsUnavailableError, manager.stats)
+
+    def test_old_job_files_are_migrated(self):
+        manager = JobManager.__new__(JobManager)
+        manager.db_path = self.db_path
+        manager._execute(
+            'CREATE TABLE jobs (job_id TEXT PRIMARY KEY, user_id TEXT, '
+            'method TEXT NOT NULL, status TEXT NOT NULL, owner_pid INTEGER '
+            'NOT NULL, submitted REAL NOT NULL, started REAL, finished REAL, '
+            'result TEXT, error TEXT)')
+        manager = self.manager()
+        columns = [row['name'] for row in
+                   manager._execute('PRAGMA table_info(jobs)')]
+        self.assertEqual(columns[-2:], ['worker_pid', 'heartbeat'])
+
+
+if __name__ == '__main__':
+    unittest.main()
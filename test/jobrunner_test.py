@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+import multiprocessing
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import unittest
+
+from landContigFilter import jobrunner
+from landContigFilter.jobrunner import JobLost, JobRunner, RunnerUnavailable
+
+
+def _run(input_file_path, output_file_path, token):
+    with open(input_file_path) as f:
+        command = f.read().split()
+    if command[0] == 'exit':
+        os._exit(1)
+    if command[0] == 'sleep':
+        time.sleep(float(command[1]))
+    print('ran {} with {}'.format(command[0], token))
+    with open(output_file_path, 'w') as f:
+        f.write('done')
+    return 0
+
+
+class JobRunnerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.directory, 'runner.sock')
+        self.runner = None
+
+    def tearDown(self):
+        if self.runner is not None:
+            self.runner.terminate()
+            self.runner.join()
+        shutil.rmtree(self.directory)
+
+    def start_runner(self, **kwargs):
+        runner = JobRunner(self.socket_path, _run, **kwargs)
+        self.runner = multiprocessing.Process(target=runner.serve_forever)
+        self.runner.start()
+        deadline = time.time() + 10
+        while not os.path.exists(self.socket_path):
+            self.assertLess(time.time(), deadline, 'the runner did not start')
+            time.sleep(0.01)
+
+    def submit(self, command, results=None):
+        input_path = tempfile.mktemp(dir=self.directory)
+        with open(input_path, 'w') as f:
+            f.write(command)
+        try:
+            result = jobrunner.submit(self.socket_path, input_path,
+                                      input_path + '.out', 'token1')
+        except Exception as e:
+            result = e
+        if results is None:
+            return result
+        results.append(result)
+
+    def submit_in_background(self, command, results):
+        thread = threading.Thread(target=self.submit,
+                                  args=(command, results))
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def test_job(self):
+        self.start_runner()
+        self.assertEqual(self.submit('echo'), (0, 'ran echo with token1\n'))
+
+    def test_other_environment_is_refused(self):
+        self.start_runner()
+        os.environ['SDK_CALLBACK_URL'] = 'http://other:1'
+        try:
+            result = self.submit('echo')
+        finally:
+            del os.environ['SDK_CALLBACK_URL']
+        self.assertIsInstance(result, RunnerUnavailable)
+
+    def test_no_runner(self):
+        self.assertIsInstance(self.submit('echo'), RunnerUnavailable)
+
+    def test_full_queue_is_refused(self):
+        self.start_runner(workers=1, max_waiting=1)
+        results = []
+        running = self.submit_in_background('sleep 1', results)
+        time.sleep(0.3)
+        waiting = self.submit_in_background('echo', results)
+        time.sleep(0.3)
+        result = self.submit('echo')
+        self.assertIsInstance(result, RunnerUnavailable)
+        self.assertIn('waiting', str(result))
+        running.join()
+        waiting.join()
+        self.assertEqual(sorted(code for code, _ in results), [0, 0])
+
+    def test_timeout(self):
+        self.start_runner(timeout=0.5)
+        exit_code, output = self.submit('sleep 30')
+        self.assertEqual(exit_code, 1)
+        self.assertIn('JobTimeout', output)
+        self.assertEqual(self.submit('echo')[0], 0)
+
+    def test_dead_worker(self):
+        grace = jobrunner._STOP_GRACE_SEC
+        jobrunner._STOP_GRACE_SEC = 0.5  # the runner process inherits it
+        try:
+            self.start_runner(workers=1, timeout=0.5)
+        finally:
+            jobrunner._STOP_GRACE_SEC = grace
+        exit_code, output = self.submit('exit')
+        self.assertEqual(exit_code, 1)
+        self.assertIn('lost the job', output)
+        self.assertEqual(self.submit('echo')[0], 0)
+
+    def test_messages_sent_together_are_read_apart(self):
+        runner, submitter = socket.socketpair()
+        try:
+            runner.sendall(b'{"started": true}\n{"exit_code": 0}\n')
+            runner.close()
+            self.assertEqual(jobrunner._read_message(submitter),
+                             {'started': True})
+            self.assertEqual(jobrunner._read_message(submitter),
+                             {'exit_code': 0})
+            self.assertIsNone(jobrunner._read_message(submitter))
+        finally:
+            submitter.close()
+
+    def test_started_job_is_lost_not_refused(self):
+        self.start_runner()
+        results = []
+        thread = self.submit_in_background('sleep 30', results)
+        time.sleep(0.5)
+        self.runner.terminate()
+        thread.join()
+        self.assertIsInstance(results[0], JobLost)
+
+
+if __name__ == '__main__':
+    unittest.main()
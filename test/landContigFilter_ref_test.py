@@ -140,3 +140,22 @@ class landContigFilterTest(unittest.TestCase):
 
         # Validate the returned data
         print  ret
+
+    def test_assembly_metadata_multiple_refs(self):
+
+        assembly_ref1 = self.get_fasta_file(self.test_path,
+                                            'TestAssembly4')
+        assembly_ref2 = self.get_fasta_file(self.test_path,
+                                            'TestAssembly5')
+
+        ret = self.getImpl().assembly_metadata_report(self.getContext(),
+                                            {'workspace_name': self.getWsName(),
+                                             'assembly_input_refs': [assembly_ref1,
+                                                                     assembly_ref2],
+                                             'showContigs': 0
+                                             })
+
+        self.assertIn('ref', ret[0])
+        self.assertIn('name', ret[0])
+        self.assertEqual([s['stage'] for s in ret[0]['timings']['stages']],
+                         ['validate', 'download', 'write', 'report'])
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+from landContigFilter import metrics
+
+
+def _registry():
+    registry = metrics.Registry()
+    calls = registry.counter('calls_total', 'Calls.', ('method',))
+    in_flight = registry.gauge('in_flight', 'Calls in progress.')
+    duration = registry.histogram('duration_seconds', 'Call time.', (),
+                                  (1, 2))
+    return registry, calls, in_flight, duration
+
+
+def _other_process(text, pid):
+    return text.replace('pid="{}"'.format(os.getpid()),
+                        'pid="{}"'.format(pid))
+
+
+class AggregateTest(unittest.TestCase):
+
+    def setUp(self):
+        registry, calls, in_flight, duration = _registry()
+        calls.inc('a')
+        calls.inc('b', amount=2)
+        in_flight.set(3)
+        duration.observe(1.5)
+        self.text = registry.render()
+
+    def samples(self, text):
+        return dict((name + metrics._format_labels(
+            [n for n, _ in labels], [v for _, v in labels]), value)
+            for family in metrics.parse(text)
+            for name, labels, value in family[3])
+
+    def test_parse(self):
+        families = metrics.parse(self.text)
+        self.assertEqual([(f[0], f[1]) for f in families],
+                         [('calls_total', 'counter'), ('in_flight', 'gauge'),
+                          ('duration_seconds', 'histogram')])
+        pid = str(os.getpid())
+        self.assertEqual(families[0][3][0],
+                         ('calls_total', (('pid', pid), ('method', 'a')), 1))
+        self.assertEqual(families[2][3][2][1][-1], ('le', '+Inf'))
+
+    def test_parse_escaped_labels(self):
+        families = metrics.parse('x{a="q\\"\\\\n\\n"} 1\n')
+        self.assertEqual(families[0][3][0][1], (('a', 'q"\\n\n'),))
+
+    def test_counters_and_histograms_are_summed(self):
+        merged = self.samples(metrics.aggregate(
+            [(self.text, True), (_other_process(self.text, 1), False)]))
+        self.assertEqual(merged['calls_total{method="a"}'], 2)
+        self.assertEqual(merged['calls_total{method="b"}'], 4)
+        self.assertEqual(merged['duration_seconds_bucket{le="2"}'], 2)
+        self.assertEqual(merged['duration_seconds_sum'], 3)
+        self.assertEqual(merged['duration_seconds_count'], 2)
+
+    def test_gauges_of_live_processes(self):
+        merged = self.samples(metrics.aggregate(
+            [(self.text, True), (_other_process(self.text, 1), True),
+             (_other_process(self.text, 2), False)]))
+        self.assertEqual(sorted(k for k in merged if 'in_flight' in k),
+                         ['in_flight{pid="1"}',
+                          'in_flight{{pid="{}"}}'.format(os.getpid())])
+
+    def test_rendered_text_parses(self):
+        merged = metrics.aggregate([(self.text, True)])
+        self.assertEqual(metrics.aggregate([(merged, True)]), merged)
+
+
+class ProcessFilesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.registry, self.calls, _, _ = _registry()
+        self.files = metrics.ProcessFiles(self.registry, self.directory,
+                                          interval=60)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def files_written(self):
+        # without the temporary file of a write in progress
+        return [name for name in os.listdir(self.directory)
+                if name.endswith('.prom')]
+
+    def write_other_process(self, pid):
+        path = os.path.join(self.directory, '{}-1.prom'.format(pid))
+        with open(path, 'w') as f:
+            f.write(_other_process(self.registry.render(), pid))
+        return path
+
+    def test_render_merges_processes(self):
+        self.calls.inc('a')
+        self.write_other_process(os.getppid())
+        self.calls.inc('a')
+        text = self.files.render()
+        self.assertIn('calls_total{method="a"} 3', text)
+        self.assertEqual(len(self.files_written()), 2)
+
+    def test_render_merges_extra_texts(self):
+        self.calls.inc('a')
+        text = self.files.render([_other_process(self.registry.render(),
+                                                 os.getppid())])
+        self.assertIn('calls_total{method="a"} 2', text)
+        self.assertEqual(len(self.files_written()), 1)
+
+    def test_one_file_per_process(self):
+        self.files.start()
+        self.files.start()
+        self.files.write()
+        self.assertEqual(self.files_written(),
+                         [os.path.basename(self.files._path)])
+
+    def test_remove_dead(self):
+        dead = self.write_other_process(2 ** 22 + 1)
+        live = self.write_other_process(os.getppid())
+        self.files.remove_dead()
+        self.assertFalse(os.path.exists(dead))
+        self.assertTrue(os.path.exists(live))
+
+
+if __name__ == '__main__':
+    unittest.main()
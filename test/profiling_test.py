@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from landContigFilter.profiling import RequestProfiler
+
+
+class _Context(dict):
+    '''
+    Collects the messages logged through a method context.
+    '''
+
+    def __init__(self):
+        dict.__init__(self, token='token')
+        self.info = []
+        self.errors = []
+
+    def log_info(self, message):
+        self.info.append(message)
+
+    def log_err(self, message):
+        self.errors.append(message)
+
+
+def _busy_call(seconds):
+    end = time.time() + seconds
+    while time.time() < end:
+        pass
+    return 'result'
+
+
+def _failing_call():
+    raise ValueError('failed')
+
+
+class RequestProfilerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.parent = tempfile.mkdtemp()
+        # created by the first profile
+        self.directory = os.path.join(self.parent, 'profiles')
+
+    def tearDown(self):
+        shutil.rmtree(self.parent)
+
+    def profiler(self, **kwargs):
+        return RequestProfiler(self.directory, **kwargs)
+
+    def saved(self):
+        return sorted(os.listdir(self.directory))
+
+    def test_mode_for(self):
+        profiler = self.profiler(methods=['Service.slow'], mode='sample')
+        self.assertEqual(profiler.mode_for('Service.slow', None), 'sample')
+        self.assertIsNone(profiler.mode_for('Service.fast', None))
+        # the context is ignored unless allowed
+        self.assertIsNone(profiler.mode_for('Service.fast',
+                                            {'profile': 'cprofile'}))
+        profiler = self.profiler(allow_context=True)
+        self.assertEqual(profiler.mode_for('Service.fast',
+                                           {'profile': 'sample'}), 'sample')
+        self.assertEqual(profiler.mode_for('Service.fast',
+                                           {'profile': True}), 'cprofile')
+        self.assertIsNone(profiler.mode_for('Service.fast',
+                                            {'profile': False}))
+        self.assertIsNone(profiler.mode_for('Service.fast', None))
+
+    def test_unknown_mode(self):
+        self.assertRaises(ValueError, self.profiler, mode='trace')
+
+    def test_cprofile(self):
+        ctx = _Context()
+        self.assertEqual(self.profiler().run('cprofile', ctx, 'Service.slow',
+                                             _busy_call, 0.01), 'result')
+        saved = self.saved()
+        self.assertEqual([os.path.splitext(name)[1] for name in saved],
+                         ['.prof', '.txt'])
+        self.assertTrue(saved[0].startswith('Service.slow.'))
+        with open(os.path.join(self.directory, saved[1])) as summary:
+            self.assertIn('_busy_call', summary.read())
+        self.assertEqual(len(ctx.info), 2)
+
+    def test_sample(self):
+        ctx = _Context()
+        profiler = self.profiler(sample_interval=0.001)
+        self.assertEqual(profiler.run('sample', ctx, 'Service.slow',
+                                      _busy_call, 0.1), 'result')
+        saved = self.saved()
+        self.assertEqual(len(saved), 1)
+        self.assertTrue(saved[0].endswith('.folded'))
+        with open(os.path.join(self.directory, saved[0])) as folded:
+            lines = folded.read().splitlines()
+        self.assertTrue(lines)
+        stack, count = lines[0].rsplit(' ', 1)
+        self.assertIn('_busy_call', stack)
+        self.assertGreater(int(count), 0)
+
+    def test_failed_call_is_saved(self):
+        for mode in ('cprofile', 'sample'):
+            self.assertRaises(ValueError, self.profiler().run, mode,
+                              _Context(), 'Service.fail', _failing_call)
+        self.assertEqual(len(self.saved()), 3)
+
+    def test_upload(self):
+        uploaded = []
+
+        def uploader(ctx, path):
+            uploaded.append(path)
+            if path.endswith('.txt'):
+                raise IOError('no space')
+            return 'node1'
+        ctx = _Context()
+        self.profiler(uploader=uploader).run('cprofile', ctx, 'Service.slow',
+                                             _busy_call, 0)
+        self.assertEqual(len(uploaded), 2)
+        self.assertTrue(any('node1' in message for message in ctx.info))
+        self.assertEqual(len(ctx.errors), 1)
+        self.assertIn('no space', ctx.errors[0])
+
+    def test_file_count_is_capped(self):
+        profiler = self.profiler(max_files=3)
+        for _ in range(3):
+            profiler.run('cprofile', _Context(), 'Service.slow',
+                         _busy_call, 0)
+            time.sleep(0.01)
+        saved = self.saved()
+        self.assertEqual(len(saved), 3)
+        # the newest profile is kept whole, then the newest other files
+        self.assertEqual(sorted(os.path.splitext(name)[1]
+                                for name in saved), ['.prof', '.txt', '.txt'])
+
+    def test_old_files_are_removed(self):
+        os.makedirs(self.directory)
+        old = os.path.join(self.directory, 'old.prof')
+        recent = os.path.join(self.directory, 'recent.prof')
+        for path in (old, recent):
+            open(path, 'w').close()
+        os.utime(old, (time.time() - 7200, time.time() - 7200))
+        self.profiler(max_age=3600).run('sample', _Context(), 'Service.slow',
+                                        _busy_call, 0)
+        saved = self.saved()
+        self.assertEqual(len(saved), 2)
+        self.assertIn('recent.prof', saved)
+
+    def test_no_limits(self):
+        os.makedirs(self.directory)
+        old = os.path.join(self.directory, 'old.prof')
+        open(old, 'w').close()
+        os.utime(old, (0, 0))
+        self.profiler(max_files=None, max_age=None).run(
+            'sample', _Context(), 'Service.slow', _busy_call, 0)
+        self.assertEqual(len(self.saved()), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+import unittest
+try:
+    import queue as _queue  # py3
+except ImportError:
+    import Queue as _queue  # py2
+
+from landContigFilter import landContigFilterServer
+from landContigFilter.admission import AdmissionController
+from landContigFilter.landContigFilterServer import (JSONRPCServiceCustom,
+                                                     MethodContext,
+                                                     ServerBusyError,
+                                                     get_admission)
+
+
+class ServerBusyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.started = threading.Semaphore(0)
+        self.release = threading.Event()
+
+    def tearDown(self):
+        self.release.set()
+
+    def service(self, **kwargs):
+        def slow(ctx, value):
+            self.started.release()
+            self.release.wait()
+            return value
+        service = JSONRPCServiceCustom(admission=AdmissionController(
+            {'Service.slow': 1}, **kwargs))
+        service.add(slow, name='Service.slow')
+        service.add(lambda ctx, value: 'ok', name='Service.status')
+        return service
+
+    def call(self, service, cli=False, batch=False, method='Service.slow'):
+        # WARNING: don't call any logging methods on the context object,
+        # it'll result in a NoneType error
+        ctx = MethodContext(None)
+        ctx['user_id'] = 'user1'
+        if cli:
+            ctx['CLI'] = 1
+        request = {'version': '1.1', 'id': '1', 'method': method,
+                   'params': ['a']}
+        return service.call_py(ctx, [request] if batch else request)
+
+    def start_slow_call(self, service, cli=False):
+        thread = threading.Thread(target=self.call, args=(service, cli))
+        thread.daemon = True
+        thread.start()
+        deadline = time.time() + 5
+        while not self.started.acquire(False):
+            self.assertLess(time.time(), deadline, 'the call did not start')
+            time.sleep(0.01)
+
+    def assert_busy(self, service, message):
+        with self.assertRaises(ServerBusyError) as raised:
+            self.call(service)
+        self.assertEqual(raised.exception.code, -32001)
+        self.assertIn(message, raised.exception.data)
+        error = self.call(service, batch=True)[0]['error']
+        self.assertEqual(error['code'], -32001)
+        self.assertEqual(error['name'], 'Server busy')
+        self.assertIn(message, error['message'])
+
+    def test_full_queue(self):
+        service = self.service(max_waiting=0)
+        self.start_slow_call(service)
+        self.assert_busy(service, 'waiting calls')
+
+    def test_timeout(self):
+        service = self.service(timeout=0.1)
+        self.start_slow_call(service)
+        self.assert_busy(service, 'Timed out')
+
+    def test_cli_calls_are_not_limited(self):
+        service = self.service(max_waiting=0)
+        self.start_slow_call(service)
+        self.start_slow_call(service, cli=True)
+
+    def test_cheap_calls_are_served_while_saturated(self):
+        # three server threads taking requests in order, as uwsgi's do
+        threads = 3
+        service = self.service(max_waiting=5, timeout=30,
+                               max_calls=threads - 1,
+                               cheap_methods=['Service.status'])
+        requests = _queue.Queue()
+        responses = _queue.Queue()
+
+        def serve():
+            while True:
+                method = requests.get()
+                try:
+                    responses.put((method, self.call(
+                        service, method=method)['result']))
+                except ServerBusyError:
+                    responses.put((method, 'busy'))
+        for _ in range(threads):
+            thread = threading.Thread(target=serve)
+            thread.daemon = True
+            thread.start()
+        for _ in range(5):
+            requests.put('Service.slow')
+        requests.put('Service.status')
+        answered = []
+        while ('Service.status', 'ok') not in answered:
+            answered.append(responses.get(timeout=5))
+        # one slow call runs and one waits; the others are turned away
+        self.assertEqual(answered.count(('Service.slow', 'busy')), 3)
+
+
+class GetAdmissionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.config = landContigFilterServer.config
+
+    def tearDown(self):
+        landContigFilterServer.config = self.config
+
+    def test_calls_are_capped_below_the_threads(self):
+        landContigFilterServer.config = {'max-concurrent-calls': '3',
+                                         'server-threads': '5'}
+        self.assertEqual(get_admission().max_calls, 4)
+
+    def test_limit_must_leave_a_free_thread(self):
+        landContigFilterServer.config = {'max-concurrent-calls': '5',
+                                         'server-threads': '5'}
+        self.assertRaisesRegexp(ValueError, 'server-threads', get_admission)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+import json
+import threading
+import time
+import unittest
+from io import BytesIO
+
+from landContigFilter.landContigFilterServer import (JSONRPCServiceCustom,
+                                                     MethodContext,
+                                                     application)
+
+
+def _echo(ctx, value):
+    return value
+
+
+def _fail(ctx, value):
+    raise ValueError('bad value: {}'.format(value))
+
+
+class BatchTest(unittest.TestCase):
+
+    def service(self, batch_max_workers=1):
+        service = JSONRPCServiceCustom(batch_max_workers=batch_max_workers)
+        service.add(_echo, name='Service.echo')
+        service.add(_fail, name='Service.fail')
+        return service
+
+    def call(self, service, batch):
+        # WARNING: don't call any logging methods on the context object,
+        # it'll result in a NoneType error
+        return service.call_py(MethodContext(None), batch)
+
+    def mixed_batch(self):
+        return [{'version': '1.1', 'id': '1', 'method': 'Service.echo',
+                 'params': ['a']},
+                {'version': '1.1', 'id': '2', 'method': 'Service.fail',
+                 'params': ['b']},
+                {'version': '1.1', 'id': '3', 'method': 'Service.missing',
+                 'params': []},
+                {'version': '1.1', 'id': '4', 'method': 'Service.echo',
+                 'params': ['c', 'd']},
+                {'version': '1.1', 'method': 'Service.fail', 'params': ['e']},
+                'not a request',
+                {'version': '1.1', 'id': '5', 'method': 'Service.echo',
+                 'params': ['f']}]
+
+    def check_mixed_batch(self, responds):
+        by_id = dict((r['id'], r) for r in responds)
+        # the failed notification gets no response
+        self.assertEqual(len(responds), 6)
+        self.assertEqual(by_id['1']['result'], 'a')
+        self.assertEqual(by_id['5']['result'], 'f')
+        error = by_id['2']['error']
+        self.assertEqual(error['code'], -32000)
+        self.assertEqual(error['name'], 'Server error')
+        self.assertEqual(error['message'], 'bad value: b')
+        self.assertIn('ValueError', error['error'])
+        self.assertEqual(by_id['2']['version'], '1.1')
+        self.assertEqual(by_id['3']['error']['code'], -32601)
+        self.assertEqual(by_id['4']['error']['code'], -32602)
+        self.assertEqual(by_id[None]['error']['code'], -32600)
+
+    def test_mixed_batch(self):
+        self.check_mixed_batch(self.call(self.service(), self.mixed_batch()))
+
+    def test_mixed_batch_in_parallel(self):
+        self.check_mixed_batch(self.call(self.service(4), self.mixed_batch()))
+
+    def test_responses_keep_request_order(self):
+        service = self.service(4)
+        batch = [{'version': '1.1', 'id': str(i), 'method': 'Service.echo',
+                  'params': [i]} for i in range(20)]
+        self.assertEqual([r['result'] for r in self.call(service, batch)],
+                         list(range(20)))
+
+    def test_pool_is_bounded_and_shared(self):
+        running = [0]
+        most = [0]
+        lock = threading.Lock()
+
+        def slow(ctx, value):
+            with lock:
+                running[0] += 1
+                most[0] = max(most[0], running[0])
+            time.sleep(0.05)
+            with lock:
+                running[0] -= 1
+            return value
+
+        service = JSONRPCServiceCustom(batch_max_workers=3)
+        service.add(slow, name='Service.slow')
+        batch = [{'version': '1.1', 'id': str(i), 'method': 'Service.slow',
+                  'params': [i]} for i in range(6)]
+        callers = [threading.Thread(target=self.call, args=(service, batch))
+                   for _ in range(3)]
+        for caller in callers:
+            caller.start()
+        for caller in callers:
+            caller.join()
+        self.assertEqual(most[0], 3)
+        self.assertIs(service._get_batch_pool(), service._get_batch_pool())
+
+
+class ApplicationBatchTest(unittest.TestCase):
+
+    status = {'version': '1.1', 'id': '1',
+              'method': 'landContigFilter.status', 'params': []}
+
+    def post(self, body):
+        data = json.dumps(body).encode('utf-8')
+        environ = {'REQUEST_METHOD': 'POST', 'CONTENT_LENGTH': str(len(data)),
+                   'wsgi.input': BytesIO(data), 'REMOTE_ADDR': '127.0.0.1'}
+        started = []
+
+        def start_response(status, headers):
+            started.append(status)
+        response = b''.join(application(environ, start_response))
+        return started[0], json.loads(response.decode('utf-8'))
+
+    def test_malformed_entries(self):
+        status, responds = self.post([1, {'id': '2'},
+                                      {'id': '3', 'method': 7}, self.status])
+        self.assertEqual(status, '200 OK')
+        self.assertEqual([r.get('error', {}).get('code') for r in responds],
+                         [-32600, -32600, -32600, None])
+        self.assertEqual([r['id'] for r in responds], [None, '2', '3', '1'])
+        self.assertEqual(responds[3]['result'][0]['state'], 'OK')
+
+    def test_batch_starting_with_a_notification(self):
+        notification = dict(self.status)
+        del notification['id']
+        status, responds = self.post([notification, self.status])
+        self.assertEqual(status, '200 OK')
+        self.assertEqual([r['id'] for r in responds], ['1'])
+
+    def test_malformed_requests(self):
+        for body in (5, [], {'id': '2'}):
+            status, respond = self.post(body)
+            self.assertEqual(status, '500 Internal Server Error')
+            self.assertEqual(respond['error']['code'], -32600)
+        self.assertEqual(respond['id'], '2')
+
+
+if __name__ == '__main__':
+    unittest.main()
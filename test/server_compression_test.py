@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+import gzip
+import json
+import unittest
+import zlib
+from io import BytesIO
+
+from landContigFilter.landContigFilterServer import (
+    UnsupportedEncodingError, accepts_gzip, application, decode_body,
+    gzip_body)
+
+
+def _gzip(data):
+    out = BytesIO()
+    with gzip.GzipFile(fileobj=out, mode='wb') as f:
+        f.write(data)
+    return out.getvalue()
+
+
+def _raw_deflate(data):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+class DecodeBodyTest(unittest.TestCase):
+
+    body = b'{"method": "a.b"}' * 100
+
+    def test_identity(self):
+        self.assertEqual(decode_body(self.body, None, 10), self.body)
+        self.assertEqual(decode_body(self.body, 'identity', 10), self.body)
+
+    def test_gzip(self):
+        for encoding in ('gzip', 'x-gzip', ' GZIP '):
+            self.assertEqual(decode_body(_gzip(self.body), encoding, 10000),
+                             self.body)
+
+    def test_deflate(self):
+        self.assertEqual(decode_body(zlib.compress(self.body), 'deflate',
+                                     10000), self.body)
+
+    def test_raw_deflate_fallback(self):
+        self.assertEqual(decode_body(_raw_deflate(self.body), 'deflate',
+                                     10000), self.body)
+
+    def test_decoded_size_limit(self):
+        limit = len(self.body) - 1
+        for data, encoding in ((_gzip(self.body), 'gzip'),
+                               (zlib.compress(self.body), 'deflate'),
+                               (_raw_deflate(self.body), 'deflate')):
+            self.assertRaisesRegexp(ValueError, 'exceeds', decode_body,
+                                    data, encoding, limit)
+        self.assertEqual(decode_body(_gzip(self.body), 'gzip',
+                                     len(self.body)), self.body)
+
+    def test_corrupt_body(self):
+        for encoding in ('gzip', 'deflate'):
+            self.assertRaisesRegexp(ValueError, 'Invalid', decode_body,
+                                    b'not compressed', encoding, 10000)
+
+    def test_unsupported_encoding(self):
+        self.assertRaises(UnsupportedEncodingError, decode_body,
+                          self.body, 'br', 10000)
+
+
+class AcceptsGzipTest(unittest.TestCase):
+
+    def test_q_values(self):
+        self.assertTrue(accepts_gzip('gzip'))
+        self.assertTrue(accepts_gzip('deflate, gzip;q=0.5'))
+        self.assertTrue(accepts_gzip('*;q=1'))
+        self.assertFalse(accepts_gzip(None))
+        self.assertFalse(accepts_gzip('deflate'))
+        self.assertFalse(accepts_gzip('gzip;q=0'))
+        self.assertFalse(accepts_gzip('gzip;q=0, *'))
+        self.assertFalse(accepts_gzip('gzip;q=bad'))
+
+    def test_gzip_body(self):
+        self.assertEqual(zlib.decompress(gzip_body(b'x' * 100),
+                                         16 + zlib.MAX_WBITS), b'x' * 100)
+
+
+class ApplicationEncodingTest(unittest.TestCase):
+
+    status = {'version': '1.1', 'id': '1',
+              'method': 'landContigFilter.status', 'params': []}
+
+    def post(self, data, **headers):
+        environ = {'REQUEST_METHOD': 'POST', 'CONTENT_LENGTH': str(len(data)),
+                   'wsgi.input': BytesIO(data), 'REMOTE_ADDR': '127.0.0.1'}
+        environ.update(headers)
+        started = []
+
+        def start_response(status, headers):
+            started.append((status, dict(headers)))
+        response = b''.join(application(environ, start_response))
+        return started[0][0], started[0][1], response
+
+    def test_gzip_request(self):
+        status, headers, response = self.post(
+            _gzip(json.dumps(self.status).encode('utf-8')),
+            HTTP_CONTENT_ENCODING='gzip')
+        self.assertEqual(status, '200 OK')
+        self.assertIn('gzip', headers['Accept-Encoding'])
+        self.assertEqual(json.loads(response)['id'], '1')
+
+    def test_unsupported_encoding(self):
+        status, headers, response = self.post(
+            json.dumps(self.status).encode('utf-8'),
+            HTTP_CONTENT_ENCODING='br')
+        self.assertEqual(status, '415 Unsupported Media Type')
+        self.assertEqual(json.loads(response)['error']['code'], -32700)
+
+    def test_gzip_response(self):
+        old_min_bytes = application.gzip_min_bytes
+        application.gzip_min_bytes = 0
+        try:
+            data = json.dumps(self.status).encode('utf-8')
+            _, headers, response = self.post(data,
+                                             HTTP_ACCEPT_ENCODING='gzip')
+            self.assertEqual(headers['Content-Encoding'], 'gzip')
+            self.assertEqual(json.loads(zlib.decompress(
+                response, 16 + zlib.MAX_WBITS))['id'], '1')
+            _, headers, response = self.post(
+                data, HTTP_ACCEPT_ENCODING='gzip;q=0')
+            self.assertNotIn('Content-Encoding', headers)
+            self.assertEqual(json.loads(response)['id'], '1')
+        finally:
+            application.gzip_min_bytes = old_min_bytes
+
+
+if __name__ == '__main__':
+    unittest.main()
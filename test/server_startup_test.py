@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from io import BytesIO
+
+from landContigFilter.jobmanager import JobManager
+from landContigFilter.landContigFilterServer import (STARTUP_TIMINGS,
+                                                     application,
+                                                     preload_modules,
+                                                     run_request,
+                                                     startup_metrics)
+
+
+class StartupTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        sys.path.insert(0, self.directory)
+        self.stdout = sys.stdout
+        sys.stdout = self.output = BytesIO()
+        self.job_manager = application.job_manager
+
+    def tearDown(self):
+        if application.job_manager is not self.job_manager:
+            application.job_manager.close()
+            application.job_manager = self.job_manager
+        sys.stdout = self.stdout
+        sys.path.remove(self.directory)
+        sys.modules.pop('broken_preload', None)
+        sys.modules.pop('good_preload', None)
+        shutil.rmtree(self.directory)
+
+    def module(self, name, source):
+        with open(os.path.join(self.directory, name + '.py'), 'w') as f:
+            f.write(source)
+
+    def test_preload_failures_are_logged(self):
+        self.module('broken_preload', "raise RuntimeError('no display')\n")
+        self.module('good_preload', 'VALUE = 1\n')
+        preload_modules('no_such_module, broken_preload, good_preload')
+        output = self.output.getvalue()
+        self.assertIn('Could not preload module no_such_module', output)
+        self.assertIn(
+            'Could not preload module broken_preload: no display', output)
+        # the modules after a failure are still preloaded
+        self.assertIn('good_preload', sys.modules)
+
+    def test_job_start_failures_are_logged(self):
+        application.job_manager = JobManager(
+            os.path.join(self.directory, 'jobs.sqlite3'), run_request)
+        application.start_jobs()
+        # a second start fails
+        application.start_jobs()
+        self.assertIn('Could not start the local jobs: The job process is '
+                      'already running', self.output.getvalue())
+
+    def test_startup_timings(self):
+        stages = [s['stage'] for s in STARTUP_TIMINGS['stages']]
+        self.assertEqual(stages[:4], ['imports', 'config', 'impl',
+                                      'application'])
+        lines = startup_metrics(('pid',), ('1',))
+        self.assertIn('landcontigfilter_startup_seconds{pid="1",'
+                      'stage="total"} ', '\n'.join(lines))
+
+
+if __name__ == '__main__':
+    unittest.main()
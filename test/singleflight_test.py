@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from landContigFilter.landContigFilterImpl import landContigFilter
+from landContigFilter.singleflight import SingleFlight
+from landContigFilter.stagetimer import StageTimer
+
+
+class _Call(object):
+    '''
+    A function that counts its runs and blocks until release is set.
+    '''
+
+    def __init__(self, result='result', error=None):
+        self.result = result
+        self.error = error
+        self.runs = 0
+        self.release = threading.Event()
+
+    def __call__(self):
+        self.runs += 1
+        self.release.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class SingleFlightTest(unittest.TestCase):
+
+    def setUp(self):
+        self.flight = SingleFlight()
+
+    def run_concurrently(self, key, fn, callers):
+        outcomes = []
+
+        def caller():
+            try:
+                outcomes.append(self.flight.do(key, fn))
+            except Exception as e:
+                outcomes.append(e)
+        threads = [threading.Thread(target=caller) for _ in range(callers)]
+        for thread in threads:
+            thread.start()
+        return threads, outcomes
+
+    def wait_for_waiters(self, count):
+        deadline = time.time() + 5
+        while self.flight.stats()[1] < count:
+            self.assertLess(time.time(), deadline, 'callers did not wait')
+            time.sleep(0.01)
+
+    def finish(self, fn, threads):
+        fn.release.set()
+        for thread in threads:
+            thread.join()
+
+    def test_concurrent_duplicates_share_one_run(self):
+        fn = _Call()
+        threads, outcomes = self.run_concurrently('key', fn, 5)
+        self.wait_for_waiters(4)
+        self.assertEqual(self.flight.stats(), (1, 4, 0))
+        self.finish(fn, threads)
+        self.assertEqual(fn.runs, 1)
+        self.assertEqual(sorted(outcomes),
+                         [('result', False)] + [('result', True)] * 4)
+        self.assertEqual(self.flight.stats(), (0, 0, 4))
+
+    def test_other_keys_do_not_share(self):
+        fn = _Call()
+        fn.release.set()
+        self.assertEqual(self.flight.do('key1', fn), ('result', False))
+        self.assertEqual(self.flight.do('key2', fn), ('result', False))
+        # nothing is kept once a call finishes
+        self.assertEqual(self.flight.do('key1', fn), ('result', False))
+        self.assertEqual(fn.runs, 3)
+
+    def test_leader_failure_reaches_the_waiters(self):
+        error = ValueError('no access')
+        fn = _Call(error=error)
+        threads, outcomes = self.run_concurrently('key', fn, 3)
+        self.wait_for_waiters(2)
+        self.finish(fn, threads)
+        self.assertEqual(fn.runs, 1)
+        self.assertEqual(outcomes, [error] * 3)
+        self.assertEqual(self.flight.stats(), (0, 0, 0))
+        # the failure is not kept either
+        fn.error = None
+        self.assertEqual(self.flight.do('key', fn), ('result', False))
+
+
+class SharedFilterAssemblyTest(unittest.TestCase):
+
+    def setUp(self):
+        os.environ.setdefault('SDK_CALLBACK_URL', 'http://localhost:1')
+        self.impl = landContigFilter({'scratch': tempfile.gettempdir()})
+        self.runs = []
+        self.release = threading.Event()
+
+        def filter_assembly(token, ref, workspace_name, keep, timer):
+            self.runs.append(token)
+            self.release.wait()
+            return 'new/' + token, 10, 5
+        self.impl.filter_assembly = filter_assembly
+
+    def call(self, user, token, results):
+        ctx = {'user_id': user, 'token': token}
+        results.append(self.impl.shared_filter_assembly(
+            ctx, ('filter_contigs', '1/2/3', 'ws', 100), '1/2/3', 'ws',
+            None, StageTimer()))
+
+    def run_calls(self, callers):
+        results = []
+        threads = [threading.Thread(target=self.call,
+                                    args=(user, token, results))
+                   for user, token in callers]
+        for thread in threads:
+            thread.start()
+        deadline = time.time() + 5
+        while sum(self.impl.in_flight.stats()[:2]) < len(callers):
+            self.assertLess(time.time(), deadline, 'calls did not start')
+            time.sleep(0.01)
+        self.release.set()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_calls_of_a_user_are_shared(self):
+        results = self.run_calls([('user1', 'token1'), ('user1', 'token2')])
+        self.assertEqual(len(self.runs), 1)
+        self.assertEqual(results, [('new/' + self.runs[0], 10, 5)] * 2)
+
+    def test_calls_of_other_users_are_not_shared(self):
+        results = self.run_calls([('user1', 'token1'), ('user2', 'token2')])
+        self.assertEqual(sorted(self.runs), ['token1', 'token2'])
+        self.assertEqual(sorted(results), [('new/token1', 10, 5),
+                                           ('new/token2', 10, 5)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+import time
+import unittest
+
+from landContigFilter.stagetimer import StageTimer, format_timings
+
+
+class StageTimerTest(unittest.TestCase):
+
+    def test_stages_in_order(self):
+        timer = StageTimer()
+        timer.start('validate')
+        time.sleep(0.02)
+        timer.start('download')
+        time.sleep(0.05)
+        timer.start('write')
+        timings = timer.stop()
+        self.assertEqual([s['stage'] for s in timings['stages']],
+                         ['validate', 'download', 'write'])
+        validate, download, write = [s['seconds']
+                                     for s in timings['stages']]
+        self.assertGreaterEqual(validate, 0.02)
+        self.assertGreaterEqual(download, 0.05)
+        self.assertLess(write, 0.02)
+
+    def test_total(self):
+        timer = StageTimer()
+        time.sleep(0.02)  # before the first stage
+        timer.start('filter')
+        time.sleep(0.02)
+        timings = timer.stop()
+        self.assertGreaterEqual(timings['total_seconds'], 0.04)
+        self.assertGreaterEqual(timings['total_seconds'],
+                                sum(s['seconds'] for s in timings['stages']))
+        self.assertGreater(timings['peak_rss_kb'], 0)
+
+    def test_repeated_stage_is_recorded_each_time(self):
+        timer = StageTimer()
+        timer.start('report')
+        timer.start('wait')
+        timer.start('report')
+        self.assertEqual([s['stage'] for s in timer.stop()['stages']],
+                         ['report', 'wait', 'report'])
+
+    def test_stop_without_stages(self):
+        self.assertEqual(StageTimer().stop()['stages'], [])
+
+    def test_format_timings(self):
+        line = format_timings({'stages': [{'stage': 'validate',
+                                           'seconds': 0.25},
+                                          {'stage': 'write', 'seconds': 1}],
+                               'total_seconds': 1.5, 'peak_rss_kb': 2048})
+        self.assertEqual(line, 'validate 0.250s, write 1.000s '
+                         '(total 1.500s, peak RSS 2048 kB)')
+
+
+if __name__ == '__main__':
+    unittest.main()